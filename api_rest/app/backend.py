@@ -0,0 +1,287 @@
+"""
+Backends para las búsquedas por clave exacta de la API.
+
+Los endpoints de catálogo con clave exacta (/cp/{cpos} completo, /{cpro}/{cmun},
+/cp/{cpro}/{cmun}/{cun}, /poblaciones/{cpro} y /jerarquia) y la búsqueda de
+calles por palabras se resuelven a través de un backend intercambiable. Por defecto se
+consulta DuckDB; con CALLEJERO_BACKEND=arrays se usan los arrays ordenados
+generados en build (ver lookup.py).
+
+El backend de DuckDB descarta antes de consultar las claves y las búsquedas de
+calles que los filtros de existencia (filters.py) indican que no tienen resultados.
+La búsqueda de calles usa el índice de palabras precalculado en build (tablas
+VIAS_CP, VIAS_UNIDAD y VIAS_TOKENS, ver scripts/parse_callejero.py): cada prefijo
+es un rango de palabras de la clave y las filas se intersecan en DuckDB. Con una
+base de datos sin esas tablas se recorren las vías del ámbito.
+"""
+
+import duckdb
+
+from . import config, database, tokens
+from .lookup import municipio_key, tinum, unidad_key
+from .refine import RefinementCache
+from .shards import cpro_from_cpos
+from .startup import profile
+
+
+# Ámbito de la búsqueda de calles -> tabla de vías del índice de palabras y columnas devueltas
+VIAS_TABLES = {
+    "cp": ("VIAS_CP", "cpos, cpro, cmun, cvia, nentsic, tvia, nviac"),
+    "unidad": ("VIAS_UNIDAD", "cpos, cpro, cmun, cvia, cun, nentsic, tvia, nviac"),
+}
+
+JERARQUIA_SQL = "SELECT payload FROM JERARQUIA WHERE ambito = ? AND clave = ?"
+
+# Búsqueda de calles sin índice de palabras: todas las vías del ámbito con sus
+# nombres de pseudovía, que se filtran en Python
+VIAS_SCAN_SQL = {
+    "cp": """
+        SELECT TRAM.cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var AS cvia, TRAM.nentsic,
+            VIAS.tvia, TRAM.nviac, list(DISTINCT PSEUDOVIAS.npsvia) AS pseudovias
+        FROM TRAM
+        INNER JOIN VIAS ON TRAM.cpro = VIAS.cpro AND TRAM.cmun = VIAS.cmun AND TRAM.cvia_var = VIAS.cvia_var
+        LEFT JOIN PSEUDOVIAS ON TRAM.cpro = PSEUDOVIAS.cpro AND TRAM.cmun = PSEUDOVIAS.cmun
+            AND TRAM.cvia_var = PSEUDOVIAS.cvia_var AND TRAM.cpos = PSEUDOVIAS.cpos
+            AND TRAM.cun_var = PSEUDOVIAS.cun_var
+        WHERE TRAM.cpos = ?
+        GROUP BY ALL
+        ORDER BY ALL
+    """,
+    "unidad": """
+        SELECT TRAM.cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var AS cvia, TRAM.cun_var AS cun,
+            TRAM.nentsic, VIAS.tvia, TRAM.nviac, list(DISTINCT PSEUDOVIAS.npsvia) AS pseudovias
+        FROM TRAM
+        INNER JOIN VIAS ON TRAM.cpro = VIAS.cpro AND TRAM.cmun = VIAS.cmun AND TRAM.cvia_var = VIAS.cvia_var
+        LEFT JOIN PSEUDOVIAS ON TRAM.cpro = PSEUDOVIAS.cpro AND TRAM.cmun = PSEUDOVIAS.cmun
+            AND TRAM.cvia_var = PSEUDOVIAS.cvia_var AND TRAM.cpos = PSEUDOVIAS.cpos
+            AND TRAM.cun_var = PSEUDOVIAS.cun_var
+        WHERE TRAM.cpro = ? AND TRAM.cmun = ? AND TRAM.cun_var = ?
+        GROUP BY ALL
+        ORDER BY ALL
+    """,
+}
+
+
+def search_query(ambito: str, clave: int, search: list[str]) -> tuple[str, list]:
+    """
+    Consulta del índice de palabras: filas de la clave con una palabra por cada
+    término de la búsqueda, en el orden de build.
+    """
+    table, columns = VIAS_TABLES[ambito]
+    postings = []
+    params = [clave]
+    for term in search:
+        # Un rango de palabras por cada prefijo del término (tokens.alternatives)
+        prefixes = tokens.alternatives(term)
+        ranges = " OR ".join("(palabra >= ? AND palabra < ?)" for _ in prefixes)
+        postings.append(
+            f"SELECT fila FROM VIAS_TOKENS WHERE ambito = ? AND clave = ? AND ({ranges})"
+        )
+        params += [ambito, clave]
+        for prefix in prefixes:
+            params += [prefix, prefix + "\U0010ffff"]
+    sql = f"""
+        SELECT {columns}, palabras FROM {table}
+        WHERE clave = ? AND fila IN ({" INTERSECT ".join(postings)})
+        ORDER BY fila
+    """
+    return sql, params
+
+
+class DuckDBBackend:
+    """Resuelve las búsquedas por clave exacta con consultas a DuckDB."""
+
+    name = "duckdb"
+
+    def __init__(self, filters=None):
+        self.refinements = RefinementCache(config.REFINE_CACHE)
+        self.filters = filters
+        # Si la base de datos tiene el índice de palabras; None hasta la primera búsqueda
+        self.indexed: bool | None = None
+
+    def poblaciones_by_cpro(self, cpro: int) -> list[dict]:
+        # TODO Eliminar el nucleo de poblacion directamente de la fuente de datos
+        return database.query(
+            """
+            SELECT cmun, FLOOR(cun_var / 1000) AS cun, NENTSIC
+            FROM TRAM
+            WHERE cpro = ?
+            GROUP BY cmun, FLOOR(cun_var / 1000), NENTSIC
+            ORDER BY cmun, cun
+        """,
+            [cpro],
+            cpro=cpro,
+        )
+
+    def poblaciones_by_cp(self, cpos: int) -> list[dict]:
+        if self.filters is not None and not self.filters.has_cp(cpos):
+            return []
+        return database.query(
+            """
+            SELECT cpos, cpro, cmun, FLOOR(cun_var / 1000) as cun, NENTSIC
+            FROM TRAM
+            WHERE cpos = ?  GROUP BY cpos, cpro, cmun, FLOOR(cun_var / 1000), NENTSIC
+        """,
+            [cpos],
+            cpro=cpro_from_cpos(cpos),
+        )
+
+    def localidades_by_cpro_cmun(self, cpro: int, cmun: int) -> list[dict]:
+        if self.filters is not None and not self.filters.has_municipio(cpro, cmun):
+            return []
+        return database.query(
+            """
+            SELECT cpos, cpro, cmun,  NENTSIC
+            FROM TRAM
+            WHERE cpro = ? AND cmun = ?
+            GROUP BY cpos, cpro, cmun,  NENTSIC
+        """,
+            [cpro, cmun],
+            cpro=cpro,
+        )
+
+    def cp_by_cun(self, cpro: int, cmun: int, cun: int) -> list[dict]:
+        if self.filters is not None and not self.filters.has_unidad(cpro, cmun, cun):
+            return []
+        return database.query(
+            """
+            SELECT cpos, cpro, cmun, cun_var, NENTSIC
+            FROM TRAM
+            WHERE cpro = ? AND cmun = ? AND cun_var = ?
+            GROUP BY cpos, cpro, cmun, cun_var, NENTSIC
+        """,
+            [cpro, cmun, cun],
+            cpro=cpro,
+        )
+
+    def tramo_by_numero(self, cpro: int, cmun: int, cvia: int, numero: int) -> list[dict]:
+        # Búsqueda por rango sobre las filas de la vía; el índice de intervalos
+        # solo existe en el backend de arrays (ver lookup.IntervalIndex)
+        return database.query(
+            """
+            SELECT cpos, cpro, cmun, cvia_var AS cvia, cun_var AS cun, nentsic,
+                dist_var AS dist, secc_var AS secc, tinum_var AS tinum,
+                ein_var AS ein, cein_var AS cein, esn_var AS esn, cesn_var AS cesn
+            FROM NUMEROS
+            WHERE cpro = ? AND cmun = ? AND cvia_var = ? AND tinum_var = ?
+                AND ? BETWEEN ein_var AND esn_var
+            ORDER BY ein_var, esn_var, cpos, cun_var, dist_var, secc_var
+        """,
+            [cpro, cmun, cvia, tinum(numero), numero],
+            cpro=cpro,
+        )
+
+    def _jerarquia(self, ambito: str, clave: int, cpro: int) -> str | None:
+        rows = database.query(JERARQUIA_SQL, [ambito, clave], cpro=cpro)
+        return rows[0]["payload"] if rows else None
+
+    def jerarquia_by_cp(self, cpos: int) -> str | None:
+        if self.filters is not None and not self.filters.has_cp(cpos):
+            return None
+        return self._jerarquia("cp", cpos, cpro_from_cpos(cpos))
+
+    def jerarquia_by_municipio(self, cpro: int, cmun: int) -> str | None:
+        if self.filters is not None and not self.filters.has_municipio(cpro, cmun):
+            return None
+        return self._jerarquia("municipio", municipio_key(cpro, cmun), cpro)
+
+    def _search(self, ambito: str, clave: int, search: list[str], cpro: int) -> list[dict]:
+        sql, params = search_query(ambito, clave, search)
+        return database.query(sql, params, cpro=cpro)
+
+    def _fetch(self, ambito: str, clave: int, search: list[str], cpro: int, scan) -> list[dict]:
+        if self.indexed is not False:
+            try:
+                items = self._search(ambito, clave, search, cpro)
+                self.indexed = True
+                return items
+            except duckdb.CatalogException:
+                if self.indexed:
+                    raise
+                self.indexed = False
+                print("[WARN] Base de datos sin índice de palabras (VIAS_TOKENS), se recorren las vías")
+        return scan()
+
+    def _words(self, items: list[dict]) -> list[tuple[dict, set[str]]]:
+        # Los nombres de pseudovía cuentan para la búsqueda pero no se devuelven.
+        # Las filas pueden estar compartidas con otras peticiones (coalesce.py),
+        # por lo que no se modifican
+        words = {}
+        rows = []
+        for item in items:
+            if "palabras" in item:
+                # Palabras precalculadas por el índice
+                rows.append(
+                    ({k: v for k, v in item.items() if k != "palabras"}, set(item["palabras"].split()))
+                )
+                continue
+            key = (item["tvia"], item["nviac"], *sorted(filter(None, item["pseudovias"] or [])))
+            if key not in words:
+                words[key] = tokens.tokens(*key)
+            rows.append(({k: v for k, v in item.items() if k != "pseudovias"}, words[key]))
+        return rows
+
+    def _vias(self, scope: tuple, texto: str, fetch) -> list[dict]:
+        # Las vías se buscan con la misma normalización que el índice de
+        # palabras del backend de arrays. Si la búsqueda refina otra reciente
+        # del mismo ámbito se filtran sus filas sin consultar DuckDB
+        search = tokens.terms(texto)
+        if not search:
+            return []
+        if self.filters is not None and not self.filters.may_match(scope, search):
+            return []
+        rows = self.refinements.get(scope, search) if config.REFINE_CACHE else None
+        if rows is None:
+            rows = self._words(fetch(search))
+        rows = [(item, words) for item, words in rows if tokens.matches(search, words)]
+        if config.REFINE_CACHE:
+            self.refinements.put(scope, search, rows)
+        return [item for item, _ in rows]
+
+    def vias_by_cpos(self, cpos: int, texto: str) -> list[dict]:
+        def scan():
+            return database.query(VIAS_SCAN_SQL["cp"], [cpos], cpro=cpro_from_cpos(cpos))
+
+        def fetch(search):
+            return self._fetch("cp", cpos, search, cpro_from_cpos(cpos), scan)
+
+        return self._vias(("cp", cpos), texto, fetch)
+
+    def vias_by_cun(self, cpro: int, cmun: int, cun: int, texto: str) -> list[dict]:
+        def scan():
+            return database.query(VIAS_SCAN_SQL["unidad"], [cpro, cmun, cun], cpro=cpro)
+
+        def fetch(search):
+            return self._fetch("unidad", unidad_key(cpro, cmun, cun), search, cpro, scan)
+
+        return self._vias(("unidad", cpro, cmun, cun), texto, fetch)
+
+
+_backend = None
+
+
+def create_backend(name: str, lookup_path: str | None = None, filters=None):
+    if name == "duckdb":
+        return DuckDBBackend(filters)
+    if name == "arrays":
+        from .lookup import ArrayBackend
+
+        with profile.phase("lookup_load"):
+            return ArrayBackend(lookup_path or config.LOOKUP_PATH)
+    raise ValueError(f"Backend desconocido: {name}")
+
+
+def get_backend():
+    """
+    Devuelve el backend del dataset de la petición en curso. Cada versión del
+    callejero tiene su propio backend, creado al abrirla.
+    """
+    if _backend is not None:
+        return _backend
+    return database.current().backend
+
+
+def set_backend(backend):
+    """Fija un backend para todas las peticiones (tests y benchmarks), None lo quita."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,83 @@
+"""
+Comunidades autónomas y provincias, con los códigos del INE.
+
+Sin dependencias, para que el parseo del callejero pueda usarlas al
+precalcular la jerarquía de cada código postal y municipio.
+"""
+
+dict_auto = {
+    "01": "ANDALUCÍA",
+    "02": "ARAGÓN",
+    "03": "ASTURIAS",
+    "04": "BALEARES",
+    "05": "CANARIAS",
+    "06": "CANTABRIA",
+    "07": "CASTILLA Y LEÓN",
+    "08": "CASTILLA-LA MANCHA",
+    "09": "CATALUÑA",
+    "10": "COMUNITAT VALENCIANA",
+    "11": "EXTREMADURA",
+    "12": "GALICIA",
+    "13": "MADRID",
+    "14": "MURCIA",
+    "15": "NAVARRA",
+    "16": "PAÍS VASCO",
+    "17": "LA RIOJA",
+    "18": "CEUTA",
+    "19": "MELILLA",
+}
+
+dict_provincia = {
+    "01": {"PRO": "ÁLAVA", "CCOM": "16"},
+    "02": {"PRO": "ALBACETE", "CCOM": "08"},
+    "03": {"PRO": "ALICANTE/ALACANT", "CCOM": "10"},
+    "04": {"PRO": "ALMERÍA", "CCOM": "01"},
+    "05": {"PRO": "ÁVILA", "CCOM": "07"},
+    "06": {"PRO": "BADAJOZ", "CCOM": "11"},
+    "07": {"PRO": "ILLES BALEARS", "CCOM": "04"},
+    "08": {"PRO": "BARCELONA", "CCOM": "09"},
+    "09": {"PRO": "BURGOS", "CCOM": "07"},
+    "10": {"PRO": "CÁCERES", "CCOM": "11"},
+    "11": {"PRO": "CÁDIZ", "CCOM": "01"},
+    "12": {"PRO": "CASTELLÓN/CASTELLÓ", "CCOM": "10"},
+    "13": {"PRO": "CIUDAD REAL", "CCOM": "08"},
+    "14": {"PRO": "CÓRDOBA", "CCOM": "01"},
+    "15": {"PRO": "A CORUÑA", "CCOM": "12"},
+    "16": {"PRO": "CUENCA", "CCOM": "08"},
+    "17": {"PRO": "GIRONA", "CCOM": "09"},
+    "18": {"PRO": "GRANADA", "CCOM": "01"},
+    "19": {"PRO": "GUADALAJARA", "CCOM": "08"},
+    "20": {"PRO": "GIPUZKOA", "CCOM": "16"},
+    "21": {"PRO": "HUELVA", "CCOM": "01"},
+    "22": {"PRO": "HUESCA", "CCOM": "02"},
+    "23": {"PRO": "JAÉN", "CCOM": "01"},
+    "24": {"PRO": "LEÓN", "CCOM": "07"},
+    "25": {"PRO": "LLEIDA", "CCOM": "09"},
+    "26": {"PRO": "LA RIOJA", "CCOM": "17"},
+    "27": {"PRO": "LUGO", "CCOM": "12"},
+    "28": {"PRO": "MADRID", "CCOM": "13"},
+    "29": {"PRO": "MÁLAGA", "CCOM": "01"},
+    "30": {"PRO": "MURCIA", "CCOM": "14"},
+    "31": {"PRO": "NAVARRA", "CCOM": "15"},
+    "32": {"PRO": "OURENSE", "CCOM": "12"},
+    "33": {"PRO": "ASTURIAS", "CCOM": "03"},
+    "34": {"PRO": "PALENCIA", "CCOM": "07"},
+    "35": {"PRO": "LAS PALMAS", "CCOM": "05"},
+    "36": {"PRO": "PONTEVEDRA", "CCOM": "12"},
+    "37": {"PRO": "SALAMANCA", "CCOM": "07"},
+    "38": {"PRO": "SANTA CRUZ DE TENERIFE", "CCOM": "05"},
+    "39": {"PRO": "CANTABRIA", "CCOM": "06"},
+    "40": {"PRO": "SEGOVIA", "CCOM": "07"},
+    "41": {"PRO": "SEVILLA", "CCOM": "01"},
+    "42": {"PRO": "SORIA", "CCOM": "07"},
+    "43": {"PRO": "TARRAGONA", "CCOM": "09"},
+    "44": {"PRO": "TERUEL", "CCOM": "02"},
+    "45": {"PRO": "TOLEDO", "CCOM": "08"},
+    "46": {"PRO": "VALENCIA/VALÈNCIA", "CCOM": "10"},
+    "47": {"PRO": "VALLADOLID", "CCOM": "07"},
+    "48": {"PRO": "BIZKAIA", "CCOM": "16"},
+    "49": {"PRO": "ZAMORA", "CCOM": "07"},
+    "50": {"PRO": "ZARAGOZA", "CCOM": "02"},
+    "51": {"PRO": "CEUTA", "CCOM": "18"},
+    "52": {"PRO": "MELILLA", "CCOM": "19"},
+}
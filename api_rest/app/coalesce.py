@@ -0,0 +1,73 @@
+"""
+Agrupación de consultas idénticas concurrentes (single-flight).
+
+Cuando el buscador de calles lanza una petición por cada tecla, o tras un
+despliegue llega una oleada de fallos de la caché de CloudFront, muchas
+peticiones ejecutan a la vez la misma consulta sobre la misma conexión. Con
+CALLEJERO_COALESCE la primera consulta de cada clave se ejecuta y las que llegan
+mientras está en curso esperan y comparten su resultado (o su excepción).
+
+El resultado se comparte entre peticiones, por lo que no debe modificarse.
+"""
+
+import re
+import threading
+
+from . import metrics
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(sql: str) -> str:
+    """SQL sin diferencias de espacios ni saltos de línea."""
+    return _SPACES.sub(" ", sql).strip()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Ejecuta una sola vez las llamadas concurrentes con la misma clave."""
+
+    def __init__(self):
+        self._calls: dict[tuple, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: tuple, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            metrics.COALESCED.inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            # Las consultas que lleguen a partir de aquí vuelven a ejecutarse
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,257 @@
+"""
+Compresión de las respuestas con negociación de Accept-Encoding.
+
+Las respuestas del catálogo y de las búsquedas parciales son JSON muy repetitivo
+que se reduce unas diez veces al comprimirlo. El middleware comprime con brotli
+(si el paquete está instalado) o gzip las respuestas de al menos
+CALLEJERO_COMPRESS_MIN_BYTES, en un hilo aparte para no bloquear el bucle de
+eventos. Con CALLEJERO_COMPRESS_CACHE las respuestas 200 de las peticiones GET
+se guardan ya comprimidas en una caché LRU indexada por la codificación, la
+ruta, la query string y la versión del callejero: una petición repetida se
+responde desde la caché sin ejecutar el endpoint ni volver a comprimir. Al
+cambiar la versión del callejero cambia la clave y las entradas antiguas salen
+de la caché por LRU. La caché responde sin pasar por la admisión ni la
+agrupación de consultas (database.py), por lo que está desactivada por defecto.
+
+Todas las respuestas de un tipo comprimible llevan `Vary: Accept-Encoding`,
+también las que se envían sin comprimir, para que una caché compartida no
+sirva una variante a un cliente que espera otra.
+
+Las métricas de /metrics indican el tiempo de CPU dedicado a comprimir y los
+bytes ahorrados por codificación.
+"""
+
+import gzip
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import anyio.to_thread
+
+from . import metrics, slowlog
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Tipos de contenido que merece la pena comprimir
+COMPRESSIBLE = (b"application/json", b"text/")
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _timed_compress(body: bytes, encoding: str) -> tuple[bytes, float]:
+    # Se mide en el hilo que comprime
+    start = time.thread_time()
+    compressed = compress(body, encoding)
+    return compressed, time.thread_time() - start
+
+
+def available() -> tuple[str, ...]:
+    """Codificaciones soportadas, por orden de preferencia."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """Codificación preferida de las que acepta el cliente, o None."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in available():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressedCache:
+    """Caché LRU de respuestas comprimidas por (codificación, ruta, query string, versión)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: tuple):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime las respuestas completas según Accept-Encoding.
+
+    `version` devuelve la versión de los datos, que forma parte de la clave de
+    la caché; si devuelve None (datos aún sin abrir) no se usa la caché. Se
+    llama en el bucle de eventos, por lo que no debe bloquear ni abrir la base
+    de datos. Las respuestas de las rutas de `uncached` (estado, métricas)
+    cambian sin que cambie la versión y no se guardan.
+    """
+
+    def __init__(
+        self,
+        app,
+        min_bytes: int = 1024,
+        cache_entries: int = 512,
+        version: Callable[[], str] | None = None,
+        uncached: tuple[str, ...] = (),
+    ):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.cache = CompressedCache(cache_entries)
+        self.version = version
+        self.uncached = uncached
+
+    @staticmethod
+    def _route_path(scope) -> str:
+        # Ruta sin el prefijo de la aplicación (/api), como la de sus endpoints
+        path, root = scope["path"], scope.get("root_path", "")
+        return path[len(root):] if root and path.startswith(root) else path
+
+    def _cache_key(self, scope, headers: dict, encoding: str | None) -> tuple | None:
+        if encoding is None or self.cache.max_entries <= 0 or scope["method"] != "GET":
+            return None
+        if self._route_path(scope) in self.uncached:
+            return None
+        # El perfil por cabecera necesita ejecutar las consultas
+        if headers.get(slowlog.HEADER.encode(), b"").strip() not in (b"", b"0"):
+            return None
+        if self.version is None:
+            version = None
+        else:
+            version = self.version()
+            if version is None:
+                return None
+        return (encoding, scope["path"], scope.get("query_string", b""), version)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        encoding = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        key = self._cache_key(scope, headers, encoding)
+        if key is not None:
+            cached = self.cache.get(key)
+            metrics.record_cache("compresion", cached is not None)
+            if cached is not None:
+                start_message, compressed, saved, route = cached
+                if route is not None:
+                    # Para que las métricas atribuyan la petición a su ruta
+                    scope["route"] = route
+                metrics.COMPRESS_SAVED_BYTES.inc(encoding, amount=saved)
+                # Copia: los middlewares exteriores modifican el mensaje que reciben
+                await send({**start_message, "headers": list(start_message["headers"])})
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                # Se retiene hasta conocer el cuerpo
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            passthrough = True
+            body = message.get("body", b"")
+            varies = self._varies(start_message)
+            if varies:
+                start_message = {**start_message, "headers": self._with_vary(start_message)}
+            if (
+                encoding is None
+                or not varies
+                or message.get("more_body", False)
+                or not self._compressible(start_message, body)
+            ):
+                # Respuestas en streaming o que no compensa comprimir
+                await send(start_message)
+                return await send(message)
+
+            compressed, cpu = await anyio.to_thread.run_sync(_timed_compress, body, encoding)
+            metrics.COMPRESS_SECONDS.inc(encoding, amount=cpu)
+            saved = len(body) - len(compressed)
+            metrics.COMPRESS_SAVED_BYTES.inc(encoding, amount=saved)
+            response_headers = [
+                (k, v) for k, v in start_message["headers"] if k.lower() != b"content-length"
+            ]
+            response_headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+            ]
+            start_message = {**start_message, "headers": response_headers}
+            # Si la versión ha cambiado durante la petición la respuesta puede ser
+            # de cualquiera de las dos y no se guarda
+            if (
+                key is not None
+                and start_message["status"] == 200
+                and (self.version is None or self.version() == key[-1])
+            ):
+                self.cache.put(key, ({**start_message}, compressed, saved, scope.get("route")))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _varies(start_message) -> bool:
+        """Indica si el tipo de contenido se comprime, y por tanto depende de Accept-Encoding."""
+        response_headers = dict((k.lower(), v) for k, v in start_message.get("headers", []))
+        if b"content-encoding" in response_headers:
+            return False
+        return response_headers.get(b"content-type", b"").startswith(COMPRESSIBLE)
+
+    @staticmethod
+    def _with_vary(start_message) -> list:
+        response_headers = []
+        vary = b""
+        for k, v in start_message.get("headers", []):
+            if k.lower() == b"vary":
+                vary = v
+            else:
+                response_headers.append((k, v))
+        if b"accept-encoding" not in vary.lower():
+            vary = vary + b", Accept-Encoding" if vary else b"Accept-Encoding"
+        return response_headers + [(b"vary", vary)]
+
+    def _compressible(self, start_message, body: bytes) -> bool:
+        return len(body) >= self.min_bytes and start_message["status"] not in (204, 304)
@@ -0,0 +1,128 @@
+"""
+Configuración de la API leída de variables de entorno.
+
+Todas las variables usan el prefijo CALLEJERO_ para no colisionar con las del
+adaptador de Lambda (AWS_LWA_*) ni con las de uvicorn.
+"""
+
+import os
+
+
+def env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name, "").strip()
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name, "").strip()
+    return float(value) if value else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "true", "yes", "si", "on")
+
+
+# Ruta del fichero DuckDB de solo lectura
+DB_PATH = env_str("CALLEJERO_DB", "callejero.duckdb")
+
+# Si está activo, al arrancar se abre la base de datos y se ejecutan las consultas
+# más habituales en segundo plano antes de declarar la API como lista
+WARMUP = env_bool("CALLEJERO_WARMUP", False)
+
+# Fichero de rutas calientes (scripts/hotkeys_callejero.py) que se atienden al
+# arrancar, antes de declarar la API como lista, para llenar las cachés. Como
+# mucho PREWARM_MAX rutas y PREWARM_SECONDS segundos
+PREWARM = env_str("CALLEJERO_PREWARM", "")
+PREWARM_MAX = env_int("CALLEJERO_PREWARM_MAX", 500)
+PREWARM_SECONDS = env_float("CALLEJERO_PREWARM_SECONDS", 5)
+
+# Backend de las búsquedas por clave exacta: "duckdb" o "arrays"
+BACKEND = env_str("CALLEJERO_BACKEND", "duckdb")
+
+# Fichero de índice binario generado con `python -m app.lookup`
+LOOKUP_PATH = env_str("CALLEJERO_LOOKUP", "callejero.idx")
+
+# Fichero de filtros de existencia generado con `python -m app.filters`. Con el
+# backend de DuckDB descarta las claves y búsquedas sin resultados sin consultar.
+# Si no existe no se filtra
+FILTERS_PATH = env_str("CALLEJERO_FILTERS", "callejero.filters")
+
+# Directorio con una base de datos por provincia (NN.duckdb). Si se indica, las
+# consultas se enrutan al fichero de su provincia, que se adjunta en el primer uso
+SHARDS_DIR = env_str("CALLEJERO_SHARDS", "")
+
+# Número máximo de provincias adjuntas a la vez, se cierran las menos usadas
+SHARDS_MAX = env_int("CALLEJERO_SHARDS_MAX", 8)
+
+# Umbral en milisegundos a partir del cual una consulta se registra con su perfil
+# de DuckDB (0 lo desactiva). Activo, todas las consultas se ejecutan perfiladas
+SLOW_QUERY_MS = env_float("CALLEJERO_SLOW_QUERY_MS", 0)
+
+# Permite pedir el perfil de las consultas de una petición con la cabecera
+# X-Callejero-Profile. Solo para depuración: expone el plan de las consultas
+PROFILE_HEADER = env_bool("CALLEJERO_PROFILE_HEADER", False)
+
+# Directorio con versiones del callejero (callejero-<version>.duckdb). Si se indica,
+# se sirve la versión mayor y se activan en caliente las que se añadan después
+DATASETS_DIR = env_str("CALLEJERO_DATASETS", "")
+
+# Segundos entre revisiones del directorio de versiones
+DATASETS_POLL = env_float("CALLEJERO_DATASETS_POLL", 30)
+
+# Hilos y memoria de DuckDB. Sin valor se calculan a partir de los límites del
+# contenedor o de Lambda (la memoria como fracción del total)
+DB_THREADS = env_int("CALLEJERO_DB_THREADS", 0)
+DB_MEMORY = env_str("CALLEJERO_DB_MEMORY", "")
+DB_MEMORY_FRACTION = env_float("CALLEJERO_DB_MEMORY_FRACTION", 0.5)
+
+# Procesos de `python -m app.serve` (0: uno por CPU). Los hilos y la memoria de
+# DuckDB calculados se reparten entre ellos. Un proceso cuya memoria privada
+# supera WORKER_MAX_MB se sustituye por otro (0 lo desactiva)
+WORKERS = env_int("CALLEJERO_WORKERS", 1)
+WORKER_MAX_MB = env_int("CALLEJERO_WORKER_MAX_MB", 0)
+
+# Dirección en la que escucha `python -m app.serve` (0.0.0.0 fuera de Lambda)
+HOST = env_str("CALLEJERO_HOST", "127.0.0.1")
+
+# Tiempo máximo de cada consulta en milisegundos (0 lo desactiva)
+QUERY_TIMEOUT_MS = env_float("CALLEJERO_QUERY_TIMEOUT_MS", 5000)
+
+# Consultas simultáneas (0: el doble de los hilos de DuckDB), consultas en espera
+# como máximo y tiempo máximo de espera antes de responder 503
+DB_MAX_QUERIES = env_int("CALLEJERO_DB_MAX_QUERIES", 0)
+DB_QUEUE_MAX = env_int("CALLEJERO_DB_QUEUE_MAX", 32)
+DB_QUEUE_TIMEOUT_MS = env_float("CALLEJERO_DB_QUEUE_TIMEOUT_MS", 1000)
+
+# Agrupa las consultas idénticas concurrentes en una sola ejecución
+COALESCE = env_bool("CALLEJERO_COALESCE", True)
+
+# Comprime las respuestas (brotli o gzip según Accept-Encoding) a partir de un
+# tamaño en bytes. Opcionalmente guarda las más pedidas ya comprimidas (número de
+# entradas, 0 la desactiva): la caché responde antes de la admisión y de la
+# agrupación de consultas idénticas
+COMPRESS = env_bool("CALLEJERO_COMPRESS", True)
+COMPRESS_MIN_BYTES = env_int("CALLEJERO_COMPRESS_MIN_BYTES", 1024)
+COMPRESS_CACHE = env_int("CALLEJERO_COMPRESS_CACHE", 0)
+
+# Perfil de Python de peticiones seleccionadas (ver pyprofile.py): directorio de
+# los ficheros .folded (vacío lo desactiva), secreto de la cabecera
+# X-Callejero-Pyprofile, fracción de peticiones trazadas al azar y segundos
+# mínimos entre dos perfiles
+PYPROFILE_DIR = env_str("CALLEJERO_PYPROFILE_DIR", "")
+PYPROFILE_TOKEN = env_str("CALLEJERO_PYPROFILE_TOKEN", "")
+PYPROFILE_RATE = env_float("CALLEJERO_PYPROFILE_RATE", 0)
+PYPROFILE_INTERVAL = env_float("CALLEJERO_PYPROFILE_INTERVAL", 10)
+
+# Búsquedas de calles recientes que se guardan para resolver en memoria las que
+# las refinan (una pulsación más), en número de búsquedas (0 lo desactiva)
+REFINE_CACHE = env_int("CALLEJERO_REFINE_CACHE", 256)
+
+# Expone /metrics en formato Prometheus y mide cada petición
+METRICS = env_bool("CALLEJERO_METRICS", True)
@@ -0,0 +1,375 @@
+"""
+Acceso a la base de datos DuckDB del callejero.
+
+La conexión se abre de forma perezosa en la primera consulta (o durante el
+calentamiento), de modo que importar la aplicación no paga el coste de abrir el
+fichero. Cada consulta usa su propio cursor para poder ejecutarse desde los hilos
+del threadpool de FastAPI.
+
+Con CALLEJERO_SHARDS la conexión es una base de datos en memoria y cada consulta
+se ejecuta sobre el fichero de su provincia (ver shards.py).
+
+La base de datos abierta es un `Dataset` con su versión. Con CALLEJERO_DATASETS
+se puede sustituir en caliente por una versión nueva (ver datasets.py): cada
+petición fija el dataset en su primera consulta y lo libera al terminar, y el
+dataset sustituido se cierra cuando ya no quedan peticiones que lo usen.
+"""
+
+import contextlib
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+from . import config, governor, metrics, slowlog
+from .coalesce import SingleFlight, normalize
+from .filters import open_filters
+from .shards import ShardManager
+from .startup import profile
+
+# Ficheros versionados: callejero-<version>.duckdb
+VERSION_PATTERN = re.compile(r"^callejero-(?P<version>[\w.-]+)\.duckdb$")
+
+
+class Dataset:
+    """Versión del callejero abierta: conexión, provincias, filtros y backend de búsquedas."""
+
+    def __init__(self, version: str, path: str, con, shards: ShardManager | None = None):
+        self.version = version
+        self.path = path
+        self.con = con
+        self.shards = shards
+        self.filters = None
+        self.backend = None
+        self.in_flight = 0
+        self.retired = False
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            drained = self.retired and self.in_flight == 0
+        if drained:
+            self.close()
+
+    def retire(self):
+        """Marca el dataset como sustituido; se cierra al terminar la última petición."""
+        with self._lock:
+            self.retired = True
+            drained = self.in_flight == 0
+        if drained:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        if self.backend is not None and hasattr(self.backend, "close"):
+            self.backend.close()
+        if self.filters is not None:
+            self.filters.close()
+        self.con.close()
+        print(f"[INFO] Dataset {self.version} cerrado")
+
+
+def read_version(con, path: str) -> str:
+    """
+    Versión del dataset: la tabla VERSION generada en el build, el nombre del
+    fichero (callejero-<version>.duckdb) o, en su defecto, su fecha de modificación.
+    """
+    try:
+        row = con.execute("SELECT version FROM VERSION").fetchone()
+        if row:
+            return str(row[0])
+    except duckdb.Error:
+        pass
+    match = VERSION_PATTERN.match(Path(path).name)
+    if match:
+        return match.group("version")
+    return datetime.fromtimestamp(Path(path).stat().st_mtime).strftime("%Y%m%d%H%M%S")
+
+
+def filters_path(path: str) -> str:
+    """Filtros de existencia de un fichero versionado (junto a él) o los configurados."""
+    if VERSION_PATTERN.match(Path(path).name):
+        return str(Path(path).with_suffix(".filters"))
+    return config.FILTERS_PATH
+
+
+def open_dataset(path: str, lookup_path: str | None = None) -> Dataset:
+    """Abre un fichero (o directorio de provincias), sus filtros y su backend de búsquedas."""
+    from .backend import create_backend
+
+    if config.SHARDS_DIR and path == config.SHARDS_DIR:
+        con = duckdb.connect()
+        shards = ShardManager(con, path, config.SHARDS_MAX)
+        dataset = Dataset(Path(path).resolve().name, path, con, shards)
+    else:
+        con = duckdb.connect(path, config={"access_mode": "READ_ONLY"})
+        dataset = Dataset(read_version(con, path), path, con)
+    governor.configure(con)
+    try:
+        dataset.filters = open_filters(filters_path(path))
+        dataset.backend = create_backend(
+            config.BACKEND, lookup_path or config.LOOKUP_PATH, dataset.filters
+        )
+    except Exception:
+        if dataset.filters is not None:
+            dataset.filters.close()
+        con.close()
+        raise
+    return dataset
+
+
+_current: Dataset | None = None
+_lock = threading.Lock()
+_first_query = True
+_flight = SingleFlight()
+
+# Dataset fijado por la petición en curso (lista vacía hasta la primera consulta)
+_request: ContextVar[list | None] = ContextVar("callejero_dataset", default=None)
+
+
+def initial_path() -> tuple[str, str | None]:
+    """Fichero con el que arranca la API y su índice de búsquedas."""
+    if config.SHARDS_DIR:
+        return config.SHARDS_DIR, None
+    if config.DATASETS_DIR:
+        from .datasets import find_latest, lookup_path
+
+        latest = find_latest(config.DATASETS_DIR)
+        if latest is not None:
+            return latest, lookup_path(latest)
+    return config.DB_PATH, None
+
+
+def get_dataset() -> Dataset:
+    """Devuelve el dataset activo, abriéndolo si es necesario."""
+    global _current
+    if _current is None:
+        with _lock:
+            if _current is None:
+                with profile.phase("db_open"):
+                    _current = open_dataset(*initial_path())
+                print(f"[INFO] Dataset {_current.version} abierto desde {_current.path}")
+                print(f"[INFO] DuckDB: {governor.settings}, {governor.admission.max_running} consultas simultáneas")
+    return _current
+
+
+def swap(dataset: Dataset) -> Dataset | None:
+    """Activa `dataset` para las peticiones nuevas y retira el anterior."""
+    global _current
+    with _lock:
+        previous, _current = _current, dataset
+    metrics.DATASET_SWAPS.inc()
+    print(f"[OK] Dataset activo: {dataset.version}")
+    if previous is not None:
+        previous.retire()
+    return previous
+
+
+def _acquire() -> Dataset:
+    get_dataset()
+    with _lock:
+        dataset = _current
+        dataset.acquire()
+    return dataset
+
+
+def current() -> Dataset:
+    """Dataset de la petición en curso, fijado en su primer uso, o el activo."""
+    holder = _request.get()
+    if holder is None:
+        return get_dataset()
+    if not holder:
+        holder.append(_acquire())
+    return holder[0]
+
+
+def active_version() -> str | None:
+    """Versión del dataset activo sin abrirlo ni fijarlo a la petición; None si no está abierto."""
+    dataset = _current
+    return dataset.version if dataset is not None else None
+
+
+def get_connection() -> duckdb.DuckDBPyConnection:
+    """Devuelve la conexión de solo lectura del dataset activo."""
+    return get_dataset().con
+
+
+def get_shards() -> ShardManager | None:
+    return get_dataset().shards
+
+
+def _execute(cur, sql: str, params: list) -> list[dict]:
+    with governor.deadline(cur):
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    cols = [desc[0] for desc in cur.description]
+    return [dict(zip(cols, r)) for r in rows]
+
+
+def _run(cur, sql: str, params: list, cpro: int | None) -> tuple[list[dict], float]:
+    """Ejecuta la consulta y devuelve las filas y su duración."""
+    profiled = slowlog.enable(cur)
+    start = time.perf_counter()
+    items = _execute(cur, sql, params)
+    seconds = time.perf_counter() - start
+    if profiled:
+        slowlog.inspect(cur, sql, params, seconds, cpro=cpro)
+    return items, seconds
+
+
+def _query(dataset: Dataset, sql: str, params: list, cpro: int | None) -> list[dict]:
+    with governor.admission.slot():
+        cur = dataset.con.cursor()
+        try:
+            shards = dataset.shards
+            if shards is None:
+                items, seconds = _run(cur, sql, params, cpro)
+            elif cpro is None:
+                raise ValueError("Consulta sin provincia con la base de datos por provincias")
+            elif not shards.exists(cpro):
+                # Sin fichero para la provincia no puede haber resultados
+                items, seconds = [], 0.0
+            else:
+                with shards.use(cpro) as alias:
+                    cur.execute(f"USE {alias}")
+                    items, seconds = _run(cur, sql, params, cpro)
+        finally:
+            cur.close()
+    metrics.record_query(seconds)
+    return items
+
+
+def query(
+    sql: str, params: list, cpro: int | None = None, dataset: Dataset | None = None
+) -> list[dict]:
+    """
+    Ejecuta una consulta y devuelve las filas como diccionarios.
+
+    `cpro` indica la provincia a la que afecta la consulta; solo se usa para
+    elegir el fichero cuando la base de datos está dividida por provincias.
+    `dataset` permite consultar una versión concreta (calentamiento de una
+    versión nueva antes de activarla).
+    """
+    global _first_query
+    start = time.perf_counter()
+    # Fuera de una petición (scripts, calentamiento) el dataset se fija solo
+    # durante la consulta
+    pinned = dataset is not None or _request.get() is not None
+    if dataset is None:
+        dataset = current() if pinned else _acquire()
+    try:
+        if config.COALESCE:
+            # Las consultas idénticas en curso sobre el mismo dataset se ejecutan una vez
+            key = (dataset, normalize(sql), tuple(params), cpro)
+            items = _flight.do(key, lambda: _query(dataset, sql, params, cpro))
+        else:
+            items = _query(dataset, sql, params, cpro)
+    finally:
+        if not pinned:
+            dataset.release()
+    if _first_query:
+        _first_query = False
+        profile.record("first_query", time.perf_counter() - start)
+    return items
+
+
+def stream(sql: str, params: list, cpro: int | None = None, batch: int = 1000):
+    """
+    Ejecuta una consulta y genera las filas como diccionarios por lotes de
+    `batch`, sin convertir el resultado completo a Python (respuestas en streaming).
+
+    La consulta pasa por la admisión y el plazo como las de query(). DuckDB la
+    ejecuta completa en `execute`, así que el hueco de admisión se libera antes
+    de enviar las filas y un cliente lento no lo retiene.
+    """
+    dataset = current()
+    shards = dataset.shards
+    if shards is not None and cpro is None:
+        raise ValueError("Consulta sin provincia con la base de datos por provincias")
+    if shards is not None and not shards.exists(cpro):
+        return
+    cur = dataset.con.cursor()
+    try:
+        with shards.use(cpro) if shards is not None else contextlib.nullcontext() as alias:
+            if alias is not None:
+                cur.execute(f"USE {alias}")
+            with governor.admission.slot():
+                profiled = slowlog.enable(cur)
+                start = time.perf_counter()
+                with governor.deadline(cur):
+                    cur.execute(sql, params)
+                seconds = time.perf_counter() - start
+                if profiled:
+                    slowlog.inspect(cur, sql, params, seconds, cpro=cpro)
+            metrics.record_query(seconds)
+            cols = [desc[0] for desc in cur.description]
+            while rows := cur.fetchmany(batch):
+                for row in rows:
+                    yield dict(zip(cols, row))
+    finally:
+        cur.close()
+
+
+def _collect_dataset() -> list[str]:
+    dataset = _current
+    if dataset is None:
+        return []
+    return [
+        "# HELP callejero_dataset_info Versión del callejero activa",
+        "# TYPE callejero_dataset_info gauge",
+        f'callejero_dataset_info{{version="{dataset.version}"}} 1',
+        "# HELP callejero_dataset_in_flight Peticiones en curso sobre la versión activa",
+        "# TYPE callejero_dataset_in_flight gauge",
+        f'callejero_dataset_in_flight{{version="{dataset.version}"}} {dataset.in_flight}',
+    ]
+
+
+metrics.registry.collectors.append(_collect_dataset)
+
+
+class DatasetMiddleware:
+    """
+    Middleware ASGI que fija un dataset durante toda la petición y devuelve su
+    versión en la cabecera X-Callejero-Version.
+    """
+
+    header = b"x-callejero-version"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        holder: list = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                dataset = holder[0] if holder else _current
+                if dataset is not None:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (self.header, dataset.version.encode("latin-1"))
+                    ]
+            await send(message)
+
+        token = _request.set(holder)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request.reset(token)
+            if holder:
+                holder[0].release()
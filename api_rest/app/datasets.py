@@ -0,0 +1,107 @@
+"""
+Versiones del callejero sustituibles en caliente.
+
+Con CALLEJERO_DATASETS la API busca en ese directorio ficheros
+`callejero-<version>.duckdb` y sirve la versión mayor. Un hilo revisa el
+directorio cada CALLEJERO_DATASETS_POLL segundos; cuando aparece una versión
+nueva la abre, la calienta con las consultas habituales y la activa para las
+peticiones nuevas. Las peticiones en curso terminan con la versión anterior,
+que se cierra cuando queda libre.
+
+Los ficheros deben copiarse al directorio con otro nombre y renombrarse al
+terminar, para que no se detecten a medio escribir. Con el backend de arrays
+cada versión necesita su índice junto al fichero (`callejero-<version>.idx`), y
+sus filtros de existencia, si los tiene, se leen de `callejero-<version>.filters`.
+"""
+
+import functools
+import os
+import threading
+import time
+from pathlib import Path
+
+from . import database
+from .database import VERSION_PATTERN
+from .startup import warmup
+
+
+def _version(path: str) -> str:
+    return VERSION_PATTERN.match(Path(path).name).group("version")
+
+
+def find_latest(directory: str) -> str | None:
+    """Fichero con la versión mayor del directorio, o None si no hay ninguno."""
+    candidates = [
+        path for path in Path(directory).glob("callejero-*.duckdb") if VERSION_PATTERN.match(path.name)
+    ]
+    if not candidates:
+        return None
+    return str(max(candidates, key=lambda path: _version(str(path))))
+
+
+def lookup_path(path: str) -> str:
+    """Índice de búsquedas de la versión, junto al fichero DuckDB."""
+    return str(Path(path).with_suffix(".idx"))
+
+
+class DatasetWatcher:
+    """Detecta versiones nuevas en el directorio y las activa sin reiniciar."""
+
+    def __init__(self, directory: str, interval: float):
+        self.directory = directory
+        self.interval = interval
+        # Ficheros que no se han podido abrir, con su fecha de modificación
+        self.failed: dict[str, float] = {}
+        self._stop = threading.Event()
+
+    def check(self) -> bool:
+        """Activa la versión mayor del directorio si es más nueva que la actual."""
+        latest = find_latest(self.directory)
+        if latest is None:
+            return False
+        current = database.get_dataset()
+        if Path(latest).resolve() == Path(current.path).resolve():
+            return False
+        match = VERSION_PATTERN.match(Path(current.path).name)
+        if match and Path(current.path).parent.resolve() == Path(self.directory).resolve():
+            if _version(latest) <= match.group("version"):
+                return False
+        mtime = os.path.getmtime(latest)
+        if self.failed.get(latest) == mtime:
+            return False
+
+        start = time.perf_counter()
+        try:
+            dataset = database.open_dataset(latest, lookup_path(latest))
+        except Exception as exc:
+            self.failed[latest] = mtime
+            print(f"[ERROR] No se pudo abrir {latest}: {exc}")
+            return False
+        try:
+            warmup(functools.partial(database.query, dataset=dataset))
+        except Exception as exc:
+            self.failed[latest] = mtime
+            dataset.close()
+            print(f"[ERROR] Fallo al calentar {latest}: {exc}")
+            return False
+        print(
+            f"[INFO] Dataset {dataset.version} abierto y calentado en "
+            f"{time.perf_counter() - start:.2f} segundos"
+        )
+        database.swap(dataset)
+        return True
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as exc:
+                print(f"[ERROR] Revisión de versiones del callejero: {exc}")
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, daemon=True, name="datasets")
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
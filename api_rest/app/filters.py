@@ -0,0 +1,240 @@
+"""
+Filtros de existencia para responder 404 sin consultar DuckDB.
+
+Buena parte del tráfico son claves que no existen: códigos postales
+inventados, unidades poblacionales erróneas o fragmentos de calle con erratas.
+Con el backend de DuckDB cada una ejecuta una consulta completa antes de
+responder 404. En build se generan unas estructuras compactas que descartan
+esas peticiones en microsegundos:
+
+- cp.bitmap: un bit por código postal (00000-99999), 12,5 KB. También descarta
+  las búsquedas por prefijo de CP (3 o 4 dígitos) sin ningún CP en su rango.
+- municipios.keys y unidades.keys: claves ordenadas de (cpro, cmun) y de
+  (cpro, cmun, cun), con búsqueda binaria. Su espacio de claves es demasiado
+  disperso para un bitmap.
+- vias_cp y vias_unidad: un filtro de Bloom por ámbito de búsqueda de calles
+  (código postal o unidad poblacional) con los prefijos, de hasta PREFIX_MAX
+  letras, de las palabras de sus vías (ver tokens.py). Cada palabra de una
+  búsqueda debe ser el inicio de alguna palabra de una vía del ámbito, así que
+  si alguno de sus prefijos no está en el filtro la búsqueda no tiene
+  resultados. Un filtro de Bloom no tiene falsos negativos; sus falsos
+  positivos (en torno al 1 %) solo hacen que se consulte DuckDB.
+
+Las estructuras se guardan con el formato de indexfile.py y se abren con mmap,
+de modo que varios procesos comparten sus páginas. El backend de arrays ya
+resuelve estas búsquedas con búsquedas binarias y no los necesita.
+
+Generación del fichero:
+    python -m app.filters callejero.duckdb callejero.filters
+"""
+
+import hashlib
+import math
+import os
+import sys
+from array import array
+from bisect import bisect_left
+
+from . import indexfile, metrics, tokens
+from .lookup import TOKEN_INDEXES, municipio_key, unidad_key
+
+# Letras de los prefijos de palabra que se guardan. Las palabras buscadas más
+# largas se comprueban por sus primeras PREFIX_MAX letras
+PREFIX_MAX = 6
+
+# Bits por prefijo y funciones hash de los filtros de Bloom: ~1 % de falsos positivos
+BITS_PER_PREFIX = 10
+HASHES = 5
+
+# Ámbito de la búsqueda de calles (ver backend.py) -> índice de palabras
+SCOPES = {"cp": "vias_cp", "unidad": "vias_unidad"}
+
+
+def prefixes(word: str) -> set[str]:
+    return {word[:n] for n in range(1, min(len(word), PREFIX_MAX) + 1)}
+
+
+def _positions(text: str, bits: int) -> list[int]:
+    # Doble hash (Kirsch-Mitzenmacher) a partir de un resumen estable entre procesos
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(HASHES)]
+
+
+def bloom(items: set[str]) -> bytearray:
+    """Filtro de Bloom con los elementos indicados, en múltiplos de 8 bytes."""
+    size = max(8, math.ceil(len(items) * BITS_PER_PREFIX / 64) * 8)
+    data = bytearray(size)
+    for item in items:
+        for bit in _positions(item, size * 8):
+            data[bit >> 3] |= 1 << (bit & 7)
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+
+def build_sections(con) -> dict[str, array]:
+    """Genera las secciones del fichero de filtros desde DuckDB."""
+    bitmap = bytearray(100000 // 8)
+    for (cpos,) in con.execute("SELECT DISTINCT cpos FROM TRAM WHERE cpos IS NOT NULL").fetchall():
+        bitmap[cpos >> 3] |= 1 << (cpos & 7)
+    municipios = sorted(
+        municipio_key(cpro, cmun)
+        for cpro, cmun in con.execute(
+            "SELECT DISTINCT cpro, cmun FROM TRAM WHERE cpro IS NOT NULL AND cmun IS NOT NULL"
+        ).fetchall()
+    )
+    unidades = sorted(
+        unidad_key(cpro, cmun, cun)
+        for cpro, cmun, cun in con.execute(
+            """
+            SELECT DISTINCT cpro, cmun, cun_var FROM TRAM
+            WHERE cpro IS NOT NULL AND cmun IS NOT NULL AND cun_var IS NOT NULL
+            """
+        ).fetchall()
+    )
+    sections = {
+        "cp.bitmap": array("B", bitmap),
+        "municipios.keys": array("q", municipios),
+        "unidades.keys": array("q", unidades),
+    }
+
+    # Las mismas filas y palabras que los índices de palabras del backend de arrays
+    words: dict[tuple, set[str]] = {}
+    for name, (columns, sql) in TOKEN_INDEXES.items():
+        names = [col for col, _, _ in columns]
+        tvia, nviac = names.index("tvia") + 1, names.index("nviac") + 1
+        scopes: dict[int, set[str]] = {}
+        for row in con.execute(sql).fetchall():
+            texts = (row[tvia], row[nviac], *sorted(filter(None, row[-1] or [])))
+            if texts not in words:
+                words[texts] = set().union(*map(prefixes, tokens.tokens(*texts)))
+            scopes.setdefault(row[0], set()).update(words[texts])
+        keys = array("q")
+        offsets = array("q", [0])
+        bits = bytearray()
+        for key in sorted(scopes):
+            bits += bloom(scopes[key])
+            keys.append(key)
+            offsets.append(len(bits))
+        sections[f"{name}.keys"] = keys
+        sections[f"{name}.offsets"] = offsets
+        sections[f"{name}.bits"] = array("B", bits)
+    return sections
+
+
+def build(db_path: str, out_path: str):
+    """Genera el fichero de filtros a partir del fichero DuckDB."""
+    import duckdb
+
+    con = duckdb.connect(db_path, config={"access_mode": "READ_ONLY"})
+    sections = build_sections(con)
+    con.close()
+
+    # Como el índice de arrays, se escribe aparte y se renombra al terminar
+    tmp_path = f"{out_path}.tmp"
+    indexfile.write(tmp_path, sections)
+    os.replace(tmp_path, out_path)
+
+    size = os.path.getsize(out_path)
+    print(
+        f"[OK] Filtros de existencia generados en {out_path}: "
+        f"{sum(bin(b).count('1') for b in sections['cp.bitmap'])} CP, "
+        f"{len(sections['unidades.keys'])} unidades, "
+        f"{len(sections['vias_cp.keys'])} + {len(sections['vias_unidad.keys'])} filtros de calles, "
+        f"{size / 1024 / 1024:.2f} MB"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Consulta
+# ---------------------------------------------------------------------------
+
+
+def _contains(keys, key: int) -> bool:
+    i = bisect_left(keys, key)
+    return i < len(keys) and keys[i] == key
+
+
+class Filters:
+    """Filtros de existencia abiertos con mmap. False significa que no hay resultados."""
+
+    def __init__(self, path: str):
+        self.file = indexfile.IndexFile(path)
+        self.cp = self.file["cp.bitmap"]
+        self.municipios = self.file["municipios.keys"]
+        self.unidades = self.file["unidades.keys"]
+
+    def close(self):
+        self.file.close()
+
+    def _reject(self, filtro: str) -> bool:
+        metrics.FILTER_REJECTED.inc(filtro)
+        return False
+
+    def has_cp(self, cpos: int) -> bool:
+        if 0 <= cpos < 100000 and self.cp[cpos >> 3] & (1 << (cpos & 7)):
+            return True
+        return self._reject("cp")
+
+    def has_cp_range(self, low: int, high: int) -> bool:
+        """Indica si hay algún código postal entre low y high, ambos incluidos."""
+        low, high = max(low, 0), min(high, 99999)
+        if low <= high:
+            chunk = bytearray(self.cp[low >> 3 : (high >> 3) + 1])
+            chunk[0] &= (0xFF << (low & 7)) & 0xFF
+            chunk[-1] &= 0xFF >> (7 - (high & 7))
+            if any(chunk):
+                return True
+        return self._reject("cp")
+
+    def has_municipio(self, cpro: int, cmun: int) -> bool:
+        return _contains(self.municipios, municipio_key(cpro, cmun)) or self._reject("municipio")
+
+    def has_unidad(self, cpro: int, cmun: int, cun: int) -> bool:
+        return _contains(self.unidades, unidad_key(cpro, cmun, cun)) or self._reject("unidad")
+
+    def may_match(self, scope: tuple, terms: list[str]) -> bool:
+        """
+        Indica si la búsqueda de calles `terms` en el ámbito ("cp", cpos) o
+        ("unidad", cpro, cmun, cun) puede tener resultados.
+        """
+        name = SCOPES[scope[0]]
+        key = scope[1] if scope[0] == "cp" else unidad_key(*scope[1:])
+        keys = self.file[f"{name}.keys"]
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return self._reject("vias")
+        offsets = self.file[f"{name}.offsets"]
+        start, end = offsets[i], offsets[i + 1]
+        bits = self.file[f"{name}.bits"]
+        size = (end - start) * 8
+        for term in terms:
+            # Basta con que pase uno de los prefijos del término (tokens.alternatives)
+            if not any(
+                all(
+                    bits[start + (bit >> 3)] & (1 << (bit & 7))
+                    for bit in _positions(prefix[:PREFIX_MAX], size)
+                )
+                for prefix in tokens.alternatives(term)
+            ):
+                return self._reject("vias")
+        return True
+
+
+def open_filters(path: str) -> Filters | None:
+    """Abre el fichero de filtros, o None si no existe (sin filtros)."""
+    if not path or not os.path.isfile(path):
+        return None
+    return Filters(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python -m app.filters <callejero.duckdb> <callejero.filters>")
+        sys.exit(1)
+    build(sys.argv[1], sys.argv[2])
@@ -0,0 +1,232 @@
+"""
+Límites de recursos de DuckDB: hilos, memoria, tiempo máximo por consulta y
+admisión de consultas.
+
+- Los hilos y la memoria de DuckDB se fijan con CALLEJERO_DB_THREADS y
+  CALLEJERO_DB_MEMORY o, si no se indican, a partir de los límites del
+  contenedor (cgroups) o de la memoria configurada en Lambda. Con varios
+  procesos (CALLEJERO_WORKERS, ver serve.py) se reparten entre ellos.
+- Cada consulta tiene un plazo (CALLEJERO_QUERY_TIMEOUT_MS); un único hilo
+  vigila los plazos e interrumpe el cursor de las consultas que lo superan.
+- Como máximo se ejecutan CALLEJERO_DB_MAX_QUERIES consultas a la vez. Las
+  siguientes esperan en una cola acotada (CALLEJERO_DB_QUEUE_MAX) durante
+  CALLEJERO_DB_QUEUE_TIMEOUT_MS como mucho; si la cola está llena o la espera se
+  agota la petición recibe un 503 en lugar de acumular latencia.
+"""
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+
+from . import config, metrics
+
+# Memoria por vCPU en Lambda: 1769 MB equivalen a una vCPU completa
+LAMBDA_MB_PER_VCPU = 1769
+
+# Valores de cgroup v1 por encima de este límite indican "sin límite"
+UNLIMITED = 1 << 60
+
+
+class Overloaded(Exception):
+    """La consulta no se admite porque la cola de espera está llena o se ha agotado la espera."""
+
+
+class QueryTimeout(Exception):
+    """La consulta se ha interrumpido por superar su tiempo máximo."""
+
+
+def _read(path: str) -> str | None:
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return None
+
+
+def container_memory() -> int | None:
+    """Límite de memoria del proceso en bytes, o None si no se conoce."""
+    lambda_mb = os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    if lambda_mb:
+        return int(lambda_mb) * 1024 * 1024
+    value = _read("/sys/fs/cgroup/memory.max")
+    if value and value != "max":
+        return int(value)
+    value = _read("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if value and int(value) < UNLIMITED:
+        return int(value)
+    return None
+
+
+def container_cpus() -> int:
+    """CPUs disponibles según la cuota del contenedor o de Lambda."""
+    lambda_mb = os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    if lambda_mb:
+        return max(1, math.ceil(int(lambda_mb) / LAMBDA_MB_PER_VCPU))
+    value = _read("/sys/fs/cgroup/cpu.max")
+    if value and not value.startswith("max"):
+        quota, period = value.split()[:2]
+        return max(1, math.ceil(int(quota) / int(period)))
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return max(1, math.ceil(int(quota) / int(period)))
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    """Procesos que atienden peticiones: CALLEJERO_WORKERS o, con 0, uno por CPU."""
+    return max(1, config.WORKERS if config.WORKERS > 0 else container_cpus())
+
+
+def duckdb_settings() -> dict:
+    """
+    Configuración de hilos y memoria que se aplica a las conexiones. Los valores
+    calculados son el presupuesto de cada proceso, no del contenedor entero.
+    """
+    workers = worker_count()
+    settings = {"threads": config.DB_THREADS or max(1, container_cpus() // workers)}
+    if config.DB_MEMORY:
+        settings["memory_limit"] = config.DB_MEMORY
+    else:
+        memory = container_memory()
+        if memory is not None:
+            mb = int(memory * config.DB_MEMORY_FRACTION / workers / (1024 * 1024))
+            settings["memory_limit"] = f"{max(mb, 64)}MB"
+    return settings
+
+
+def configure(con):
+    """Aplica los límites de hilos y memoria a la base de datos de la conexión."""
+    # Se aplican con SET y no al conectar para que otras conexiones al mismo
+    # fichero (build del índice, scripts) no choquen con una configuración distinta
+    for name, value in settings.items():
+        con.execute(f"SET {name} = '{value}'")
+
+
+class _Deadline:
+    __slots__ = ("cur", "finished", "fired")
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.finished = False
+        self.fired = False
+
+
+class Watchdog:
+    """Hilo único que interrumpe los cursores cuyas consultas superan su plazo."""
+
+    def __init__(self):
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, cur, seconds: float) -> _Deadline:
+        entry = _Deadline(cur)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="watchdog")
+                self._thread.start()
+            heapq.heappush(self._heap, (time.monotonic() + seconds, next(self._seq), entry))
+            self._cond.notify()
+        return entry
+
+    def done(self, entry: _Deadline):
+        # Con el lock tomado el vigilante ya no puede interrumpir la consulta
+        with self._cond:
+            entry.finished = True
+
+    def _run(self):
+        with self._cond:
+            while True:
+                # Se descartan las consultas ya terminadas
+                while self._heap and self._heap[0][2].finished:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, _, entry = self._heap[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                heapq.heappop(self._heap)
+                entry.fired = True
+                entry.cur.interrupt()
+
+
+class Admission:
+    """Limita las consultas simultáneas con una cola de espera acotada."""
+
+    def __init__(self, max_running: int, max_waiting: int, wait_timeout: float):
+        self.max_running = max(1, max_running)
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.running = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def _reject(self, reason: str, message: str):
+        metrics.DB_REJECTED.inc(reason)
+        raise Overloaded(message)
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            if self.running >= self.max_running:
+                if self.waiting >= self.max_waiting:
+                    self._reject("cola_llena", "Demasiadas consultas en espera")
+                self.waiting += 1
+                metrics.DB_WAITING.inc()
+                deadline = time.monotonic() + self.wait_timeout
+                try:
+                    while self.running >= self.max_running:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject("espera", "Tiempo de espera agotado para ejecutar la consulta")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    metrics.DB_WAITING.dec()
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.running -= 1
+                self._cond.notify()
+
+
+settings = duckdb_settings()
+admission = Admission(
+    config.DB_MAX_QUERIES or 2 * settings["threads"],
+    config.DB_QUEUE_MAX,
+    config.DB_QUEUE_TIMEOUT_MS / 1000,
+)
+watchdog = Watchdog()
+
+
+@contextmanager
+def deadline(cur, seconds: float | None = None):
+    """Interrumpe la consulta del cursor si no termina en `seconds` (por defecto el configurado)."""
+    if seconds is None:
+        seconds = config.QUERY_TIMEOUT_MS / 1000
+    if seconds <= 0:
+        yield
+        return
+    entry = watchdog.watch(cur, seconds)
+    try:
+        yield
+    except duckdb.InterruptException as exc:
+        if entry.fired:
+            metrics.DB_TIMEOUTS.inc()
+            raise QueryTimeout(f"Consulta cancelada tras {seconds * 1000:.0f} ms") from exc
+        raise
+    finally:
+        watchdog.done(entry)
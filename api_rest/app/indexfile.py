@@ -0,0 +1,148 @@
+"""
+Formato binario de índice de solo lectura para servir consultas con mmap.
+
+Estructura del fichero (little-endian):
+
+    Cabecera (32 bytes)
+        magic        8s   b"CALLEIDX"
+        version      H    versión del formato (FORMAT_VERSION)
+        reserved     H
+        n_sections   I    número de secciones
+        file_size    Q    tamaño total del fichero, para detectar truncados
+        reserved     Q
+    Tabla de secciones (n_sections x 56 bytes)
+        name         32s  nombre ASCII rellenado con ceros, p.ej. b"cp.keys"
+        typecode     c    typecode de array: q, i, h, b, I, B
+        reserved     7x
+        offset       Q    desplazamiento del primer byte de datos (múltiplo de 8)
+        count        Q    número de elementos
+    Datos
+        Cada sección es un array de registros de ancho fijo alineado a 8 bytes.
+
+Las tablas de cadenas se guardan como dos secciones: "<pool>.offsets" (I, n+1
+posiciones) y "<pool>.data" (B, UTF-8 concatenado).
+
+La lectura no deserializa nada: cada sección se expone como un memoryview con
+cast al tipo indicado sobre el mmap del fichero, por lo que abrir el índice tiene
+coste constante y varios procesos comparten las mismas páginas de la caché del SO.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b"CALLEIDX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHIQQ")
+SECTION = struct.Struct("<32sc7xQQ")
+ALIGN = 8
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def string_pool(strings: list[str]) -> tuple[array, array]:
+    """Codifica una lista de cadenas como (offsets, datos UTF-8)."""
+    offsets = array("I", [0])
+    data = bytearray()
+    for value in strings:
+        data += value.encode("utf-8")
+        offsets.append(len(data))
+    return offsets, array("B", data)
+
+
+def write(path: str, sections: dict[str, array]):
+    """Escribe las secciones indicadas en un fichero de índice."""
+    if any(len(name.encode("ascii")) > 32 for name in sections):
+        raise ValueError("Nombre de sección demasiado largo")
+
+    table_end = HEADER.size + SECTION.size * len(sections)
+    offsets = []
+    position = _align(table_end)
+    for arr in sections.values():
+        offsets.append(position)
+        position = _align(position + len(arr) * arr.itemsize)
+    file_size = position
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(sections), file_size, 0))
+        for (name, arr), offset in zip(sections.items(), offsets):
+            f.write(
+                SECTION.pack(name.encode("ascii"), arr.typecode.encode(), offset, len(arr))
+            )
+        for arr, offset in zip(sections.values(), offsets):
+            f.write(b"\0" * (offset - f.tell()))
+            if sys.byteorder != "little":
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            arr.tofile(f)
+        f.write(b"\0" * (file_size - f.tell()))
+
+
+class StringPool:
+    """Acceso por índice a una tabla de cadenas sin decodificarla entera."""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.data[self.offsets[i] : self.offsets[i + 1]], "utf-8")
+
+
+class IndexFile:
+    """Fichero de índice abierto con mmap, con sus secciones como memoryviews."""
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError("El índice solo puede leerse en plataformas little-endian")
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, _, n_sections, file_size, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} no es un fichero de índice del callejero")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Versión de índice no soportada: {version}")
+        if file_size != len(self._mmap):
+            self.close()
+            raise ValueError(f"Índice truncado: {len(self._mmap)} de {file_size} bytes")
+
+        self.sections: dict[str, memoryview] = {}
+        for i in range(n_sections):
+            name, typecode, offset, count = SECTION.unpack_from(
+                self._mmap, HEADER.size + i * SECTION.size
+            )
+            typecode = typecode.decode()
+            nbytes = count * array(typecode).itemsize
+            if offset + nbytes > file_size:
+                self.close()
+                raise ValueError(f"Sección fuera de rango en {path}")
+            self.sections[name.rstrip(b"\0").decode("ascii")] = self._view[
+                offset : offset + nbytes
+            ].cast(typecode)
+
+    def __getitem__(self, name: str) -> memoryview:
+        return self.sections[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def strings(self, pool: str) -> StringPool:
+        return StringPool(self[f"{pool}.offsets"], self[f"{pool}.data"])
+
+    def close(self):
+        for section in getattr(self, "sections", {}).values():
+            section.release()
+        self.sections = {}
+        self._view.release()
+        self._mmap.close()
@@ -0,0 +1,500 @@
+"""
+Motor de búsqueda por clave exacta basado en arrays ordenados.
+
+En build se precalcula, para cada endpoint de clave exacta, el resultado agrupado
+de todas sus claves posibles y se guarda como arrays compactos de tipo fijo:
+
+- keys: claves ordenadas (int64)
+- offsets: posición de inicio de las filas de cada clave (len(keys) + 1)
+- una columna por campo de la respuesta; los textos se guardan como índices a
+  una tabla de cadenas compartida
+
+Una búsqueda es una búsqueda binaria sobre keys y un slice [offsets[i], offsets[i+1])
+de las columnas, sin consultas SQL ni objetos Python por fila en memoria. Los arrays
+se guardan en un fichero de índice (ver indexfile.py) que se abre con mmap.
+
+La numeración de los tramos se guarda como un array ordenado de intervalos: el
+inicio y el fin de cada tramo codificados con la vía y el tipo de numeración
+(impares o pares), de modo que el tramo de un portal se encuentra con una
+búsqueda binaria del número sobre los inicios. Un tercer array guarda el fin
+máximo acumulado, con el que se encuentran también los intervalos anidados o
+solapados que empiezan antes.
+
+La búsqueda de calles por palabras usa un índice invertido: las palabras
+normalizadas de todas las vías y de sus pseudovías (ver tokens.py) forman un vocabulario ordenado,
+de modo que un prefijo es un rango contiguo de palabras, y para cada ámbito de
+búsqueda (código postal o unidad poblacional) y palabra se guarda la lista de
+filas que la contienen. Cada prefijo de la búsqueda se resuelve con búsquedas
+binarias y las listas de los distintos prefijos se intersecan, por lo que el
+coste depende de las vías que coinciden y no del total de vías.
+
+Generación del artefacto:
+    python -m app.lookup callejero.duckdb callejero.idx
+"""
+
+import os
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from . import indexfile, tokens
+
+# Valor usado para representar NULL en las columnas numéricas y de texto
+NULL = -1
+
+# Índice -> (columnas de la respuesta, consulta de build). Cada columna es
+# (nombre, typecode de array, tipo de salida). La consulta debe devolver la clave
+# en la primera columna y estar ordenada por ella.
+INDEXES = {
+    "cp": (
+        [
+            ("cpos", "i", int),
+            ("cpro", "h", int),
+            ("cmun", "h", int),
+            ("cun", "i", float),
+            ("nentsic", "i", str),
+        ],
+        """
+        SELECT cpos AS clave, cpos, cpro, cmun, FLOOR(cun_var / 1000) AS cun, nentsic
+        FROM TRAM WHERE cpos IS NOT NULL
+        GROUP BY ALL ORDER BY ALL
+        """,
+    ),
+    "municipio": (
+        [
+            ("cpos", "i", int),
+            ("cpro", "h", int),
+            ("cmun", "h", int),
+            ("nentsic", "i", str),
+        ],
+        """
+        SELECT cpro::BIGINT * 1000 + cmun AS clave, cpos, cpro, cmun, nentsic
+        FROM TRAM WHERE cpro IS NOT NULL AND cmun IS NOT NULL
+        GROUP BY ALL ORDER BY ALL
+        """,
+    ),
+    "unidad": (
+        [
+            ("cpos", "i", int),
+            ("cpro", "h", int),
+            ("cmun", "h", int),
+            ("cun_var", "i", int),
+            ("nentsic", "i", str),
+        ],
+        """
+        SELECT (cpro::BIGINT * 1000 + cmun) * 10000000 + cun_var AS clave,
+            cpos, cpro, cmun, cun_var, nentsic
+        FROM TRAM WHERE cpro IS NOT NULL AND cmun IS NOT NULL AND cun_var IS NOT NULL
+        GROUP BY ALL ORDER BY ALL
+        """,
+    ),
+    "provincia": (
+        [
+            ("cmun", "h", int),
+            ("cun", "i", float),
+            ("nentsic", "i", str),
+        ],
+        """
+        SELECT cpro AS clave, cmun, FLOOR(cun_var / 1000) AS cun, nentsic
+        FROM TRAM WHERE cpro IS NOT NULL
+        GROUP BY ALL ORDER BY ALL
+        """,
+    ),
+    # Jerarquía precalculada en el parse (JSON que se devuelve tal cual)
+    "jerarquia_cp": (
+        [("payload", "i", str)],
+        "SELECT clave, payload FROM JERARQUIA WHERE ambito = 'cp' ORDER BY clave",
+    ),
+    "jerarquia_municipio": (
+        [("payload", "i", str)],
+        "SELECT clave, payload FROM JERARQUIA WHERE ambito = 'municipio' ORDER BY clave",
+    ),
+}
+
+
+# Intervalos de numeración: (columnas de la respuesta, consulta de build). La
+# consulta devuelve el inicio y el fin codificados (ver numero_key) y está
+# ordenada por ellos
+INTERVALS = {
+    "numeros": (
+        [
+            ("cpos", "i", int),
+            ("cpro", "h", int),
+            ("cmun", "h", int),
+            ("cvia", "i", int),
+            ("cun", "i", int),
+            ("nentsic", "i", str),
+            ("dist", "h", int),
+            ("secc", "h", int),
+            ("tinum", "b", int),
+            ("ein", "h", int),
+            ("cein", "i", str),
+            ("esn", "h", int),
+            ("cesn", "i", str),
+        ],
+        """
+        SELECT
+            (((cpro::BIGINT * 1000 + cmun) * 100000 + cvia_var) * 10 + tinum_var) * 10000 + ein_var AS inicio,
+            (((cpro::BIGINT * 1000 + cmun) * 100000 + cvia_var) * 10 + tinum_var) * 10000 + esn_var AS fin,
+            cpos, cpro, cmun, cvia_var, cun_var, nentsic, dist_var, secc_var,
+            tinum_var, ein_var, cein_var, esn_var, cesn_var
+        FROM NUMEROS
+        ORDER BY inicio, fin, cpos, cun_var, dist_var, secc_var
+        """,
+    ),
+}
+
+
+# Índices de palabras: (columnas de la respuesta, consulta de build). La consulta
+# devuelve el ámbito de búsqueda en la primera columna, las columnas de la
+# respuesta y la lista de nombres de pseudovía de la vía, y está ordenada. Las
+# palabras de cada fila son las del tipo, el nombre y las pseudovías, de modo que
+# buscar por el nombre de una pseudovía devuelve la vía oficial
+TOKEN_INDEXES = {
+    "vias_cp": (
+        [
+            ("cpos", "i", int),
+            ("cpro", "h", int),
+            ("cmun", "h", int),
+            ("cvia", "i", int),
+            ("nentsic", "i", str),
+            ("tvia", "i", str),
+            ("nviac", "i", str),
+        ],
+        """
+        SELECT TRAM.cpos AS clave, TRAM.cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var AS cvia,
+            TRAM.nentsic, VIAS.tvia, TRAM.nviac, list(DISTINCT PSEUDOVIAS.npsvia) AS pseudovias
+        FROM TRAM
+        INNER JOIN VIAS ON TRAM.cpro = VIAS.cpro AND TRAM.cmun = VIAS.cmun AND TRAM.cvia_var = VIAS.cvia_var
+        LEFT JOIN PSEUDOVIAS ON TRAM.cpro = PSEUDOVIAS.cpro AND TRAM.cmun = PSEUDOVIAS.cmun
+            AND TRAM.cvia_var = PSEUDOVIAS.cvia_var AND TRAM.cpos = PSEUDOVIAS.cpos
+            AND TRAM.cun_var = PSEUDOVIAS.cun_var
+        WHERE TRAM.cpos IS NOT NULL
+        GROUP BY ALL ORDER BY ALL
+        """,
+    ),
+    "vias_unidad": (
+        [
+            ("cpos", "i", int),
+            ("cpro", "h", int),
+            ("cmun", "h", int),
+            ("cvia", "i", int),
+            ("cun", "i", int),
+            ("nentsic", "i", str),
+            ("tvia", "i", str),
+            ("nviac", "i", str),
+        ],
+        """
+        SELECT (TRAM.cpro::BIGINT * 1000 + TRAM.cmun) * 10000000 + TRAM.cun_var AS clave,
+            TRAM.cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var AS cvia, TRAM.cun_var AS cun,
+            TRAM.nentsic, VIAS.tvia, TRAM.nviac, list(DISTINCT PSEUDOVIAS.npsvia) AS pseudovias
+        FROM TRAM
+        INNER JOIN VIAS ON TRAM.cpro = VIAS.cpro AND TRAM.cmun = VIAS.cmun AND TRAM.cvia_var = VIAS.cvia_var
+        LEFT JOIN PSEUDOVIAS ON TRAM.cpro = PSEUDOVIAS.cpro AND TRAM.cmun = PSEUDOVIAS.cmun
+            AND TRAM.cvia_var = PSEUDOVIAS.cvia_var AND TRAM.cpos = PSEUDOVIAS.cpos
+            AND TRAM.cun_var = PSEUDOVIAS.cun_var
+        WHERE TRAM.cpro IS NOT NULL AND TRAM.cmun IS NOT NULL AND TRAM.cun_var IS NOT NULL
+        GROUP BY ALL ORDER BY ALL
+        """,
+    ),
+}
+
+
+def municipio_key(cpro: int, cmun: int) -> int:
+    return cpro * 1000 + cmun
+
+
+def unidad_key(cpro: int, cmun: int, cun: int) -> int:
+    return municipio_key(cpro, cmun) * 10000000 + cun
+
+
+def numero_key(cpro: int, cmun: int, cvia: int, tinum: int, numero: int) -> int:
+    return ((municipio_key(cpro, cmun) * 100000 + cvia) * 10 + tinum) * 10000 + numero
+
+
+def tinum(numero: int) -> int:
+    """Tipo de numeración de un número de portal: 1 impares, 2 pares."""
+    return 1 if numero % 2 else 2
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+
+def _column(kind, value, strings: dict[str, int]) -> int:
+    if value is None:
+        return NULL
+    if kind is str:
+        return strings.setdefault(value, len(strings))
+    return int(value)
+
+
+def build_arrays(con) -> tuple[dict[str, dict[str, array]], list[str], list[str]]:
+    """Genera los arrays de cada índice, la tabla de cadenas y el vocabulario desde DuckDB."""
+    strings: dict[str, int] = {}
+    indexes = {}
+
+    for name, (columns, sql) in INDEXES.items():
+        keys = array("q")
+        offsets = array("q")
+        data = {col: array(tc) for col, tc, _ in columns}
+        for n, row in enumerate(con.execute(sql).fetchall()):
+            key = row[0]
+            if not keys or keys[-1] != key:
+                keys.append(key)
+                offsets.append(n)
+            for (col, _, kind), value in zip(columns, row[1:]):
+                data[col].append(_column(kind, value, strings))
+        offsets.append(len(data[columns[0][0]]))
+        indexes[name] = {"keys": keys, "offsets": offsets, **data}
+
+    for name, (columns, sql) in INTERVALS.items():
+        starts = array("q")
+        ends = array("q")
+        data = {col: array(tc) for col, tc, _ in columns}
+        max_ends = array("q")
+        for row in con.execute(sql).fetchall():
+            starts.append(row[0])
+            ends.append(row[1])
+            max_ends.append(max(row[1], max_ends[-1]) if max_ends else row[1])
+            for (col, _, kind), value in zip(columns, row[2:]):
+                data[col].append(_column(kind, value, strings))
+        indexes[name] = {"inicio": starts, "fin": ends, "fin_max": max_ends, **data}
+
+    # Las filas de todos los índices de palabras comparten el vocabulario, que
+    # se conoce después de leerlas todas
+    fetched = {}
+    words: dict[tuple, set[str]] = {}
+    for name, (columns, sql) in TOKEN_INDEXES.items():
+        names = [col for col, _, _ in columns]
+        tvia, nviac = names.index("tvia") + 1, names.index("nviac") + 1
+        rows = []
+        for row in con.execute(sql).fetchall():
+            texts = (row[tvia], row[nviac], *sorted(filter(None, row[-1] or [])))
+            if texts not in words:
+                words[texts] = tokens.tokens(*texts)
+            rows.append((row, words[texts]))
+        fetched[name] = rows
+    vocabulary = sorted(set().union(*words.values()))
+    token_ids = {word: i for i, word in enumerate(vocabulary)}
+
+    for name, (columns, _) in TOKEN_INDEXES.items():
+        data = {col: array(tc) for col, tc, _ in columns}
+        postings = []
+        for n, (row, row_words) in enumerate(fetched[name]):
+            for (col, _, kind), value in zip(columns, row[1:]):
+                data[col].append(_column(kind, value, strings))
+            postings += [(row[0] * len(vocabulary) + token_ids[w], n) for w in row_words]
+        postings.sort()
+        indexes[name] = {
+            "post_keys": array("q", [key for key, _ in postings]),
+            "post_rows": array("i", [n for _, n in postings]),
+            **data,
+        }
+
+    return indexes, list(strings), vocabulary
+
+
+def build(db_path: str, out_path: str):
+    """Genera el fichero de índice a partir del fichero DuckDB."""
+    import duckdb
+
+    con = duckdb.connect(db_path, config={"access_mode": "READ_ONLY"})
+    indexes, strings, vocabulary = build_arrays(con)
+    con.close()
+
+    sections = {}
+    for name, arrays in indexes.items():
+        for col, arr in arrays.items():
+            sections[f"{name}.{col}"] = arr
+    sections["strings.offsets"], sections["strings.data"] = indexfile.string_pool(strings)
+    sections["tokens.offsets"], sections["tokens.data"] = indexfile.string_pool(vocabulary)
+
+    # Se escribe en un fichero temporal y se renombra, para que un proceso que
+    # tenga el índice abierto nunca vea un fichero a medio escribir
+    tmp_path = f"{out_path}.tmp"
+    indexfile.write(tmp_path, sections)
+    os.replace(tmp_path, out_path)
+
+    size = os.path.getsize(out_path)
+    print(
+        f"[OK] Índice de búsqueda generado en {out_path}: "
+        f"{len(strings)} cadenas, {len(vocabulary)} palabras, {size / 1024 / 1024:.2f} MB"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Backend
+# ---------------------------------------------------------------------------
+
+
+class ArrayIndex:
+    """Índice de clave exacta: claves ordenadas, offsets y columnas."""
+
+    def __init__(self, keys, offsets, columns: list[tuple[str, object, type]], strings):
+        self.keys = keys
+        self.offsets = offsets
+        self.columns = columns
+        self.strings = strings
+
+    def row(self, j: int) -> dict:
+        item = {}
+        for col, values, kind in self.columns:
+            value = values[j]
+            if value == NULL:
+                item[col] = None
+            elif kind is str:
+                item[col] = self.strings[value]
+            else:
+                item[col] = kind(value)
+        return item
+
+    def get(self, key: int) -> list[dict]:
+        keys = self.keys
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return []
+        return [self.row(j) for j in range(self.offsets[i], self.offsets[i + 1])]
+
+
+class IntervalIndex(ArrayIndex):
+    """
+    Intervalos ordenados por inicio: filas cuyo intervalo contiene un valor.
+    `max_ends[j]` es el mayor fin de los intervalos 0..j.
+    """
+
+    def __init__(self, starts, ends, max_ends, columns: list[tuple[str, object, type]], strings):
+        super().__init__(starts, None, columns, strings)
+        self.ends = ends
+        self.max_ends = max_ends
+
+    def containing(self, value: int, lower: int) -> list[dict]:
+        """
+        Filas con inicio <= value <= fin, entre las que empiezan en `lower` o
+        después (la vía y el tipo de numeración). Los tramos pueden estar
+        anidados o solaparse, así que se retrocede mientras algún intervalo
+        anterior pueda llegar al valor según el fin máximo acumulado.
+        """
+        j = bisect_right(self.keys, value) - 1
+        items = []
+        while j >= 0 and self.keys[j] >= lower and self.max_ends[j] >= value:
+            if self.ends[j] >= value:
+                items.append(self.row(j))
+            j -= 1
+        items.reverse()
+        return items
+
+
+class TokenIndex(ArrayIndex):
+    """Índice invertido de palabras por ámbito: (ámbito, palabra) -> filas."""
+
+    def __init__(
+        self, post_keys, post_rows, columns: list[tuple[str, object, type]], strings, vocabulary
+    ):
+        super().__init__(post_keys, None, columns, strings)
+        self.post_rows = post_rows
+        self.vocabulary = vocabulary
+
+    def _prefix(self, scope: int, prefix: str) -> set[int]:
+        # Las palabras que empiezan por el prefijo son un rango del vocabulario
+        # y sus entradas del ámbito, un rango de las claves
+        lo = bisect_left(self.vocabulary, prefix)
+        hi = bisect_left(self.vocabulary, prefix + "\U0010ffff", lo)
+        if lo == hi:
+            return set()
+        base = scope * len(self.vocabulary)
+        start = bisect_left(self.keys, base + lo)
+        end = bisect_left(self.keys, base + hi, start)
+        return set(self.post_rows[start:end])
+
+    def search(self, scope: int, terms: list[str]) -> list[dict]:
+        """Filas del ámbito que contienen una palabra por cada prefijo, en orden de build."""
+        if not terms:
+            return []
+        found = None
+        for term in terms:
+            prefixes = tokens.alternatives(term)
+            rows = set().union(*(self._prefix(scope, prefix) for prefix in prefixes))
+            found = rows if found is None else found & rows
+            if not found:
+                return []
+        return [self.row(j) for j in sorted(found)]
+
+
+class ArrayBackend:
+    """Backend de búsquedas por clave exacta sobre el fichero de índice con mmap."""
+
+    name = "arrays"
+
+    def __init__(self, path: str):
+        self.file = indexfile.IndexFile(path)
+        strings = self.file.strings("strings")
+        self.indexes = {}
+        for name, (columns, _) in INDEXES.items():
+            self.indexes[name] = ArrayIndex(
+                self.file[f"{name}.keys"],
+                self.file[f"{name}.offsets"],
+                [(col, self.file[f"{name}.{col}"], kind) for col, _, kind in columns],
+                strings,
+            )
+        for name, (columns, _) in INTERVALS.items():
+            self.indexes[name] = IntervalIndex(
+                self.file[f"{name}.inicio"],
+                self.file[f"{name}.fin"],
+                self.file[f"{name}.fin_max"],
+                [(col, self.file[f"{name}.{col}"], kind) for col, _, kind in columns],
+                strings,
+            )
+        vocabulary = self.file.strings("tokens")
+        for name, (columns, _) in TOKEN_INDEXES.items():
+            self.indexes[name] = TokenIndex(
+                self.file[f"{name}.post_keys"],
+                self.file[f"{name}.post_rows"],
+                [(col, self.file[f"{name}.{col}"], kind) for col, _, kind in columns],
+                strings,
+                vocabulary,
+            )
+
+    def close(self):
+        self.indexes = {}
+        self.file.close()
+
+    def poblaciones_by_cpro(self, cpro: int) -> list[dict]:
+        return self.indexes["provincia"].get(cpro)
+
+    def poblaciones_by_cp(self, cpos: int) -> list[dict]:
+        return self.indexes["cp"].get(cpos)
+
+    def localidades_by_cpro_cmun(self, cpro: int, cmun: int) -> list[dict]:
+        return self.indexes["municipio"].get(municipio_key(cpro, cmun))
+
+    def cp_by_cun(self, cpro: int, cmun: int, cun: int) -> list[dict]:
+        return self.indexes["unidad"].get(unidad_key(cpro, cmun, cun))
+
+    def tramo_by_numero(self, cpro: int, cmun: int, cvia: int, numero: int) -> list[dict]:
+        kind = tinum(numero)
+        return self.indexes["numeros"].containing(
+            numero_key(cpro, cmun, cvia, kind, numero), numero_key(cpro, cmun, cvia, kind, 0)
+        )
+
+    def jerarquia_by_cp(self, cpos: int) -> str | None:
+        rows = self.indexes["jerarquia_cp"].get(cpos)
+        return rows[0]["payload"] if rows else None
+
+    def jerarquia_by_municipio(self, cpro: int, cmun: int) -> str | None:
+        rows = self.indexes["jerarquia_municipio"].get(municipio_key(cpro, cmun))
+        return rows[0]["payload"] if rows else None
+
+    def vias_by_cpos(self, cpos: int, texto: str) -> list[dict]:
+        return self.indexes["vias_cp"].search(cpos, tokens.terms(texto))
+
+    def vias_by_cun(self, cpro: int, cmun: int, cun: int, texto: str) -> list[dict]:
+        return self.indexes["vias_unidad"].search(unidad_key(cpro, cmun, cun), tokens.terms(texto))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python -m app.lookup <callejero.duckdb> <callejero.idx>")
+        sys.exit(1)
+    build(sys.argv[1], sys.argv[2])
@@ -1,89 +1,98 @@
 import time
-from fastapi import FastAPI, HTTPException, status, Response, Path
+
+_import_start = time.perf_counter()
+
+import json
+import threading
+from contextlib import asynccontextmanager
+
 import duckdb
+from fastapi import FastAPI, HTTPException, status, Response, Path, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from . import config, database, governor, metrics, prewarm, pyprofile, slowlog
+from .compression import CompressionMiddleware
+from .backend import get_backend
+from .catalogo import dict_auto, dict_provincia
+from .datasets import DatasetWatcher
+from .shards import cpro_from_cpos
+from .startup import profile, warmup, READY, WARMING, FAILED
+
+profile.record("imports", time.perf_counter() - _import_start)
+
+
+def initialize():
+    """Abre la base de datos y, si está configurado, ejecuta el calentamiento."""
+    try:
+        database.get_connection()
+        get_backend()
+        if config.WARMUP:
+            profile.set_state(WARMING)
+            with profile.phase("warmup"):
+                warmup(database.query)
+        if config.PREWARM:
+            # Las rutas se atienden con la aplicación completa, que ya está declarada
+            profile.set_state(WARMING)
+            with profile.phase("prewarm"):
+                prewarm.prewarm(app)
+        profile.set_state(READY)
+    except Exception as exc:
+        profile.set_state(FAILED, str(exc))
+        print(f"[ERROR] Fallo en el arranque: {exc}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.WARMUP or config.PREWARM:
+        # Se inicializa en segundo plano para no bloquear el arranque de uvicorn,
+        # el endpoint /estado indica cuándo la API está lista
+        threading.Thread(target=initialize, daemon=True).start()
+    watcher = None
+    if config.DATASETS_DIR and not config.SHARDS_DIR:
+        watcher = DatasetWatcher(config.DATASETS_DIR, config.DATASETS_POLL)
+        watcher.start()
+    yield
+    if watcher is not None:
+        watcher.stop()
+
+
+if not (config.WARMUP or config.PREWARM):
+    # Sin calentamiento la conexión se abre en la primera petición
+    profile.set_state(READY)
+
+
+app = FastAPI(
+    root_path="/api",
+    lifespan=lifespan,
+    default_response_class=metrics.TimedJSONResponse,
+)
+if config.PYPROFILE_DIR:
+    # Debe fijarse antes de declarar las rutas
+    app.router.route_class = pyprofile.ProfiledRoute
+if config.COMPRESS:
+    app.add_middleware(
+        CompressionMiddleware,
+        min_bytes=config.COMPRESS_MIN_BYTES,
+        cache_entries=config.COMPRESS_CACHE,
+        version=database.active_version,
+        uncached=("/estado", "/metrics"),
+    )
+if config.PROFILE_HEADER:
+    app.add_middleware(slowlog.ProfileHeaderMiddleware)
+app.add_middleware(database.DatasetMiddleware)
+if config.METRICS:
+    app.add_middleware(metrics.MetricsMiddleware)
 
-app = FastAPI(root_path="/api")
-start = time.time()
-con = duckdb.connect("callejero.duckdb", config={"access_mode": "READ_ONLY"})
-end = time.time()
-print(f"Loaded TRAM table in {end - start:.2f} seconds")
-
-dict_auto = {
-    "01": "ANDALUCÍA",
-    "02": "ARAGÓN",
-    "03": "ASTURIAS",
-    "04": "BALEARES",
-    "05": "CANARIAS",
-    "06": "CANTABRIA",
-    "07": "CASTILLA Y LEÓN",
-    "08": "CASTILLA-LA MANCHA",
-    "09": "CATALUÑA",
-    "10": "COMUNITAT VALENCIANA",
-    "11": "EXTREMADURA",
-    "12": "GALICIA",
-    "13": "MADRID",
-    "14": "MURCIA",
-    "15": "NAVARRA",
-    "16": "PAÍS VASCO",
-    "17": "LA RIOJA",
-    "18": "CEUTA",
-    "19": "MELILLA",
-}
 
-dict_provincia = {
-    "01": {"PRO": "ÁLAVA", "CCOM": "16"},
-    "02": {"PRO": "ALBACETE", "CCOM": "08"},
-    "03": {"PRO": "ALICANTE/ALACANT", "CCOM": "10"},
-    "04": {"PRO": "ALMERÍA", "CCOM": "01"},
-    "05": {"PRO": "ÁVILA", "CCOM": "07"},
-    "06": {"PRO": "BADAJOZ", "CCOM": "11"},
-    "07": {"PRO": "ILLES BALEARS", "CCOM": "04"},
-    "08": {"PRO": "BARCELONA", "CCOM": "09"},
-    "09": {"PRO": "BURGOS", "CCOM": "07"},
-    "10": {"PRO": "CÁCERES", "CCOM": "11"},
-    "11": {"PRO": "CÁDIZ", "CCOM": "01"},
-    "12": {"PRO": "CASTELLÓN/CASTELLÓ", "CCOM": "10"},
-    "13": {"PRO": "CIUDAD REAL", "CCOM": "08"},
-    "14": {"PRO": "CÓRDOBA", "CCOM": "01"},
-    "15": {"PRO": "A CORUÑA", "CCOM": "12"},
-    "16": {"PRO": "CUENCA", "CCOM": "08"},
-    "17": {"PRO": "GIRONA", "CCOM": "09"},
-    "18": {"PRO": "GRANADA", "CCOM": "01"},
-    "19": {"PRO": "GUADALAJARA", "CCOM": "08"},
-    "20": {"PRO": "GIPUZKOA", "CCOM": "16"},
-    "21": {"PRO": "HUELVA", "CCOM": "01"},
-    "22": {"PRO": "HUESCA", "CCOM": "02"},
-    "23": {"PRO": "JAÉN", "CCOM": "01"},
-    "24": {"PRO": "LEÓN", "CCOM": "07"},
-    "25": {"PRO": "LLEIDA", "CCOM": "09"},
-    "26": {"PRO": "LA RIOJA", "CCOM": "17"},
-    "27": {"PRO": "LUGO", "CCOM": "12"},
-    "28": {"PRO": "MADRID", "CCOM": "13"},
-    "29": {"PRO": "MÁLAGA", "CCOM": "01"},
-    "30": {"PRO": "MURCIA", "CCOM": "14"},
-    "31": {"PRO": "NAVARRA", "CCOM": "15"},
-    "32": {"PRO": "OURENSE", "CCOM": "12"},
-    "33": {"PRO": "ASTURIAS", "CCOM": "03"},
-    "34": {"PRO": "PALENCIA", "CCOM": "07"},
-    "35": {"PRO": "LAS PALMAS", "CCOM": "05"},
-    "36": {"PRO": "PONTEVEDRA", "CCOM": "12"},
-    "37": {"PRO": "SALAMANCA", "CCOM": "07"},
-    "38": {"PRO": "SANTA CRUZ DE TENERIFE", "CCOM": "05"},
-    "39": {"PRO": "CANTABRIA", "CCOM": "06"},
-    "40": {"PRO": "SEGOVIA", "CCOM": "07"},
-    "41": {"PRO": "SEVILLA", "CCOM": "01"},
-    "42": {"PRO": "SORIA", "CCOM": "07"},
-    "43": {"PRO": "TARRAGONA", "CCOM": "09"},
-    "44": {"PRO": "TERUEL", "CCOM": "02"},
-    "45": {"PRO": "TOLEDO", "CCOM": "08"},
-    "46": {"PRO": "VALENCIA/VALÈNCIA", "CCOM": "10"},
-    "47": {"PRO": "VALLADOLID", "CCOM": "07"},
-    "48": {"PRO": "BIZKAIA", "CCOM": "16"},
-    "49": {"PRO": "ZAMORA", "CCOM": "07"},
-    "50": {"PRO": "ZARAGOZA", "CCOM": "02"},
-    "51": {"PRO": "CEUTA", "CCOM": "18"},
-    "52": {"PRO": "MELILLA", "CCOM": "19"},
-}
+@app.exception_handler(governor.Overloaded)
+def overloaded_handler(request, exc: governor.Overloaded):
+    # Se rechaza rápido para que el cliente reintente en lugar de acumular latencia
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(governor.QueryTimeout)
+def timeout_handler(request, exc: governor.QueryTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 
 @app.get(
@@ -163,21 +172,7 @@ def get_poblaciones_by_cpro(
     cpro: int = Path(..., description="Código de provincia (01-52)", ge=1, le=52)
 ):
     """Devuelve el listado de poblaciones de una provincia con su código y nombre."""
-    # TODO Eliminar el nucleo de poblacion directamente de la fuente de datos
-    cur = con.execute(
-        """
-        SELECT cmun, FLOOR(cun_var / 1000) AS cun, NENTSIC
-        FROM TRAM
-        WHERE cpro = ?
-        GROUP BY cmun, FLOOR(cun_var / 1000), NENTSIC
-        ORDER BY cmun, cun
-    """,
-        [cpro],
-    )
-
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    items = [dict(zip(cols, r)) for r in rows]
+    items = get_backend().poblaciones_by_cpro(cpro)
 
     if not items:
         raise HTTPException(status_code=404, detail="Sin resultados para esa provincia")
@@ -214,28 +209,27 @@ def get_poblaciones_by_cp(
     if len(cpos) < 3:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-    sql = """
-        SELECT cpos, cpro, cmun, FLOOR(cun_var / 1000) as cun, NENTSIC
-        FROM TRAM
-    """
-
-    cur = None
     if len(cpos) == 5:
-        sql += (
-            "WHERE cpos = ?  GROUP BY cpos, cpro, cmun, FLOOR(cun_var / 1000), NENTSIC "
-        )
-        cur = con.execute(sql, [int(cpos)])
+        items = get_backend().poblaciones_by_cp(int(cpos))
     else:
         # Se completa con valores a la derecha para busquedas parciales, respetando los ceros a la izquierda
         cpos_min = int(cpos.ljust(5, "0"))
         cpos_max = int(cpos.ljust(5, "9"))
 
-        sql += "WHERE cpos BETWEEN ? and ? GROUP BY cpos, cpro, cmun, FLOOR(cun_var / 1000), NENTSIC"
-        cur = con.execute(sql, [cpos_min, cpos_max])
-
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    items = [dict(zip(cols, r)) for r in rows]
+        # Sin ningún CP en el rango no hace falta consultar (ver filters.py)
+        filters = database.current().filters
+        if filters is not None and not filters.has_cp_range(cpos_min, cpos_max):
+            raise HTTPException(status_code=404, detail="Sin resultados para ese CP")
+
+        items = database.query(
+            """
+            SELECT cpos, cpro, cmun, FLOOR(cun_var / 1000) as cun, NENTSIC
+            FROM TRAM
+            WHERE cpos BETWEEN ? and ? GROUP BY cpos, cpro, cmun, FLOOR(cun_var / 1000), NENTSIC
+        """,
+            [cpos_min, cpos_max],
+            cpro=cpro_from_cpos(cpos_min),
+        )
 
     if not items:
         raise HTTPException(status_code=404, detail="Sin resultados para ese CP")
@@ -259,25 +253,17 @@ def get_via_by_cpos(
         ..., description="Nombre parcial de la vía (mínimo 3 caracteres)", min_length=3
     ),
 ):
-    """Devuelve el nombre de la vía en función del código postal y una coincidencia parcial."""
+    """
+    Devuelve el nombre de la vía en función del código postal y una coincidencia
+    parcial. Cada palabra buscada es el inicio de una palabra del tipo o del nombre
+    de la vía, en cualquier orden ("MAYOR PLAZA", "AV CONSTITUCION").
+    """
 
     if len(nviac) < 3:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-    cur = con.execute(
-        """
-        SELECT cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var as cvia, NENTSIC, TVIA, TRAM.nviac
-        FROM TRAM
-        INNER JOIN VIAS ON TRAM.cpro = VIAS.cpro AND TRAM.cmun = VIAS.cmun AND TRAM.cvia_var = VIAS.cvia_var
-        WHERE cpos = ? and TRAM.nviac LIKE ?
-        GROUP BY cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var, NENTSIC, TVIA, TRAM.nviac
-    """,
-        [cpos, f"%{nviac.upper()}%"],
-    )
-
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    items = [dict(zip(cols, r)) for r in rows]
+    # Búsqueda por palabras en cualquier orden (ver tokens.py)
+    items = get_backend().vias_by_cpos(cpos, nviac)
 
     if not items:
         raise HTTPException(
@@ -314,25 +300,15 @@ def get_via_by_cun(
         ..., description="Nombre parcial de la vía (mínimo 3 caracteres)", min_length=3
     ),
 ):
-    """Devuelve el nombre de la vía en función de la unidad poblacional y una coincidencia parcial."""
+    """
+    Devuelve el nombre de la vía en función de la unidad poblacional y una
+    coincidencia parcial, con la misma búsqueda por palabras que /vias/{cpos}/{nviac}.
+    """
 
     if len(nviac) < 3:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-    cur = con.execute(
-        """
-        SELECT cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var as cvia, TRAM.cun_var as cun, NENTSIC, TVIA, TRAM.nviac
-        FROM TRAM
-        INNER JOIN VIAS ON TRAM.cpro = VIAS.cpro AND TRAM.cmun = VIAS.cmun AND TRAM.cvia_var = VIAS.cvia_var
-        WHERE TRAM.cpro = ? and TRAM.cmun = ? and TRAM.cun_var = ? and TRAM.nviac LIKE ?
-        GROUP BY  cpos, TRAM.cpro, TRAM.cmun, TRAM.cvia_var, TRAM.cun_var, NENTSIC, TVIA, TRAM.nviac
-    """,
-        [cpro, cmun, cun, f"%{nviac.upper()}%"],
-    )
-
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    items = [dict(zip(cols, r)) for r in rows]
+    items = get_backend().vias_by_cun(cpro, cmun, cun, nviac)
 
     if not items:
         raise HTTPException(
@@ -351,6 +327,101 @@ def get_via_by_cun(
     return items
 
 
+@app.get(
+    "/numero/{cpro}/{cmun}/{cvia}/{numero}",
+    summary="Tramo de una vía que contiene un número de portal",
+    responses={
+        200: {
+            "description": "Tramo con su código postal, unidad poblacional y sección censal"
+        },
+        404: {"description": "El número no pertenece a ningún tramo de la vía"},
+    },
+)
+def get_tramo_by_numero(
+    cpro: int = Path(..., description="Código de provincia (01-52)", ge=1, le=52),
+    cmun: int = Path(..., description="Código de municipio", ge=1),
+    cvia: int = Path(..., description="Código de vía", ge=1),
+    numero: int = Path(..., description="Número de portal", ge=1, le=9999),
+):
+    """
+    Devuelve el tramo de la vía que contiene el número de portal (por su paridad
+    y los números inicial y final del tramo), con su código postal, unidad
+    poblacional y sección censal (código de 10 dígitos provincia, municipio,
+    distrito y sección).
+    """
+    items = get_backend().tramo_by_numero(cpro, cmun, cvia, numero)
+
+    if not items:
+        raise HTTPException(
+            status_code=404, detail="Sin tramo para ese número en la vía"
+        )
+
+    return [
+        {
+            **item,
+            "seccion": f"{item['cpro']:02d}{item['cmun']:03d}{item['dist']:02d}{item['secc']:03d}"
+            if item["dist"] is not None and item["secc"] is not None
+            else None,
+        }
+        for item in items
+    ]
+
+
+@app.get(
+    "/jerarquia/cp/{cpos}",
+    summary="Jerarquía completa de un código postal",
+    responses={
+        200: {
+            "description": "Municipios del código postal con su autonomía, provincia, unidades poblacionales y número de vías"
+        },
+        404: {"description": "Sin resultados para el código postal"},
+    },
+)
+def get_jerarquia_by_cp(
+    cpos: int = Path(..., description="Código postal (5 dígitos)", ge=1000, le=99999),
+):
+    """
+    Devuelve en una sola respuesta la autonomía, provincia, municipio, unidades
+    poblacionales y número de vías de cada municipio del código postal. El JSON
+    se precalcula al procesar el callejero y se devuelve sin transformar.
+    """
+    payload = get_backend().jerarquia_by_cp(cpos)
+
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Sin resultados para ese código postal")
+
+    return Response(content=payload, media_type="application/json")
+
+
+@app.get(
+    "/jerarquia/{cpro}/{cmun}",
+    summary="Jerarquía completa de un municipio",
+    responses={
+        200: {
+            "description": "Autonomía, provincia, códigos postales, unidades poblacionales y número de vías del municipio"
+        },
+        404: {"description": "Sin resultados para la provincia/municipio"},
+    },
+)
+def get_jerarquia_by_municipio(
+    cpro: int = Path(..., description="Código de provincia (01-52)", ge=1, le=52),
+    cmun: int = Path(..., description="Código de municipio", ge=1),
+):
+    """
+    Devuelve en una sola respuesta la autonomía, provincia, nombre, códigos
+    postales, unidades poblacionales y número de vías del municipio, precalculados
+    al procesar el callejero.
+    """
+    payload = get_backend().jerarquia_by_municipio(cpro, cmun)
+
+    if payload is None:
+        raise HTTPException(
+            status_code=404, detail="Sin resultados para esa provincia/municipio"
+        )
+
+    return Response(content=payload, media_type="application/json")
+
+
 @app.get(
     "/{cpro}/{cmun}",
     summary="Códigos postales por provincia y municipio",
@@ -366,19 +437,7 @@ def get_localidades_by_cpro_cnum(
     """
     Devuelve el código de provincia, municipio y descripción para un código de provincia y municipio.
     """
-    cur = con.execute(
-        """
-        SELECT cpos, cpro, cmun,  NENTSIC
-        FROM TRAM
-        WHERE cpro = ? AND cmun = ?
-        GROUP BY cpos, cpro, cmun,  NENTSIC
-    """,
-        [cpro, cmun],
-    )
-
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    items = [dict(zip(cols, r)) for r in rows]
+    items = get_backend().localidades_by_cpro_cmun(cpro, cmun)
 
     if not items:
         raise HTTPException(
@@ -407,19 +466,7 @@ def get_by_cun(
 ):
     """Devuelve el código postal, provincia, municipio, unidad poblacional y descripción de una unidad poblacional."""
 
-    cur = con.execute(
-        """
-        SELECT cpos, cpro, cmun, cun_var, NENTSIC
-        FROM TRAM
-        WHERE cpro = ? AND cmun = ? AND cun_var = ?
-        GROUP BY cpos, cpro, cmun, cun_var, NENTSIC
-    """,
-        [cpro, cmun, cun],
-    )
-
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    items = [dict(zip(cols, r)) for r in rows]
+    items = get_backend().cp_by_cun(cpro, cmun, cun)
 
     if not items:
         raise HTTPException(
@@ -428,3 +475,115 @@ def get_by_cun(
         )
 
     return items
+
+
+# Tablas de cambios en el orden en que se devuelven para cada paso entre versiones
+CHANGE_TABLES = {
+    "vias": "SELECT * FROM CAMBIOS_VIAS WHERE desde = ?{filtro} ORDER BY cpro, cmun, cvia, tipo",
+    "cp": "SELECT * FROM CAMBIOS_CP WHERE desde = ?{filtro} ORDER BY cpro, cmun, cvia, cpos, tipo",
+    "unidades": "SELECT * FROM CAMBIOS_UNIDADES WHERE desde = ?{filtro} ORDER BY cpro, cmun, cun, tipo",
+}
+
+
+@app.get(
+    "/cambios",
+    summary="Cambios del callejero desde una versión anterior",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Cambios en NDJSON, una línea por vía, código postal o unidad poblacional",
+            "content": {"application/x-ndjson": {}},
+        },
+        400: {"description": "Falta la provincia con la base de datos por provincias"},
+        404: {"description": "La versión activa no incluye tablas de cambios"},
+        410: {"description": "Versión desconocida o sin cambios publicados: hace falta una descarga completa"},
+    },
+)
+def get_cambios(
+    desde: str = Query(
+        ..., description="Versión de la que parte el cliente (AAAAMM)", pattern=r"^\d{6}$"
+    ),
+    cpro: int | None = Query(
+        None, description="Código de provincia (01-52) para limitar los cambios", ge=1, le=52
+    ),
+):
+    """
+    Devuelve los cambios (altas, bajas y renombrados de vías, códigos postales
+    añadidos o retirados de cada vía y unidades poblacionales) entre la versión
+    `desde` y la versión activa, como líneas JSON con el campo `tabla`.
+    """
+    dataset = database.current()
+    if dataset.shards is not None and cpro is None:
+        raise HTTPException(
+            status_code=400, detail="cpro es obligatorio con la base de datos por provincias"
+        )
+
+    try:
+        steps = database.query(
+            "SELECT desde, hasta FROM CAMBIOS_VERSIONES ORDER BY desde", [], cpro=cpro
+        )
+    except duckdb.CatalogException:
+        raise HTTPException(status_code=404, detail="Sin cambios publicados en esta versión")
+
+    if desde == dataset.version:
+        steps = []
+    else:
+        versions = [step["desde"] for step in steps]
+        if desde not in versions:
+            raise HTTPException(
+                status_code=410,
+                detail=f"Sin cambios desde la versión {desde}, hace falta una descarga completa",
+            )
+        steps = steps[versions.index(desde):]
+
+    filtro, params = (" AND cpro = ?", [cpro]) if cpro is not None else ("", [])
+
+    def lines():
+        for step in steps:
+            for tabla, sql in CHANGE_TABLES.items():
+                for row in database.stream(
+                    sql.format(filtro=filtro), [step["desde"], *params], cpro=cpro
+                ):
+                    yield json.dumps({"tabla": tabla, **row}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get(
+    "/estado",
+    summary="Estado de disponibilidad de la API",
+    responses={
+        200: {"description": "La API está lista para atender peticiones"},
+        503: {"description": "La API está arrancando o ha fallado la inicialización"},
+    },
+)
+def get_estado():
+    """Devuelve el estado del arranque y la duración de cada fase de inicialización."""
+    report = profile.report()
+    if profile.ready:
+        dataset = database.get_dataset()
+        report["version"] = dataset.version
+        if dataset.shards is not None:
+            report["provincias"] = dataset.shards.report()
+        refinements = getattr(dataset.backend, "refinements", None)
+        if refinements is not None:
+            report["refinamiento"] = refinements.report()
+    if not profile.ready:
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+
+if config.METRICS:
+
+    @app.get(
+        "/metrics",
+        summary="Métricas en formato Prometheus",
+        response_class=PlainTextResponse,
+        include_in_schema=False,
+    )
+    def get_metrics():
+        """Devuelve las métricas de la API en formato de texto de Prometheus."""
+        return PlainTextResponse(
+            metrics.registry.render(),
+            media_type="text/plain; version=0.0.4; charset=utf-8",
+        )
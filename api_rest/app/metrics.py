@@ -0,0 +1,296 @@
+"""
+Métricas de la API en formato de texto de Prometheus (/metrics).
+
+Implementación mínima sin dependencias externas: contadores, gauges e
+histogramas con etiquetas protegidos por un lock, pensados para poder dejarse
+activos en producción. Por cada petición se mide:
+
+- la duración total por ruta (plantilla de la ruta, no la URL, para acotar las series)
+- el tiempo de ejecución en DuckDB y el de serialización JSON de la respuesta
+- el número de filas devueltas
+- las peticiones en curso
+
+Los tiempos de DuckDB y de serialización se acumulan en un objeto por petición
+guardado en una ContextVar, que FastAPI copia a los hilos del threadpool.
+"""
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from fastapi.responses import JSONResponse
+
+# Límites de los histogramas de latencia (segundos) y de filas
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+ROWS_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# Ruta usada para las peticiones que no coinciden con ningún endpoint
+UNMATCHED = "otros"
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda kv: tuple(map(str, kv[0])))
+            for values, value in items:
+                lines.extend(self._samples(values, value))
+        return lines
+
+    def _samples(self, values: tuple, value) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, values)} {_number(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value: float):
+        # Se guardan las cuentas por intervalo y se acumulan al renderizar
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def _samples(self, values: tuple, value) -> list[str]:
+        counts, total = value
+        names = self.label_names + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f"{self.name}_bucket{_labels(names, values + (le,))} {cumulative}")
+        labels = _labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas y de funciones que generan métricas al exportar."""
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors = []
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.add(
+    Counter("callejero_requests_total", "Peticiones atendidas", ("route", "status"))
+)
+REQUEST_SECONDS = registry.add(
+    Histogram("callejero_request_duration_seconds", "Duración total de la petición", ("route",))
+)
+DB_SECONDS = registry.add(
+    Histogram(
+        "callejero_db_duration_seconds", "Tiempo en DuckDB por petición", ("route",)
+    )
+)
+SERIALIZE_SECONDS = registry.add(
+    Histogram(
+        "callejero_serialize_duration_seconds",
+        "Tiempo de serialización JSON de la respuesta",
+        ("route",),
+    )
+)
+ROWS = registry.add(
+    Histogram(
+        "callejero_rows_returned", "Filas devueltas por petición", ("route",), buckets=ROWS_BUCKETS
+    )
+)
+IN_FLIGHT = registry.add(Gauge("callejero_requests_in_flight", "Peticiones en curso"))
+QUERIES = registry.add(Counter("callejero_db_queries_total", "Consultas ejecutadas en DuckDB"))
+DATASET_SWAPS = registry.add(
+    Counter("callejero_dataset_swaps_total", "Cambios de versión del callejero en caliente")
+)
+DB_WAITING = registry.add(
+    Gauge("callejero_db_queue_waiting", "Consultas esperando turno para ejecutarse")
+)
+DB_REJECTED = registry.add(
+    Counter(
+        "callejero_db_rejected_total",
+        "Consultas rechazadas con 503 por la cola de admisión",
+        ("reason",),
+    )
+)
+DB_TIMEOUTS = registry.add(
+    Counter("callejero_db_timeouts_total", "Consultas interrumpidas por superar su tiempo máximo")
+)
+COALESCED = registry.add(
+    Counter(
+        "callejero_db_queries_coalesced_total",
+        "Consultas que han esperado a otra idéntica en curso en lugar de ejecutarse",
+    )
+)
+COMPRESS_SECONDS = registry.add(
+    Counter(
+        "callejero_compress_cpu_seconds_total",
+        "Tiempo de CPU dedicado a comprimir respuestas",
+        ("encoding",),
+    )
+)
+COMPRESS_SAVED_BYTES = registry.add(
+    Counter(
+        "callejero_compress_saved_bytes_total",
+        "Bytes ahorrados al comprimir respuestas (incluidas las servidas desde la caché)",
+        ("encoding",),
+    )
+)
+FILTER_REJECTED = registry.add(
+    Counter(
+        "callejero_filter_rejected_total",
+        "Búsquedas descartadas por los filtros de existencia sin consultar DuckDB",
+        ("filtro",),
+    )
+)
+CACHE = registry.add(
+    Counter(
+        "callejero_cache_requests_total",
+        "Accesos a las cachés de la API por resultado (hit/miss)",
+        ("cache", "result"),
+    )
+)
+
+
+class RequestTimings:
+    """Tiempos acumulados durante una petición."""
+
+    __slots__ = ("db", "serialize", "rows")
+
+    def __init__(self):
+        self.db = 0.0
+        self.serialize = 0.0
+        self.rows: int | None = None
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("callejero_request", default=None)
+
+
+def record_query(seconds: float):
+    """Registra una consulta a DuckDB en la petición en curso."""
+    QUERIES.inc()
+    timings = _current.get()
+    if timings is not None:
+        timings.db += seconds
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE.inc(cache, "hit" if hit else "miss")
+
+
+class TimedJSONResponse(JSONResponse):
+    """Respuesta JSON que mide el tiempo de serialización y cuenta las filas."""
+
+    def render(self, content) -> bytes:
+        start = time.perf_counter()
+        body = super().render(content)
+        timings = _current.get()
+        if timings is not None:
+            timings.serialize += time.perf_counter() - start
+            if isinstance(content, list):
+                timings.rows = len(content)
+        return body
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("callejero_prewarm"):
+            # Las peticiones del precalentamiento (prewarm.py) no son tráfico real
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec()
+            _current.reset(token)
+            # FastAPI guarda en el scope la ruta que ha atendido la petición
+            route = scope.get("route")
+            path = getattr(route, "path", UNMATCHED)
+            REQUESTS.inc(path, status_code)
+            REQUEST_SECONDS.observe(path, value=elapsed)
+            DB_SECONDS.observe(path, value=timings.db)
+            SERIALIZE_SECONDS.observe(path, value=timings.serialize)
+            if timings.rows is not None:
+                ROWS.observe(path, value=timings.rows)
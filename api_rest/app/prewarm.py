@@ -0,0 +1,114 @@
+"""
+Precalentamiento de las cachés con las rutas más pedidas.
+
+El calentamiento de startup.py carga las columnas de la base de datos, pero las
+primeras peticiones reales de un contenedor nuevo siguen pagando la caché de
+páginas del índice de arrays, las cachés de refinamiento y de compresión vacías
+y la primera llamada de cada endpoint (FastAPI inspecciona su firma). Con
+CALLEJERO_PREWARM se lee un fichero de rutas calientes, generado a partir de los
+logs de acceso con scripts/hotkeys_callejero.py:
+
+    {"rutas": [{"ruta": "/cp/28001", "peticiones": 1234}, ...]}
+
+y durante el arranque, antes de declarar la API lista, cada ruta se atiende a
+través de la aplicación ASGI completa (middlewares incluidos), de la más pedida
+a la menos, hasta CALLEJERO_PREWARM_MAX rutas o CALLEJERO_PREWARM_SECONDS
+segundos. Estas peticiones no cuentan en las métricas de /metrics.
+"""
+
+import asyncio
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from . import config
+
+# Clave del scope ASGI que marca una petición de precalentamiento
+SCOPE_KEY = "callejero_prewarm"
+
+# Cabecera de un navegador: se calientan las respuestas comprimidas que se sirven
+ACCEPT_ENCODING = b"gzip, deflate, br"
+
+
+def load(path: str) -> list[str]:
+    """Rutas del fichero de rutas calientes, de la más pedida a la menos."""
+    data = json.loads(Path(path).read_text())
+    entries = sorted(data["rutas"], key=lambda e: e.get("peticiones", 0), reverse=True)
+    return [entry["ruta"] for entry in entries]
+
+
+def _scope(route: str) -> dict:
+    path, _, query = route.partition("?")
+    path = unquote("/api" + path)
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": quote(path).encode("ascii"),
+        "query_string": query.encode("latin-1"),
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"accept-encoding", ACCEPT_ENCODING)],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+        SCOPE_KEY: True,
+    }
+
+
+async def request(app, route: str) -> int:
+    """Atiende una ruta con la aplicación y devuelve el código de estado."""
+    status = 500
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(_scope(route), receive, send)
+    return status
+
+
+async def replay(app, routes: list[str], max_routes: int, seconds: float) -> Counter:
+    """Atiende las rutas por orden hasta agotar el número o el tiempo. Cuenta los estados."""
+    statuses: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    for route in routes[:max_routes]:
+        if time.perf_counter() >= deadline:
+            break
+        try:
+            statuses[await request(app, route)] += 1
+        except Exception as exc:
+            print(f"[WARN] Precalentamiento de {route}: {exc}")
+            statuses["error"] += 1
+    return statuses
+
+
+def prewarm(app) -> Counter:
+    """
+    Precalienta con el fichero CALLEJERO_PREWARM. Se ejecuta en el hilo de
+    inicialización, con su propio bucle de eventos. Un fichero inexistente o
+    inválido no impide que la API arranque.
+    """
+    try:
+        routes = load(config.PREWARM)
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        print(f"[WARN] No se pueden leer las rutas calientes de {config.PREWARM}: {exc}")
+        return Counter()
+    start = time.perf_counter()
+    statuses = asyncio.run(
+        replay(app, routes, config.PREWARM_MAX, config.PREWARM_SECONDS)
+    )
+    total = sum(statuses.values())
+    detail = ", ".join(f"{status}: {n}" for status, n in sorted(statuses.items(), key=str))
+    print(
+        f"[OK] Precalentadas {total} de {len(routes)} rutas en "
+        f"{time.perf_counter() - start:.3f} segundos ({detail or 'ninguna'})"
+    )
+    return statuses
@@ -0,0 +1,266 @@
+"""
+Perfil de Python de peticiones seleccionadas, en formato de pilas plegadas.
+
+El perfil de DuckDB (slowlog.py) no muestra el coste del lado de Python: la
+construcción de diccionarios, los bucles de .title() o la codificación JSON.
+Con CALLEJERO_PYPROFILE_DIR las rutas de la API se declaran con ProfiledRoute y
+una petición seleccionada se traza entera (dependencias, endpoint en el pool de
+hilos, serialización y codificación de la respuesta) con sys.setprofile, solo
+en los hilos y durante los intervalos en que se ejecuta esa petición.
+
+Una petición se selecciona con la cabecera `X-Callejero-Pyprofile` igual a
+CALLEJERO_PYPROFILE_TOKEN o al azar con probabilidad CALLEJERO_PYPROFILE_RATE.
+Como mucho se traza una petición cada CALLEJERO_PYPROFILE_INTERVAL segundos y
+nunca dos a la vez, de modo que puede quedar activo en producción.
+
+Cada perfil se escribe en un fichero `.folded` (una línea "pila;de;llamadas
+microsegundos" por pila, con el tiempo propio de la última función) que pueden
+leer flamegraph.pl, speedscope o inferno. El trazado añade sobrecoste a cada
+llamada, por lo que los tiempos absolutos están inflados y lo útil es la
+proporción entre funciones.
+"""
+
+import functools
+import hmac
+import inspect
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+
+from fastapi.routing import APIRoute
+
+from . import config
+
+HEADER = "x-callejero-pyprofile"
+
+# Sesión de perfil de la petición en curso, None si no se ha seleccionado
+_session: ContextVar["Session | None"] = ContextVar("callejero_pyprofile", default=None)
+
+_labels: dict = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        path = Path(code.co_filename)
+        label = f"{code.co_qualname} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+        _labels[code] = label = label.replace(";", ",")
+    return label
+
+
+def _c_label(func) -> str:
+    # Métodos (list.append, DuckDBPyConnection.execute) por su tipo y funciones
+    # (builtins.len) por su módulo
+    owner = getattr(func, "__self__", None)
+    name = getattr(func, "__name__", None) or repr(func)
+    if owner is not None and not isinstance(owner, types.ModuleType):
+        prefix = type(owner).__name__
+        if prefix.startswith("pybind11_"):
+            # Extensiones de pybind11 (DuckDB): el dueño es un registro interno
+            prefix = getattr(func, "__module__", None) or ""
+    else:
+        prefix = getattr(func, "__module__", None) or getattr(owner, "__name__", "")
+    return f"{prefix + '.' if prefix else ''}{name} [C]".replace(";", ",")
+
+
+class _Tracer:
+    """Función de sys.setprofile de un hilo: acumula el tiempo propio por pila."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.stacks: Counter = Counter()
+        # [pila hasta la función, inicio, tiempo de las llamadas hijas]
+        self._open: list = []
+        self._skip = False
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._skip and event == "c_call":
+            # La llamada que reanuda la corrutina (coroutine.send) no es de la petición
+            self._skip = False
+        elif event == "call" or event == "c_call":
+            parent = self._open[-1][0] if self._open else self.prefix
+            label = _label(frame.f_code) if event == "call" else _c_label(arg)
+            self._open.append([f"{parent};{label}", now, 0.0])
+        elif self._open:
+            # return, c_return o c_exception. Al empezar a trazar llegan retornos
+            # de funciones cuya llamada no se ha visto, se ignoran
+            stack, start, children = self._open.pop()
+            elapsed = now - start
+            self.stacks[stack] += elapsed - children
+            if self._open:
+                self._open[-1][2] += elapsed
+
+    def start(self, skip_call: bool = False):
+        self._skip = skip_call
+        sys.setprofile(self)
+
+    def stop(self):
+        sys.setprofile(None)
+        self._open.clear()
+
+
+class _Traced:
+    """
+    Ejecuta una corrutina trazando solo sus pasos: mientras espera, el bucle de
+    eventos atiende otras peticiones que no deben entrar en el perfil.
+    """
+
+    def __init__(self, coro, tracer: _Tracer):
+        self.coro = coro
+        self.tracer = tracer
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            self.tracer.start(skip_call=True)
+            try:
+                signal = self.coro.send(value) if error is None else self.coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.tracer.stop()
+            try:
+                value, error = (yield signal), None
+            except BaseException as exc:
+                value, error = None, exc
+
+
+class Session:
+    """Perfil de una petición: una traza por hilo que la ejecuta."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.tracers: list[_Tracer] = []
+        self.start = time.perf_counter()
+
+    def tracer(self, suffix: str = "") -> _Tracer:
+        tracer = _Tracer(self.name + suffix)
+        self.tracers.append(tracer)
+        return tracer
+
+    def folded(self) -> list[str]:
+        stacks = Counter()
+        for tracer in self.tracers:
+            stacks.update(tracer.stacks)
+        lines = []
+        for stack, seconds in sorted(stacks.items()):
+            micros = round(seconds * 1_000_000)
+            if micros > 0:
+                lines.append(f"{stack} {micros}")
+        return lines
+
+    def write(self, directory: str) -> Path:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^0-9A-Za-z]+", "_", self.name).strip("_")
+        path = path / f"{time.time_ns()}-{slug}.folded"
+        path.write_text("\n".join(self.folded()) + "\n")
+        return path
+
+
+class RateLimiter:
+    """Una sesión como mucho cada CALLEJERO_PYPROFILE_INTERVAL segundos y nunca dos a la vez."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last: float | None = None
+        self._active = False
+
+    def acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._active or (
+                self._last is not None and now - self._last < config.PYPROFILE_INTERVAL
+            ):
+                return False
+            self._active = True
+            self._last = now
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active = False
+
+
+limiter = RateLimiter()
+
+
+def selected(request) -> bool:
+    """Indica si la petición se traza: por cabecera autenticada o por muestreo."""
+    if not config.PYPROFILE_DIR:
+        return False
+    header = request.headers.get(HEADER)
+    wanted = bool(
+        header
+        and config.PYPROFILE_TOKEN
+        and hmac.compare_digest(header.encode(), config.PYPROFILE_TOKEN.encode())
+    )
+    if not wanted and not (config.PYPROFILE_RATE > 0 and random.random() < config.PYPROFILE_RATE):
+        return False
+    return limiter.acquire()
+
+
+def _traced_sync(endpoint):
+    # Los endpoints síncronos se ejecutan en el pool de hilos, que recibe una
+    # copia del contexto de la petición y por tanto su sesión
+    @functools.wraps(endpoint)
+    def traced(*args, **kwargs):
+        session = _session.get()
+        if session is None:
+            return endpoint(*args, **kwargs)
+        tracer = session.tracer(";[hilo]")
+        tracer.start()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            tracer.stop()
+
+    return traced
+
+
+class ProfiledRoute(APIRoute):
+    """Ruta que traza su manejador completo cuando la petición se selecciona."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _traced_sync(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        methods = ",".join(sorted(self.methods or ()))
+
+        async def profiled_handler(request):
+            if not selected(request):
+                return await handler(request)
+            session = Session(f"{methods} {self.path}")
+            token = _session.set(session)
+            response = None
+            try:
+                response = await _Traced(handler(request), session.tracer())
+                return response
+            finally:
+                _session.reset(token)
+                limiter.release()
+                path = session.write(config.PYPROFILE_DIR)
+                if response is not None:
+                    response.headers[HEADER] = path.name
+                record = {
+                    "nivel": "INFO",
+                    "evento": "perfil_python",
+                    "ruta": session.name,
+                    "ms": round((time.perf_counter() - session.start) * 1000, 3),
+                    "fichero": str(path),
+                    "ts": round(time.time(), 3),
+                }
+                print(json.dumps(record, ensure_ascii=False), flush=True)
+
+        return profiled_handler
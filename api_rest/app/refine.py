@@ -0,0 +1,88 @@
+"""
+Caché de refinamiento de las búsquedas de calles.
+
+El frontend pide /vias/{cpos}/{texto} en cada pulsación, y los resultados de
+"CERVA" son siempre un subconjunto de los de "CERV": cada palabra de la búsqueda
+más larga empieza por alguna palabra de la más corta. La caché guarda las
+últimas búsquedas de cada ámbito (código postal o unidad poblacional) con las
+palabras de cada vía, y una búsqueda que refina otra ya guardada se resuelve
+filtrando esas filas en memoria sin consultar DuckDB.
+
+El tamaño se limita en número de búsquedas (CALLEJERO_REFINE_CACHE) y se
+descartan las menos usadas. Los aciertos se publican en /metrics
+(callejero_cache_requests_total{cache="refinamiento"}) y en /estado.
+"""
+
+import threading
+from collections import OrderedDict
+
+from . import metrics
+from .tokens import alternatives
+
+
+def refines(search: list[str], base: tuple[str, ...]) -> bool:
+    """Indica si los resultados de `search` son un subconjunto de los de `base`."""
+    # Un término refina otro si cada uno de sus prefijos empieza por alguno del otro
+    return all(
+        any(
+            all(alt.startswith(alternatives(prefix)) for alt in alternatives(term))
+            for term in search
+        )
+        for prefix in base
+    )
+
+
+class RefinementCache:
+    """Búsquedas recientes por (ámbito, palabras) con las filas y sus palabras."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, list] = OrderedDict()
+        # Ámbito -> palabras de sus búsquedas guardadas
+        self._scopes: dict[tuple, set[tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, scope: tuple, search: list[str]) -> list | None:
+        """
+        Filas de la búsqueda guardada más restrictiva que `search` refina, o None.
+        Las filas deben filtrarse después con `search`.
+        """
+        if self.max_entries <= 0:
+            return None
+        best = None
+        with self._lock:
+            for base in self._scopes.get(scope, ()):
+                if refines(search, base):
+                    rows = self._entries[(scope, base)]
+                    if best is None or len(rows) < len(best[1]):
+                        best = (base, rows)
+            if best is not None:
+                self._entries.move_to_end((scope, best[0]))
+            self.stats["hits" if best is not None else "misses"] += 1
+        metrics.record_cache("refinamiento", best is not None)
+        return best[1] if best is not None else None
+
+    def put(self, scope: tuple, search: list[str], rows: list):
+        if self.max_entries <= 0:
+            return
+        key = (scope, tuple(search))
+        with self._lock:
+            self._entries[key] = rows
+            self._entries.move_to_end(key)
+            self._scopes.setdefault(scope, set()).add(key[1])
+            while len(self._entries) > self.max_entries:
+                (old_scope, old_search), _ = self._entries.popitem(last=False)
+                searches = self._scopes[old_scope]
+                searches.discard(old_search)
+                if not searches:
+                    del self._scopes[old_scope]
+
+    def report(self) -> dict:
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                "entradas": len(self._entries),
+                **self.stats,
+                "tasa_aciertos": round(self.stats["hits"] / total, 3) if total else None,
+            }
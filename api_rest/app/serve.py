@@ -0,0 +1,211 @@
+"""
+Servidor con varios procesos (pre-fork) que comparten el callejero de solo lectura.
+
+En Lambda cada instancia atiende una petición y basta un proceso de uvicorn. En
+un servidor propio con varias CPUs el GIL limita un proceso a un núcleo, así que
+`python -m app.serve` arranca CALLEJERO_WORKERS procesos (0: uno por CPU):
+
+- El proceso principal importa la aplicación, abre el socket y precarga en la
+  caché de páginas del sistema los ficheros del callejero (posix_fadvise).
+  Después crea los procesos con fork: el código importado se comparte por
+  copia en escritura y todos aceptan conexiones del mismo socket.
+- Cada proceso abre su conexión DuckDB de solo lectura (DuckDB no admite fork
+  con una base de datos abierta) y el índice de arrays con mmap. Las páginas
+  del fichero DuckDB y las del índice están una sola vez en la caché de páginas
+  del sistema; lo privado de cada proceso es el buffer de DuckDB, limitado con
+  el reparto de hilos y memoria de governor.duckdb_settings, y sus cachés.
+- El proceso principal sustituye los procesos que terminan y, con
+  CALLEJERO_WORKER_MAX_MB, los que superan ese tamaño de memoria privada (USS,
+  sin contar las páginas compartidas del fichero). El proceso sustituido deja
+  de aceptar conexiones y termina las peticiones en curso.
+
+Las cachés y las métricas de /metrics son de cada proceso.
+
+Con un solo proceso equivale a `uvicorn app.main:app`.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import time
+from pathlib import Path
+
+import uvicorn
+
+from . import config, governor
+
+# Segundos entre revisiones de la memoria de los procesos
+CHECK_SECONDS = 5
+
+# Un proceso que termina antes de este tiempo se considera un fallo de arranque
+# y se espera antes de sustituirlo para no entrar en un bucle
+MIN_UPTIME = 5
+
+# Cola de conexiones del socket, la misma que usa uvicorn por defecto
+BACKLOG = 2048
+
+
+def private_mb(pid: int) -> float | None:
+    """Memoria privada (USS) de un proceso en MB, o None si no se puede leer."""
+    try:
+        text = Path(f"/proc/{pid}/smaps_rollup").read_text()
+    except OSError:
+        return None
+    kb = 0
+    for line in text.splitlines():
+        if line.startswith(("Private_Clean:", "Private_Dirty:")):
+            kb += int(line.split()[1])
+    return kb / 1024
+
+
+def preload(paths: list[str]):
+    """Pide al sistema que lea los ficheros en la caché de páginas compartida."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        if not path or not os.path.isfile(path):
+            continue
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+
+def dataset_files() -> list[str]:
+    from . import database
+
+    path, lookup_path = database.initial_path()
+    if config.SHARDS_DIR:
+        return []
+    files = [path]
+    if config.BACKEND == "arrays":
+        files.append(lookup_path or config.LOOKUP_PATH)
+    else:
+        files.append(database.filters_path(path))
+    return files
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    # Las conexiones esperan en la cola del socket mientras arrancan los procesos
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def server(app, log_level: str) -> uvicorn.Server:
+    return uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+
+
+class Supervisor:
+    """Proceso principal: crea, vigila y sustituye los procesos de la API."""
+
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        # pid -> instante de arranque
+        self.children: dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, signal.SIG_DFL)
+            try:
+                server(self.app, self.log_level).run(sockets=[self.sock])
+            finally:
+                os._exit(0)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, sig, frame):
+        self.stopping = True
+
+    def check_memory(self):
+        # Como mucho se recicla un proceso por revisión, el mayor, para que el
+        # resto siga atendiendo mientras arranca su sustituto
+        if config.WORKER_MAX_MB <= 0:
+            return
+        sizes = {pid: private_mb(pid) or 0 for pid in self.children}
+        pid = max(sizes, key=sizes.get, default=None)
+        if pid is None or sizes[pid] <= config.WORKER_MAX_MB:
+            return
+        record = {
+            "nivel": "WARN",
+            "evento": "proceso_reciclado",
+            "pid": pid,
+            "memoria_privada_mb": round(sizes[pid], 1),
+            "limite_mb": config.WORKER_MAX_MB,
+            "ts": round(time.time(), 3),
+        }
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+        os.kill(pid, signal.SIGTERM)
+
+    def reap(self):
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            uptime = time.monotonic() - started
+            print(f"[WARN] Proceso {pid} terminado ({status}) tras {uptime:.1f} s, se sustituye")
+            if uptime < MIN_UPTIME:
+                time.sleep(1)
+            self.spawn()
+
+    def run(self):
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"[OK] {self.workers} procesos atendiendo en {self.sock.getsockname()}: {list(self.children)}")
+        last_check = time.monotonic()
+        while not self.stopping:
+            time.sleep(0.2)
+            self.reap()
+            if time.monotonic() - last_check >= CHECK_SECONDS:
+                self.check_memory()
+                last_check = time.monotonic()
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        while self.children:
+            pid, _ = os.wait()
+            self.children.pop(pid, None)
+        print("[INFO] Procesos terminados")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sirve la API con varios procesos")
+    parser.add_argument("--host", default=config.HOST)
+    parser.add_argument("--port", default=int(os.environ.get("PORT", 8000)), type=int)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    workers = governor.worker_count()
+    # La aplicación se importa antes de fork para compartir el código importado.
+    # No abre la base de datos hasta el lifespan o la primera consulta de cada proceso
+    from .main import app
+
+    sock = bind(args.host, args.port)
+    if workers == 1:
+        server(app, args.log_level).run(sockets=[sock])
+        return
+    preload(dataset_files())
+    print(f"[INFO] DuckDB por proceso: {governor.settings}")
+    Supervisor(app, sock, workers, args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Bases de datos por provincia adjuntadas bajo demanda.
+
+Cada consulta de la API afecta a una única provincia (por cpro, o por el prefijo
+del código postal, que en España coincide con el código de provincia). Con
+CALLEJERO_SHARDS el build genera un fichero NN.duckdb por provincia y la API los
+adjunta (ATTACH ... READ_ONLY) en el primer uso, manteniendo como máximo
+CALLEJERO_SHARDS_MAX abiertos y cerrando los menos usados recientemente.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import metrics
+
+
+def shard_name(cpro: int) -> str:
+    return f"{cpro:02d}.duckdb"
+
+
+def cpro_from_cpos(cpos: int) -> int:
+    """Código de provincia correspondiente a un código postal."""
+    return cpos // 1000
+
+
+class ShardManager:
+    """Adjunta y cierra los ficheros de provincia siguiendo una política LRU."""
+
+    def __init__(self, con, directory: str, max_open: int):
+        self.con = con
+        self.directory = Path(directory)
+        self.max_open = max(1, max_open)
+        # cpro -> número de consultas en curso, en orden de uso (el primero es el LRU)
+        self._open: OrderedDict[int, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "attach": 0, "detach": 0}
+
+    @staticmethod
+    def alias(cpro: int) -> str:
+        return f"p{cpro:02d}"
+
+    def exists(self, cpro: int) -> bool:
+        return (self.directory / shard_name(cpro)).exists()
+
+    def _evict(self, limit: int):
+        """Cierra provincias sin consultas en curso hasta quedar en `limit` abiertas."""
+        for cpro in list(self._open):
+            if len(self._open) <= limit:
+                break
+            if self._open[cpro] == 0:
+                self.con.execute(f"DETACH {self.alias(cpro)}")
+                del self._open[cpro]
+                self.stats["detach"] += 1
+
+    @contextmanager
+    def use(self, cpro: int):
+        """Adjunta la provincia si no lo está y la marca en uso durante el bloque."""
+        with self._lock:
+            if cpro in self._open:
+                self._open.move_to_end(cpro)
+                self.stats["hits"] += 1
+                metrics.record_cache("provincias", True)
+            else:
+                # Si todas están en uso se supera el límite temporalmente
+                self._evict(self.max_open - 1)
+                path = self.directory / shard_name(cpro)
+                self.con.execute(f"ATTACH '{path}' AS {self.alias(cpro)} (READ_ONLY)")
+                self._open[cpro] = 0
+                self.stats["attach"] += 1
+                metrics.record_cache("provincias", False)
+            self._open[cpro] += 1
+        try:
+            yield self.alias(cpro)
+        finally:
+            with self._lock:
+                self._open[cpro] -= 1
+                self._evict(self.max_open)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"abiertas": [f"{c:02d}" for c in self._open], **self.stats}
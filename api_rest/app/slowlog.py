@@ -0,0 +1,125 @@
+"""
+Registro de consultas lentas y perfil de consultas bajo demanda.
+
+Con CALLEJERO_SLOW_QUERY_MS activo cada consulta se ejecuta con el perfilado de
+DuckDB (`enable_profiling`), sin volver a ejecutarla, y cuando supera el umbral
+se escribe una línea JSON con el SQL, los parámetros y el resumen del perfil
+de esa misma ejecución (tiempo y filas por operador, filas escaneadas y bytes
+leídos). El perfilado añade un pequeño coste a todas las consultas, por eso
+está desactivado por defecto.
+
+Con CALLEJERO_PROFILE_HEADER activo, una petición con la cabecera
+`X-Callejero-Profile: 1` recibe en la cabecera del mismo nombre el perfil de
+todas las consultas que ha ejecutado.
+"""
+
+import json
+import time
+from contextvars import ContextVar
+
+from . import config
+
+HEADER = "x-callejero-profile"
+
+# Perfiles de las consultas de la petición en curso, None si no se han pedido
+_requested: ContextVar[list | None] = ContextVar("callejero_profile", default=None)
+
+
+def _operators(node: dict, out: list):
+    if node.get("operator_type") not in (None, "EXPLAIN_ANALYZE"):
+        out.append(
+            {
+                "operador": node["operator_type"],
+                "ms": round(node.get("operator_timing", 0) * 1000, 3),
+                "filas": node.get("operator_cardinality", 0),
+                "escaneadas": node.get("operator_rows_scanned", 0),
+            }
+        )
+    for child in node.get("children", []):
+        _operators(child, out)
+
+
+def summarize(plan: dict) -> dict:
+    """Resumen del perfil JSON de DuckDB: totales y operadores en preorden."""
+    operators = []
+    _operators(plan, operators)
+    return {
+        "ms": round(plan.get("latency", 0) * 1000, 3),
+        "escaneadas": plan.get("cumulative_rows_scanned", 0),
+        "bytes_leidos": plan.get("total_bytes_read", 0),
+        "operadores": operators,
+    }
+
+
+def enable(cur) -> bool:
+    """Activa el perfilado en el cursor si se registran las consultas lentas o la petición lo pide."""
+    if config.SLOW_QUERY_MS <= 0 and _requested.get() is None:
+        return False
+    # no_output: el perfil se guarda en la conexión en lugar de imprimirse
+    cur.execute("SET enable_profiling = 'no_output'")
+    return True
+
+
+def last_profile(cur) -> dict:
+    """Resumen del perfil de la última consulta ejecutada en el cursor."""
+    return summarize(json.loads(cur.get_profiling_information(format="json")))
+
+
+def inspect(cur, sql: str, params: list, seconds: float, cpro: int | None = None):
+    """
+    Registra el perfil de la consulta recién ejecutada en un cursor con el
+    perfilado activo (ver enable) si es lenta o si la petición lo ha pedido.
+    """
+    requested = _requested.get()
+    slow = config.SLOW_QUERY_MS > 0 and seconds * 1000 >= config.SLOW_QUERY_MS
+    if not slow and requested is None:
+        return
+    try:
+        summary = last_profile(cur)
+    except Exception as exc:
+        summary = {"error": str(exc)}
+    if requested is not None:
+        requested.append(summary)
+    if slow:
+        record = {
+            "nivel": "WARN",
+            "evento": "consulta_lenta",
+            "ms": round(seconds * 1000, 3),
+            "umbral_ms": config.SLOW_QUERY_MS,
+            "cpro": cpro,
+            "sql": " ".join(sql.split()),
+            "params": params,
+            "perfil": summary,
+            "ts": round(time.time(), 3),
+        }
+        print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+class ProfileHeaderMiddleware:
+    """Devuelve el perfil de las consultas a las peticiones que lo piden por cabecera."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+            name == HEADER.encode() and value.strip() not in (b"", b"0")
+            for name, value in scope["headers"]
+        ):
+            return await self.app(scope, receive, send)
+
+        profiles: list = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                value = json.dumps(profiles, separators=(",", ":"))
+                message["headers"] = list(message.get("headers", [])) + [
+                    (HEADER.encode(), value.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = _requested.set(profiles)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _requested.reset(token)
@@ -0,0 +1,111 @@
+"""
+Perfilado del arranque de la API y estado de disponibilidad.
+
+El arranque se desglosa en fases (imports, apertura de la base de datos, primera
+consulta y calentamiento) para poder medir el coste de un cold start en Lambda.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Estados posibles del arranque
+STARTING = "iniciando"
+WARMING = "calentando"
+READY = "listo"
+FAILED = "error"
+
+
+class StartupProfile:
+    """Registro de fases del arranque con su duración en segundos."""
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.state = STARTING
+        self.error: str | None = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            # Solo se guarda la primera medición de cada fase
+            self.phases.setdefault(name, seconds)
+        print(f"[INFO] Arranque: {name} en {seconds:.3f} segundos")
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def set_state(self, state: str, error: str | None = None):
+        with self._lock:
+            self.state = state
+            self.error = error
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "estado": self.state,
+                "error": self.error,
+                "fases": {name: round(s, 4) for name, s in self.phases.items()},
+                "uptime": round(time.perf_counter() - self.created, 3),
+            }
+
+
+profile = StartupProfile()
+
+
+# Consultas representativas de las búsquedas más frecuentes. Se ejecutan durante el
+# calentamiento para cargar en memoria las páginas de las columnas implicadas. Se usan
+# parámetros como en las peticiones reales, ya que el primer enlace de parámetros de
+# DuckDB tiene un coste propio (importa de forma perezosa módulos de Python).
+# Con la base de datos dividida por provincias solo se calienta la más consultada
+WARMUP_CPRO = 28
+WARMUP_QUERIES = [
+    (
+        "SELECT COUNT(*), MIN(cpos), MAX(cpro), MAX(cmun), MAX(cun_var) FROM TRAM WHERE cpos >= ?",
+        [0],
+    ),
+    (
+        "SELECT COUNT(DISTINCT nentsic), MAX(LENGTH(nviac)), MAX(cvia_var) FROM TRAM WHERE cpro >= ?",
+        [0],
+    ),
+    ("SELECT COUNT(*), MAX(cvia_var), COUNT(DISTINCT tvia) FROM VIAS WHERE cpro >= ?", [0]),
+    (
+        """
+        SELECT cpos, cpro, cmun, FLOOR(cun_var / 1000) as cun, NENTSIC
+        FROM TRAM WHERE cpos = ?
+        GROUP BY cpos, cpro, cmun, FLOOR(cun_var / 1000), NENTSIC
+        """,
+        [28001],
+    ),
+]
+WARMUP_CP = 28001
+WARMUP_SEARCH = "MAYOR"
+
+
+def warmup(query):
+    """Ejecuta las consultas de calentamiento con la función de consulta indicada."""
+    # backend.py importa este módulo
+    import duckdb
+
+    from .backend import JERARQUIA_SQL, VIAS_SCAN_SQL, search_query
+    from .tokens import terms
+
+    for sql, params in WARMUP_QUERIES:
+        query(sql, params, cpro=WARMUP_CPRO)
+    # Las mismas consultas que los endpoints de jerarquía y de búsqueda de calles
+    query(JERARQUIA_SQL, ["cp", WARMUP_CP], cpro=WARMUP_CPRO)
+    sql, params = search_query("cp", WARMUP_CP, terms(WARMUP_SEARCH))
+    try:
+        query(sql, params, cpro=WARMUP_CPRO)
+    except duckdb.CatalogException:
+        # Base de datos sin índice de palabras: la búsqueda recorre las vías
+        query(VIAS_SCAN_SQL["cp"], [WARMUP_CP], cpro=WARMUP_CPRO)
@@ -0,0 +1,148 @@
+"""
+Tests de los cambios entre versiones del callejero (/cambios)
+"""
+
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+
+from . import config, database, governor
+from .governor import Admission
+from .main import app
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+from diff_callejero import compute_changes  # noqa: E402
+
+client = TestClient(app)
+
+
+def make_version(path, version, changes=()):
+    """Copia la base de datos de tests con su versión y los cambios indicados"""
+    shutil.copy(config.DB_PATH, path)
+    con = duckdb.connect(str(path))
+    con.execute("CREATE OR REPLACE TABLE VERSION AS SELECT ? AS version", [version])
+    for sql in changes:
+        con.execute(sql)
+    return con
+
+
+CHANGES_202507 = [
+    # Vía renombrada, vía dada de baja y tramo con un código postal nuevo
+    "UPDATE TRAM SET nviac = 'MAYOR NUEVA' WHERE cpro = 28 AND cmun = 79 AND cvia_var = 1",
+    "DELETE FROM TRAM WHERE cpro = 28 AND cmun = 79 AND cvia_var = 5",
+    "UPDATE TRAM SET cpos = 28099 WHERE cpro = 28 AND cmun = 79 AND cvia_var = 4",
+]
+
+
+@pytest.fixture
+def versions(tmp_path, monkeypatch):
+    make_version(tmp_path / "anterior.duckdb", "202501").close()
+    con = make_version(tmp_path / "nueva.duckdb", "202507", CHANGES_202507)
+    counts = compute_changes(con, str(tmp_path / "anterior.duckdb"), catalog="nueva")
+    con.close()
+    monkeypatch.setattr(database, "_current", database.open_dataset(str(tmp_path / "nueva.duckdb")))
+    yield counts
+    database._current.close()
+
+
+def lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_compute_changes(versions):
+    """Prueba que se calculan los cambios de vías y códigos postales"""
+    assert versions["CAMBIOS_VIAS"] == 2
+    assert versions["CAMBIOS_UNIDADES"] == 0
+    vias = {row["cvia"]: row for row in database.query("SELECT * FROM CAMBIOS_VIAS", [])}
+    assert vias[1]["tipo"] == "nombre"
+    assert (vias[1]["nviac_anterior"], vias[1]["nviac"]) == ("MAYOR", "MAYOR NUEVA")
+    assert vias[5]["tipo"] == "baja" and vias[5]["nviac"] is None
+    cp = database.query("SELECT tipo, cpos FROM CAMBIOS_CP WHERE cvia = 4", [])
+    assert {row["cpos"] for row in cp if row["tipo"] == "alta"} == {28099}
+    assert 28001 in {row["cpos"] for row in cp if row["tipo"] == "baja"}
+
+
+def test_cambios_stream(versions):
+    """Prueba que los cambios se devuelven en NDJSON con la tabla de cada línea"""
+    response = client.get("/api/cambios", params={"desde": "202501"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.headers["x-callejero-version"] == "202507"
+    rows = lines(response)
+    assert len(rows) == versions["CAMBIOS_VIAS"] + versions["CAMBIOS_CP"]
+    assert [row["tabla"] for row in rows] == sorted(
+        (row["tabla"] for row in rows), key=["vias", "cp", "unidades"].index
+    )
+    assert all(row["desde"] == "202501" and row["hasta"] == "202507" for row in rows)
+
+
+def test_cambios_provincia(versions):
+    """Prueba el filtro por provincia"""
+    assert len(lines(client.get("/api/cambios", params={"desde": "202501", "cpro": 28}))) > 0
+    response = client.get("/api/cambios", params={"desde": "202501", "cpro": 8})
+    assert response.status_code == 200
+    assert response.text == ""
+
+
+def test_cambios_version_actual(versions):
+    """Prueba que desde la versión activa no hay cambios"""
+    response = client.get("/api/cambios", params={"desde": "202507"})
+    assert response.status_code == 200
+    assert response.text == ""
+
+
+def test_cambios_version_desconocida(versions):
+    """Prueba que una versión sin cambios publicados exige una descarga completa"""
+    assert client.get("/api/cambios", params={"desde": "202401"}).status_code == 410
+    assert client.get("/api/cambios", params={"desde": "2025"}).status_code == 422
+
+
+def test_cambios_historico(tmp_path, versions):
+    """Prueba que la versión siguiente conserva los cambios anteriores"""
+    database._current.close()
+    con = make_version(
+        tmp_path / "siguiente.duckdb",
+        "202601",
+        CHANGES_202507 + ["UPDATE TRAM SET nentsic = 'MADRID NUEVA' WHERE nentsic = 'MADRID'"],
+    )
+    counts = compute_changes(con, str(tmp_path / "nueva.duckdb"), catalog="siguiente")
+    con.close()
+    assert counts["CAMBIOS_VIAS"] == 0 and counts["CAMBIOS_UNIDADES"] > 0
+    database._current = database.open_dataset(str(tmp_path / "siguiente.duckdb"))
+
+    rows = lines(client.get("/api/cambios", params={"desde": "202501"}))
+    assert [row["desde"] for row in rows] == sorted(row["desde"] for row in rows)
+    assert {row["hasta"] for row in rows} == {"202507", "202601"}
+    rows = lines(client.get("/api/cambios", params={"desde": "202507"}))
+    assert {row["tabla"] for row in rows} == {"unidades"}
+
+
+def test_cambios_sin_tablas():
+    """Prueba que sin tablas de cambios se devuelve 404"""
+    assert client.get("/api/cambios", params={"desde": "202501"}).status_code == 404
+
+
+def test_cambios_admission(versions, monkeypatch):
+    """Prueba que las consultas en streaming pasan por la admisión"""
+    admission = Admission(max_running=1, max_waiting=0, wait_timeout=1)
+    monkeypatch.setattr(governor, "admission", admission)
+    slots = []
+    slot = admission.slot
+
+    def counted():
+        slots.append(1)
+        return slot()
+
+    monkeypatch.setattr(admission, "slot", counted)
+    rows = lines(client.get("/api/cambios", params={"desde": "202501"}))
+    assert rows
+    # La consulta de versiones y una por tabla de cambios
+    assert len(slots) == 1 + 3
+    assert admission.running == 0
+    with slot():
+        assert client.get("/api/cambios", params={"desde": "202501"}).status_code == 503
@@ -0,0 +1,99 @@
+"""
+Tests de la agrupación de consultas idénticas concurrentes
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from . import config, database, metrics
+from .coalesce import SingleFlight, normalize
+from .main import app
+
+client = TestClient(app)
+
+BURST = 8
+
+
+@pytest.fixture
+def executions(monkeypatch):
+    """Cuenta las ejecuciones en DuckDB, que se ralentizan para que se solapen"""
+    calls = []
+    execute = database._execute
+
+    def slow_execute(cur, sql, params):
+        calls.append(params)
+        time.sleep(0.3)
+        return execute(cur, sql, params)
+
+    monkeypatch.setattr(database, "_execute", slow_execute)
+    return calls
+
+
+def burst(fn, args_list):
+    barrier = threading.Barrier(len(args_list))
+
+    def call(args):
+        barrier.wait()
+        return fn(*args)
+
+    with ThreadPoolExecutor(len(args_list)) as pool:
+        return list(pool.map(call, args_list))
+
+
+def test_normalize():
+    """Prueba que los espacios no cambian la clave de la consulta"""
+    assert normalize("SELECT *\n   FROM TRAM\tWHERE cpos = ?  ") == "SELECT * FROM TRAM WHERE cpos = ?"
+
+
+def test_burst_same_request(executions):
+    """Prueba que una ráfaga de peticiones idénticas ejecuta una sola consulta"""
+    before = metrics.COALESCED._values.get((), 0)
+    responses = burst(client.get, [("/api/cp/280",)] * BURST)
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.text for response in responses}) == 1
+    assert len(executions) == 1
+    assert metrics.COALESCED._values.get((), 0) - before == BURST - 1
+
+
+def test_burst_different_keys(executions):
+    """Prueba que las consultas con parámetros distintos no se agrupan"""
+    sql = "SELECT cpos FROM TRAM WHERE cpos BETWEEN ? AND ? GROUP BY cpos"
+    args = [(sql, [28000 + i, 28999], 28) for i in range(4)]
+    burst(database.query, args)
+    assert len(executions) == 4
+
+
+def test_coalesce_disabled(executions, monkeypatch):
+    """Prueba que sin CALLEJERO_COALESCE cada petición ejecuta su consulta"""
+    monkeypatch.setattr(config, "COALESCE", False)
+    burst(client.get, [("/api/cp/280",)] * 4)
+    assert len(executions) == 4
+
+
+def test_error_shared():
+    """Prueba que la excepción de la consulta en curso llega a todas las que esperan"""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("fallo")
+
+    def call():
+        try:
+            flight.do(("clave",), failing)
+        except ValueError as exc:
+            return str(exc)
+
+    with ThreadPoolExecutor(3) as pool:
+        first = pool.submit(call)
+        started.wait()
+        others = [pool.submit(call) for _ in range(2)]
+        results = [first.result()] + [f.result() for f in others]
+    assert results == ["fallo"] * 3
+    assert flight.in_flight() == 0
@@ -0,0 +1,202 @@
+"""
+Tests de la compresión de respuestas
+"""
+
+import gzip
+import threading
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from . import compression, database, metrics
+from .compression import CompressionMiddleware, negotiate
+from .main import app
+
+client = TestClient(app)
+
+
+def make_client(min_bytes=1024, cache_entries=16, **kwargs):
+    mini = FastAPI()
+    mini.add_middleware(
+        CompressionMiddleware, min_bytes=min_bytes, cache_entries=cache_entries, **kwargs
+    )
+    mini.state.calls = []
+
+    @mini.get("/grande")
+    def grande():
+        mini.state.calls.append("grande")
+        return [{"cpos": 28000 + i, "nentsic": "MADRID"} for i in range(200)]
+
+    @mini.get("/pequena")
+    def pequena():
+        return {"cpos": 28001}
+
+    @mini.get("/estado")
+    def estado():
+        mini.state.calls.append("estado")
+        return [{"peticiones": len(mini.state.calls)}] * 100
+
+    @mini.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a" * 2000, b"b" * 2000]), media_type="text/plain")
+
+    mini.state.loop_thread = None
+
+    @mini.get("/async")
+    async def asincrono():
+        mini.state.loop_thread = threading.get_ident()
+        return [{"cpos": 28000 + i} for i in range(200)]
+
+    return TestClient(mini)
+
+
+def test_negotiate(monkeypatch):
+    """Prueba la elección de codificación según Accept-Encoding y sus pesos"""
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate("gzip, deflate, br") == "gzip"
+    assert negotiate("br") is None
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("*") == "gzip"
+    assert negotiate("") is None
+    monkeypatch.setattr(compression, "brotli", object())
+    assert negotiate("gzip, br") == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5") == "gzip"
+
+
+def test_compressed_response():
+    """Prueba que las respuestas grandes se comprimen con gzip y se pueden descomprimir"""
+    response = client.get("/api/provincias/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()) == 52
+
+
+def app_cache() -> compression.CompressedCache:
+    """Caché de la compresión de la aplicación, desactivada por defecto"""
+    # La caché solo se usa con el dataset abierto
+    database.get_dataset()
+    client.get("/api/estado")
+    layer = app.middleware_stack
+    while not isinstance(layer, CompressionMiddleware):
+        layer = layer.app
+    return layer.cache
+
+
+def test_cached_response_headers(monkeypatch):
+    """Prueba que una respuesta de la caché lleva las cabeceras una sola vez"""
+    monkeypatch.setattr(app_cache(), "max_entries", 16)
+    before = metrics.CACHE._values.get(("compresion", "hit"), 0)
+    for _ in range(3):
+        response = client.get("/api/provincias/", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "," not in response.headers["x-callejero-version"]
+        assert len(response.json()) == 52
+    assert metrics.CACHE._values.get(("compresion", "hit"), 0) - before == 2
+
+
+def test_cache_keeps_lazy_open(monkeypatch):
+    """Prueba que la caché no abre la base de datos ni guarda respuestas sin ella"""
+    cache = app_cache()
+    monkeypatch.setattr(cache, "max_entries", 16)
+    monkeypatch.setattr(database, "_current", None)
+    entries = len(cache)
+    response = client.get("/api/autonomias/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert database._current is None
+    assert len(cache) == entries
+
+
+def test_identity_and_threshold():
+    """Prueba que no se comprime sin Accept-Encoding ni por debajo del umbral, pero se indica Vary"""
+    mini = make_client()
+    response = mini.get("/grande", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    response = mini.get("/pequena", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    response = mini.get("/stream", headers={"Accept-Encoding": "identity"})
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_cache_hits(monkeypatch):
+    """Prueba que las respuestas repetidas se sirven desde la caché sin ejecutar el endpoint"""
+    mini = make_client()
+    calls = []
+    original = compression.compress
+
+    def counting(body, encoding):
+        calls.append(encoding)
+        return original(body, encoding)
+
+    monkeypatch.setattr(compression, "compress", counting)
+    before = metrics.CACHE._values.get(("compresion", "hit"), 0)
+    for _ in range(3):
+        response = mini.get("/grande", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()) == 200
+    assert calls == ["gzip"]
+    assert mini.app.state.calls == ["grande"]
+    assert metrics.CACHE._values.get(("compresion", "hit"), 0) - before == 2
+    assert metrics.COMPRESS_SAVED_BYTES._values[("gzip",)] > 0
+    assert ("gzip",) in metrics.COMPRESS_SECONDS._values
+
+    # Otra query string u otra versión de los datos son otra entrada
+    mini.get("/grande?x=1", headers={"Accept-Encoding": "gzip"})
+    assert len(mini.app.state.calls) == 2
+    version = ["202501"]
+    mini = make_client(version=lambda: version[0])
+    mini.get("/grande", headers={"Accept-Encoding": "gzip"})
+    version[0] = "202507"
+    mini.get("/grande", headers={"Accept-Encoding": "gzip"})
+    assert len(mini.app.state.calls) == 2
+
+
+def test_uncached_routes():
+    """Prueba que las rutas que cambian sin cambiar la versión no se guardan"""
+    mini = make_client(uncached=("/estado",))
+    first = mini.get("/estado", headers={"Accept-Encoding": "gzip"})
+    second = mini.get("/estado", headers={"Accept-Encoding": "gzip"})
+    assert second.headers["content-encoding"] == "gzip"
+    assert first.json() != second.json()
+
+
+def test_compress_off_event_loop(monkeypatch):
+    """Prueba que la compresión no se ejecuta en el hilo del bucle de eventos"""
+    mini = make_client()
+    threads = []
+    original = compression.compress
+
+    def recording(body, encoding):
+        threads.append(threading.get_ident())
+        return original(body, encoding)
+
+    monkeypatch.setattr(compression, "compress", recording)
+    response = mini.get("/async", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert threads and mini.app.state.loop_thread not in threads
+
+
+def test_min_bytes():
+    """Prueba el umbral configurable de tamaño"""
+    mini = make_client(min_bytes=10)
+    assert mini.get("/pequena").headers["content-encoding"] == "gzip"
+    mini = make_client(min_bytes=100_000)
+    assert "content-encoding" not in mini.get("/grande").headers
+
+
+def test_streaming_not_compressed():
+    """Prueba que las respuestas en streaming se envían sin comprimir"""
+    mini = make_client(min_bytes=10)
+    response = mini.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "a" * 2000 + "b" * 2000
+
+
+def test_gzip_deterministic():
+    """Prueba que el mismo cuerpo produce los mismos bytes comprimidos"""
+    body = b'[{"cpos": 28001}]' * 100
+    assert compression.compress(body, "gzip") == compression.compress(body, "gzip")
+    assert gzip.decompress(compression.compress(body, "gzip")) == body
@@ -0,0 +1,110 @@
+"""
+Tests de las versiones del callejero sustituibles en caliente
+"""
+
+import shutil
+
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+
+from . import config, database
+from .datasets import DatasetWatcher, find_latest
+from .main import app
+
+client = TestClient(app)
+
+
+def make_version(directory, version, nentsic="MADRID"):
+    """Copia la base de datos de tests como una versión, con otro nombre de núcleo"""
+    path = directory / f"callejero-{version}.duckdb"
+    shutil.copy(config.DB_PATH, path)
+    con = duckdb.connect(str(path))
+    # La base de datos del build ya tiene su propia tabla VERSION
+    con.execute("CREATE OR REPLACE TABLE VERSION AS SELECT ? AS version", [version])
+    con.execute("UPDATE TRAM SET nentsic = ? WHERE nentsic = 'MADRID'", [nentsic])
+    con.close()
+    return path
+
+
+@pytest.fixture
+def datasets_dir(tmp_path, monkeypatch):
+    make_version(tmp_path, "202501")
+    monkeypatch.setattr(config, "DATASETS_DIR", str(tmp_path))
+    monkeypatch.setattr(database, "_current", None)
+    yield tmp_path
+    if database._current is not None:
+        database._current.close()
+
+
+def nombres(response):
+    return {item["nentsic"] for item in response.json()}
+
+
+def test_find_latest(tmp_path):
+    """Prueba que se elige la versión mayor e ignora otros ficheros"""
+    assert find_latest(str(tmp_path)) is None
+    for name in ["callejero-202501.duckdb", "callejero-202507.duckdb", "otro.duckdb"]:
+        (tmp_path / name).touch()
+    (tmp_path / "callejero-202601.duckdb.tmp").touch()
+    assert find_latest(str(tmp_path)).endswith("callejero-202507.duckdb")
+
+
+def test_version_header(datasets_dir):
+    """Prueba que la versión activa se devuelve en la cabecera y en /estado"""
+    response = client.get("/api/cp/28001")
+    assert response.headers["x-callejero-version"] == "202501"
+    assert client.get("/api/estado").json()["version"] == "202501"
+
+
+def test_hot_swap(datasets_dir):
+    """Prueba que una versión nueva se activa sin reiniciar y la anterior se cierra"""
+    assert "MADRID" in nombres(client.get("/api/cp/28001"))
+    old = database.get_dataset()
+    watcher = DatasetWatcher(str(datasets_dir), interval=60)
+    assert watcher.check() is False
+
+    make_version(datasets_dir, "202507", nentsic="MADRID NUEVA")
+    assert watcher.check() is True
+    response = client.get("/api/cp/28001")
+    assert response.headers["x-callejero-version"] == "202507"
+    assert "MADRID NUEVA" in nombres(response)
+    assert old.closed
+    # Una versión menor que la activa no se vuelve a activar
+    assert watcher.check() is False
+    assert "callejero_dataset_info{version=\"202507\"} 1" in client.get("/api/metrics").text
+
+
+def test_swap_drains_in_flight(datasets_dir):
+    """Prueba que la versión sustituida no se cierra hasta terminar sus peticiones"""
+    old = database.get_dataset()
+    old.acquire()
+    make_version(datasets_dir, "202507")
+    assert DatasetWatcher(str(datasets_dir), interval=60).check() is True
+    assert not old.closed
+    assert database.query("SELECT COUNT(*) AS n FROM TRAM", [], dataset=old)[0]["n"] > 0
+    old.release()
+    assert old.closed
+
+
+def test_invalid_version_ignored(datasets_dir):
+    """Prueba que un fichero que no se puede abrir no sustituye a la versión activa"""
+    client.get("/api/cp/28001")
+    (datasets_dir / "callejero-202507.duckdb").write_bytes(b"no es una base de datos")
+    watcher = DatasetWatcher(str(datasets_dir), interval=60)
+    assert watcher.check() is False
+    assert watcher.check() is False
+    assert client.get("/api/cp/28001").headers["x-callejero-version"] == "202501"
+
+
+def test_version_table(tmp_path):
+    """Prueba que la tabla VERSION del build tiene prioridad sobre el nombre"""
+    path = make_version(tmp_path, "202501")
+    con = duckdb.connect(str(path))
+    con.execute("CREATE OR REPLACE TABLE VERSION AS SELECT '202507' AS version")
+    con.close()
+    dataset = database.open_dataset(str(path))
+    try:
+        assert dataset.version == "202507"
+    finally:
+        dataset.close()
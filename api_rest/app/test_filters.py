@@ -0,0 +1,129 @@
+"""
+Tests de los filtros de existencia: descartan sin consultar y nunca descartan
+una búsqueda con resultados
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from . import backend, config, database, metrics, tokens
+from .backend import DuckDBBackend
+from .filters import Filters, build, open_filters
+from .lookup import TOKEN_INDEXES
+from .main import app
+
+client = TestClient(app)
+
+GARBAGE = ["ZQX", "XXYYZ", "QWRTP", "JJJJ", "KZKZ", "WXWXW", "ÑÑÑÑ", "PLAZA ZZQQ"]
+
+
+@pytest.fixture(scope="module")
+def filters(tmp_path_factory):
+    path = tmp_path_factory.mktemp("filtros") / "callejero.filters"
+    build(config.DB_PATH, str(path))
+    filters = Filters(str(path))
+    yield filters
+    filters.close()
+
+
+@pytest.fixture
+def filtered(filters, monkeypatch):
+    """La API con el backend de DuckDB y los filtros"""
+    monkeypatch.setattr(database.get_dataset(), "filters", filters)
+    backend.set_backend(DuckDBBackend(filters))
+    yield filters
+    backend.set_backend(None)
+
+
+@pytest.fixture(scope="module")
+def streets():
+    """(ámbito, palabras) de cada vía, como las indexa la búsqueda de calles"""
+    con = database.get_connection()
+    rows = []
+    for name, scope in (("vias_cp", "cp"), ("vias_unidad", "unidad")):
+        columns, sql = TOKEN_INDEXES[name]
+        names = [col for col, _, _ in columns]
+        for row in con.execute(sql).fetchall():
+            texts = (row[names.index("tvia") + 1], row[names.index("nviac") + 1], *(row[-1] or []))
+            words = tokens.tokens(*filter(None, texts))
+            if scope == "cp":
+                rows.append((("cp", row[0]), words))
+            else:
+                cpro, cmun, cun = (row[names.index(col) + 1] for col in ("cpro", "cmun", "cun"))
+                rows.append((("unidad", cpro, cmun, cun), words))
+    return rows
+
+
+def test_keys(filters):
+    """Prueba que todas las claves existentes pasan el filtro y las inventadas no"""
+    con = database.get_connection()
+    for (cpos,) in con.execute("SELECT DISTINCT cpos FROM TRAM").fetchall():
+        assert filters.has_cp(cpos)
+        prefix = f"{cpos:05d}"[:3]
+        assert filters.has_cp_range(int(prefix.ljust(5, "0")), int(prefix.ljust(5, "9")))
+    for cpro, cmun, cun in con.execute("SELECT DISTINCT cpro, cmun, cun_var FROM TRAM").fetchall():
+        assert filters.has_municipio(cpro, cmun)
+        assert filters.has_unidad(cpro, cmun, cun)
+    assert not filters.has_cp(99999)
+    assert not filters.has_cp_range(99900, 99999)
+    assert not filters.has_municipio(52, 999)
+    assert not filters.has_unidad(28, 79, 9999999)
+
+
+def test_no_false_negatives(filters, streets):
+    """Prueba que cualquier prefijo de cualquier palabra de una vía pasa el filtro de su ámbito"""
+    for scope, words in streets:
+        for word in words:
+            for n in range(1, len(word) + 1):
+                assert filters.may_match(scope, [word[:n]])
+        assert filters.may_match(scope, sorted(words))
+        # Una abreviatura a medio escribir pasa por su forma completa
+        if "PLAZA" in words:
+            assert filters.may_match(scope, ["PZA"])
+
+
+def test_garbage_rejected(filters, streets):
+    """Prueba que las búsquedas sin resultados se descartan casi siempre"""
+    scopes = {scope for scope, _ in streets}
+    checks = [(scope, tokens.terms(text)) for scope in scopes for text in GARBAGE]
+    passed = sum(filters.may_match(scope, terms) for scope, terms in checks)
+    assert passed <= len(checks) * 0.05
+    assert not filters.may_match(("cp", 99999), ["MAYOR"])
+
+
+def test_same_results(filters, streets):
+    """Prueba que el backend con filtros devuelve lo mismo que sin ellos"""
+    plain, filtered = DuckDBBackend(), DuckDBBackend(filters)
+    texts = GARBAGE + ["MAYOR", "CALLE MAY", "PLAZA", "AV CONSTITUCION", "DEL", "CONSTITUCION PZA"]
+    for scope in sorted({scope for scope, _ in streets}):
+        for text in texts:
+            if scope[0] == "cp":
+                assert filtered.vias_by_cpos(scope[1], text) == plain.vias_by_cpos(scope[1], text)
+            else:
+                assert filtered.vias_by_cun(*scope[1:], text) == plain.vias_by_cun(*scope[1:], text)
+    for cpos in (28001, 99999):
+        assert filtered.poblaciones_by_cp(cpos) == plain.poblaciones_by_cp(cpos)
+        assert filtered.jerarquia_by_cp(cpos) == plain.jerarquia_by_cp(cpos)
+
+
+def test_api_rejects_without_query(filtered):
+    """Prueba que la API responde 404 a claves inexistentes sin consultar DuckDB"""
+    before = metrics.QUERIES._values.get((), 0)
+    rejected = metrics.FILTER_REJECTED._values.get(("cp",), 0)
+    assert client.get("/api/cp/99999").status_code == 404
+    assert client.get("/api/cp/999").status_code == 404
+    assert client.get("/api/vias/99999/MAYOR").status_code == 404
+    assert client.get("/api/cp/28/79/9999999").status_code == 404
+    assert client.get("/api/52/999").status_code == 404
+    assert metrics.QUERIES._values.get((), 0) == before
+    assert metrics.FILTER_REJECTED._values.get(("cp",), 0) == rejected + 2
+    # Las claves existentes se siguen consultando
+    assert client.get("/api/cp/28001").status_code == 200
+    assert client.get("/api/cp/280").status_code == 200
+    assert metrics.QUERIES._values.get((), 0) > before
+
+
+def test_missing_file(tmp_path):
+    """Prueba que sin fichero de filtros no se filtra"""
+    assert open_filters(str(tmp_path / "no-existe.filters")) is None
+    assert open_filters("") is None
@@ -0,0 +1,146 @@
+"""
+Tests de los límites de recursos de DuckDB
+"""
+
+import threading
+import time
+
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+
+from . import config, database, governor, metrics
+from .governor import Admission, Overloaded, QueryTimeout
+from .main import app
+
+client = TestClient(app)
+
+# Sin Accept-Encoding la respuesta nunca sale de la caché de compresión, que no
+# pasa por la admisión ni por el plazo de las consultas
+IDENTITY = {"Accept-Encoding": "identity"}
+
+SLOW_SQL = "SELECT count(*) AS n FROM range(10000000000) t WHERE t.range % 7 = 3"
+
+
+def test_lambda_settings(monkeypatch):
+    """Prueba que hilos y memoria se calculan a partir de la memoria de Lambda"""
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "1024")
+    monkeypatch.setattr(config, "DB_THREADS", 0)
+    monkeypatch.setattr(config, "DB_MEMORY", "")
+    assert governor.container_memory() == 1024 * 1024 * 1024
+    assert governor.container_cpus() == 1
+    assert governor.duckdb_settings() == {"threads": 1, "memory_limit": "512MB"}
+
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "3008")
+    assert governor.container_cpus() == 2
+
+
+def test_worker_settings(monkeypatch):
+    """Prueba que con varios procesos cada uno recibe su parte de hilos y memoria"""
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "10240")
+    monkeypatch.setattr(config, "DB_THREADS", 0)
+    monkeypatch.setattr(config, "DB_MEMORY", "")
+    monkeypatch.setattr(config, "WORKERS", 2)
+    assert governor.duckdb_settings() == {"threads": 3, "memory_limit": "2560MB"}
+    # Con 0 se arranca un proceso por CPU, cada uno con un hilo
+    monkeypatch.setattr(config, "WORKERS", 0)
+    assert governor.worker_count() == 6
+    assert governor.duckdb_settings() == {"threads": 1, "memory_limit": "853MB"}
+
+
+def test_explicit_settings(monkeypatch):
+    """Prueba que las variables de entorno tienen prioridad sobre los límites detectados"""
+    monkeypatch.setattr(config, "DB_THREADS", 3)
+    monkeypatch.setattr(config, "DB_MEMORY", "300MB")
+    assert governor.duckdb_settings() == {"threads": 3, "memory_limit": "300MB"}
+    monkeypatch.setattr(governor, "settings", governor.duckdb_settings())
+    con = duckdb.connect()
+    governor.configure(con)
+    assert con.execute("SELECT current_setting('threads')").fetchone()[0] == 3
+    con.close()
+
+
+def test_deadline_interrupts():
+    """Prueba que una consulta que supera su plazo se interrumpe"""
+    con = duckdb.connect()
+    cur = con.cursor()
+    before = metrics.DB_TIMEOUTS._values.get((), 0)
+    start = time.perf_counter()
+    with pytest.raises(QueryTimeout):
+        with governor.deadline(cur, 0.1):
+            cur.execute(SLOW_SQL).fetchall()
+    assert time.perf_counter() - start < 2
+    assert metrics.DB_TIMEOUTS._values.get((), 0) == before + 1
+    # El cursor de una consulta que termina a tiempo no se interrumpe después
+    with governor.deadline(cur, 0.1):
+        assert cur.execute("SELECT 1").fetchone() == (1,)
+    time.sleep(0.2)
+    assert cur.execute("SELECT 2").fetchone() == (2,)
+    con.close()
+
+
+def test_timeout_response(monkeypatch):
+    """Prueba que una consulta cancelada por tiempo devuelve 504"""
+    execute = database._execute
+    monkeypatch.setattr(database, "_execute", lambda cur, sql, params: execute(cur, SLOW_SQL, []))
+    monkeypatch.setattr(config, "QUERY_TIMEOUT_MS", 100)
+    response = client.get("/api/cp/280", headers=IDENTITY)
+    assert response.status_code == 504
+
+
+def test_admission_queue():
+    """Prueba que la cola de admisión espera turno y rechaza cuando está llena"""
+    admission = Admission(max_running=1, max_waiting=1, wait_timeout=1)
+    release = threading.Event()
+    order = []
+
+    def holder():
+        with admission.slot():
+            order.append("primera")
+            release.wait()
+
+    def waiter():
+        with admission.slot():
+            order.append("segunda")
+
+    threads = [threading.Thread(target=holder), threading.Thread(target=waiter)]
+    threads[0].start()
+    while admission.running == 0:
+        time.sleep(0.01)
+    threads[1].start()
+    while admission.waiting == 0:
+        time.sleep(0.01)
+    # Con una consulta en curso y otra esperando se rechaza sin esperar
+    start = time.perf_counter()
+    with pytest.raises(Overloaded):
+        with admission.slot():
+            pass
+    assert time.perf_counter() - start < 0.1
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert order == ["primera", "segunda"]
+    assert admission.running == 0 and admission.waiting == 0
+
+
+def test_overloaded_response(monkeypatch):
+    """Prueba que con la admisión saturada se devuelve 503 en poco tiempo"""
+    admission = Admission(max_running=1, max_waiting=0, wait_timeout=1)
+    monkeypatch.setattr(governor, "admission", admission)
+    before = metrics.DB_REJECTED._values.get(("cola_llena",), 0)
+    with admission.slot():
+        response = client.get("/api/cp/280", headers=IDENTITY)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert metrics.DB_REJECTED._values.get(("cola_llena",), 0) == before + 1
+    assert client.get("/api/cp/280", headers=IDENTITY).status_code == 200
+
+
+def test_wait_timeout():
+    """Prueba que la espera en la cola está acotada"""
+    admission = Admission(max_running=1, max_waiting=5, wait_timeout=0.05)
+    with admission.slot():
+        with pytest.raises(Overloaded):
+            with admission.slot():
+                pass
+    assert admission.waiting == 0
@@ -0,0 +1,206 @@
+"""
+Tests del backend de arrays: las respuestas deben ser idénticas a las de DuckDB
+"""
+
+from array import array
+
+import pytest
+from fastapi.testclient import TestClient
+
+from . import backend, config, database, indexfile
+from .backend import DuckDBBackend
+from .lookup import ArrayBackend, IntervalIndex, build
+from .main import app
+
+client = TestClient(app)
+
+
+def normalize(items):
+    """Las consultas sin ORDER BY no garantizan orden, se comparan ordenadas"""
+    return sorted(items, key=lambda item: sorted(item.items(), key=str))
+
+
+@pytest.fixture(scope="module")
+def arrays(tmp_path_factory):
+    path = tmp_path_factory.mktemp("lookup") / "callejero.idx"
+    build(config.DB_PATH, str(path))
+    backend = ArrayBackend(str(path))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture(scope="module")
+def keys():
+    con = database.get_connection()
+    return {
+        "cpro": [r[0] for r in con.execute("SELECT DISTINCT cpro FROM TRAM").fetchall()],
+        "cpos": [r[0] for r in con.execute("SELECT DISTINCT cpos FROM TRAM").fetchall()],
+        "municipio": con.execute("SELECT DISTINCT cpro, cmun FROM TRAM").fetchall(),
+        "unidad": con.execute("SELECT DISTINCT cpro, cmun, cun_var FROM TRAM").fetchall(),
+        "via": con.execute("SELECT DISTINCT cpro, cmun, cvia_var FROM NUMEROS").fetchall(),
+    }
+
+
+def test_poblaciones_by_cpro_identical(arrays, keys):
+    """Prueba que /poblaciones/{cpro} devuelve lo mismo (y en el mismo orden) con ambos backends"""
+    duck = DuckDBBackend()
+    for cpro in keys["cpro"] + [53]:
+        assert arrays.poblaciones_by_cpro(cpro) == duck.poblaciones_by_cpro(cpro)
+
+
+def test_poblaciones_by_cp_identical(arrays, keys):
+    """Prueba que /cp/{cpos} completo devuelve lo mismo con ambos backends"""
+    duck = DuckDBBackend()
+    for cpos in keys["cpos"] + [99999, 1]:
+        assert normalize(arrays.poblaciones_by_cp(cpos)) == normalize(
+            duck.poblaciones_by_cp(cpos)
+        )
+
+
+def test_localidades_identical(arrays, keys):
+    """Prueba que /{cpro}/{cmun} devuelve lo mismo con ambos backends"""
+    duck = DuckDBBackend()
+    for cpro, cmun in keys["municipio"] + [(28, 999)]:
+        assert normalize(arrays.localidades_by_cpro_cmun(cpro, cmun)) == normalize(
+            duck.localidades_by_cpro_cmun(cpro, cmun)
+        )
+
+
+def test_interval_index_overlapping():
+    """Prueba que se encuentran los intervalos anidados o solapados que empiezan antes"""
+    # (inicio, fin) ordenados por inicio: [1, 99] contiene a los demás
+    intervals = [(1, 99), (1, 9), (11, 19), (15, 41), (21, 29), (101, 109)]
+    starts = array("q", [start for start, _ in intervals])
+    ends = array("q", [end for _, end in intervals])
+    max_ends = array("q")
+    for end in ends:
+        max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+    index = IntervalIndex(starts, ends, max_ends, [("n", array("i", range(len(intervals))), int)], [])
+
+    def found(value, lower=0):
+        return [row["n"] for row in index.containing(value, lower)]
+
+    for value in range(0, 112):
+        expected = [n for n, (start, end) in enumerate(intervals) if start <= value <= end]
+        assert found(value) == expected
+    assert found(25) == [0, 3, 4]
+    # Los intervalos que empiezan antes de `lower` son de otra vía
+    assert found(25, lower=11) == [3, 4]
+
+
+def test_cp_by_cun_identical(arrays, keys):
+    """Prueba que /cp/{cpro}/{cmun}/{cun} devuelve lo mismo con ambos backends"""
+    duck = DuckDBBackend()
+    for cpro, cmun, cun in keys["unidad"] + [(28, 79, 99999)]:
+        assert normalize(arrays.cp_by_cun(cpro, cmun, cun)) == normalize(
+            duck.cp_by_cun(cpro, cmun, cun)
+        )
+
+
+def test_tramo_by_numero_identical(arrays, keys):
+    """Prueba que /numero/... devuelve lo mismo (y en el mismo orden) con ambos backends"""
+    duck = DuckDBBackend()
+    for cpro, cmun, cvia in keys["via"] + [(28, 79, 99999)]:
+        for numero in [1, 2, 3, 18, 19, 20, 21, 22, 39, 40, 41, 42, 60, 61, 9999]:
+            assert arrays.tramo_by_numero(cpro, cmun, cvia, numero) == duck.tramo_by_numero(
+                cpro, cmun, cvia, numero
+            )
+
+
+def test_vias_identical(arrays, keys):
+    """Prueba que la búsqueda de calles por palabras devuelve lo mismo con ambos backends"""
+    duck = DuckDBBackend()
+    textos = ["MAYOR", "CALLE MAY", "PZA CONSTITUCION", "de la", "GRAN VIA", "NO EXISTE", "---"]
+    textos += ["ROSALES", "URB ROSALES MAYOR", "POLIGONO NORTE", "CONSTITUCION PZA", "PL"]
+    for texto in textos:
+        for cpos in keys["cpos"] + [99999]:
+            assert arrays.vias_by_cpos(cpos, texto) == duck.vias_by_cpos(cpos, texto)
+        for cpro, cmun, cun in keys["unidad"] + [(28, 79, 99999)]:
+            assert arrays.vias_by_cun(cpro, cmun, cun, texto) == duck.vias_by_cun(
+                cpro, cmun, cun, texto
+            )
+
+
+def test_jerarquia_identical(arrays, keys):
+    """Prueba que /jerarquia devuelve el mismo JSON con ambos backends"""
+    duck = DuckDBBackend()
+    for cpos in keys["cpos"] + [99999]:
+        assert arrays.jerarquia_by_cp(cpos) == duck.jerarquia_by_cp(cpos)
+    for cpro, cmun in keys["municipio"] + [(28, 999)]:
+        assert arrays.jerarquia_by_municipio(cpro, cmun) == duck.jerarquia_by_municipio(cpro, cmun)
+
+
+def test_api_responses_identical(arrays):
+    """Prueba que las respuestas JSON de la API son idénticas con ambos backends"""
+    endpoints = [
+        "/api/poblaciones/28",
+        "/api/cp/28001",
+        "/api/28/79",
+        "/api/cp/99999",
+        "/api/numero/28/79/1/24",
+        "/api/vias/28001/CALLE MAYOR",
+        "/api/vias/28/79/1000/PLAZA",
+        "/api/jerarquia/28/79",
+        "/api/jerarquia/cp/28001",
+    ]
+    previous = backend._backend
+    try:
+        backend.set_backend(DuckDBBackend())
+        expected = [client.get(e) for e in endpoints]
+        backend.set_backend(arrays)
+        for endpoint, response in zip(endpoints, expected):
+            actual = client.get(endpoint)
+            assert actual.status_code == response.status_code
+            if isinstance(response.json(), list):
+                assert normalize(actual.json()) == normalize(response.json())
+            else:
+                assert actual.json() == response.json()
+    finally:
+        backend.set_backend(previous)
+
+
+# ============================================================
+# Tests del formato de índice binario
+# ============================================================
+
+
+def test_indexfile_roundtrip(tmp_path):
+    """Prueba que las secciones se leen con el mismo tipo y contenido con que se escriben"""
+    from array import array
+
+    path = str(tmp_path / "test.idx")
+    offsets, data = indexfile.string_pool(["MADRID", "ÁLAVA", ""])
+    indexfile.write(
+        path,
+        {
+            "q": array("q", [1, 2**40, -1]),
+            "h": array("h", [7, 8, 9]),
+            "vacia": array("i"),
+            "s.offsets": offsets,
+            "s.data": data,
+        },
+    )
+    index = indexfile.IndexFile(path)
+    try:
+        assert list(index["q"]) == [1, 2**40, -1]
+        assert list(index["h"]) == [7, 8, 9]
+        assert len(index["vacia"]) == 0
+        strings = index.strings("s")
+        assert [strings[i] for i in range(len(strings))] == ["MADRID", "ÁLAVA", ""]
+    finally:
+        index.close()
+
+
+def test_indexfile_rejects_invalid(tmp_path):
+    """Prueba que se rechazan ficheros que no son índices o están truncados"""
+    from array import array
+
+    path = tmp_path / "test.idx"
+    path.write_bytes(b"NOINDICE" + b"\0" * 64)
+    with pytest.raises(ValueError):
+        indexfile.IndexFile(str(path))
+
+    indexfile.write(str(path), {"q": array("q", range(100))})
+    path.write_bytes(path.read_bytes()[:-16])
+    with pytest.raises(ValueError):
+        indexfile.IndexFile(str(path))
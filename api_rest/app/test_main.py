@@ -406,6 +406,128 @@ def test_get_by_cun_not_found():
     assert "Sin resultados" in response.json()["detail"]
 
 
+# ============================================================
+# Tests para /numero/{cpro}/{cmun}/{cvia}/{numero}
+# ============================================================
+
+
+def test_get_tramo_by_numero_valid():
+    """Prueba que el tramo devuelto contiene el número con su misma paridad"""
+    for numero in (1, 2, 15, 24):
+        response = client.get(f"/api/numero/28/79/1/{numero}")
+        assert response.status_code in [200, 404]
+        if response.status_code == 200:
+            for item in response.json():
+                assert item["ein"] <= numero <= item["esn"]
+                assert item["tinum"] == (1 if numero % 2 else 2)
+                assert (item["cpro"], item["cmun"], item["cvia"]) == (28, 79, 1)
+                assert item["seccion"].startswith("28079")
+                assert len(item["seccion"]) == 10
+
+
+def test_get_tramo_by_numero_invalid():
+    """Prueba que devuelve error 422 para números fuera de rango"""
+    assert client.get("/api/numero/28/79/1/0").status_code == 422
+    assert client.get("/api/numero/28/79/1/10000").status_code == 422
+
+
+def test_get_tramo_by_numero_not_found():
+    """Prueba que devuelve 404 para una vía inexistente"""
+    response = client.get("/api/numero/28/79/99999/1")
+    assert response.status_code == 404
+
+
+# ============================================================
+# Tests para /jerarquia
+# ============================================================
+
+
+def test_get_jerarquia_by_municipio_valid():
+    """Prueba que la jerarquía del municipio incluye autonomía, provincia y unidades"""
+    response = client.get("/api/jerarquia/28/79")
+    assert response.status_code in [200, 404]
+    if response.status_code == 200:
+        assert response.headers["content-type"] == "application/json"
+        data = response.json()
+        assert data["autonomia"] == {"CCOM": "13", "AUTO": "MADRID"}
+        assert data["provincia"] == {"CODPRO": "28", "PRO": "MADRID"}
+        assert (data["cpro"], data["cmun"]) == (28, 79)
+        assert data["cps"] == sorted(data["cps"])
+        assert all("cun" in u and "nentsic" in u for u in data["unidades"])
+        assert data["vias"] > 0
+
+
+def test_get_jerarquia_by_cp_valid():
+    """Prueba que la jerarquía del código postal agrupa sus municipios"""
+    response = client.get("/api/jerarquia/cp/28001")
+    assert response.status_code in [200, 404]
+    if response.status_code == 200:
+        data = response.json()
+        assert data["cpos"] == 28001
+        for municipio in data["municipios"]:
+            assert municipio["provincia"]["CODPRO"] == "28"
+            assert municipio["unidades"]
+
+
+def test_get_jerarquia_consistent_with_catalogo():
+    """Prueba que los códigos postales de la jerarquía coinciden con /{cpro}/{cmun}"""
+    response = client.get("/api/jerarquia/28/79")
+    if response.status_code == 200:
+        cps = {item["cpos"] for item in client.get("/api/28/79").json()}
+        assert set(response.json()["cps"]) == cps
+
+
+def test_get_jerarquia_invalid():
+    """Prueba que devuelve 422 para códigos fuera de rango"""
+    assert client.get("/api/jerarquia/cp/999").status_code == 422
+    assert client.get("/api/jerarquia/53/1").status_code == 422
+
+
+def test_get_jerarquia_not_found():
+    """Prueba que devuelve 404 para municipios y códigos postales inexistentes"""
+    assert client.get("/api/jerarquia/28/9999").status_code == 404
+    assert client.get("/api/jerarquia/cp/99999").status_code == 404
+
+
+# ============================================================
+# Tests para /estado
+# ============================================================
+
+
+def test_get_estado_ready():
+    """Prueba que /estado indica que la API está lista e incluye las fases del arranque"""
+    client.get("/api/cp/28001")
+    response = client.get("/api/estado")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["estado"] == "listo"
+    assert "imports" in data["fases"]
+    assert "db_open" in data["fases"]
+    assert "first_query" in data["fases"]
+
+
+def test_get_estado_not_ready():
+    """Prueba que /estado devuelve 503 mientras la API está calentando"""
+    from .startup import profile, READY, WARMING
+
+    profile.set_state(WARMING)
+    try:
+        response = client.get("/api/estado")
+        assert response.status_code == 503
+        assert response.json()["estado"] == "calentando"
+    finally:
+        profile.set_state(READY)
+
+
+def test_warmup_queries():
+    """Prueba que las consultas de calentamiento se ejecutan sin error"""
+    from . import database
+    from .startup import warmup
+
+    warmup(database.query)
+
+
 # ============================================================
 # Tests de integración
 # ============================================================
@@ -0,0 +1,81 @@
+"""
+Tests del endpoint de métricas
+"""
+
+from fastapi.testclient import TestClient
+
+from . import config
+from .main import app
+from .metrics import Histogram
+
+client = TestClient(app)
+
+
+def samples(text: str) -> dict[str, float]:
+    """Convierte la salida de /metrics en un diccionario serie -> valor"""
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            result[name] = float(value)
+    return result
+
+
+def test_histogram_render():
+    """Prueba que los intervalos del histograma son acumulados"""
+    histogram = Histogram("prueba_seconds", "Prueba", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe("/a", value=value)
+    lines = histogram.render()
+    assert lines[1] == "# TYPE prueba_seconds histogram"
+    assert 'prueba_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'prueba_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'prueba_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'prueba_seconds_sum{route="/a"} 6.05' in lines
+    assert 'prueba_seconds_count{route="/a"} 4' in lines
+
+
+def test_metrics_requests():
+    """Prueba que se registran las peticiones por plantilla de ruta"""
+    before = samples(client.get("/api/metrics").text)
+    client.get("/api/poblaciones/28")
+    client.get("/api/poblaciones/1")
+    client.get("/api/cp/99999")
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = samples(response.text)
+
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    route = 'route="/poblaciones/{cpro}"'
+    assert delta(f"callejero_requests_total{{{route},status=\"200\"}}") == 2
+    assert delta(f"callejero_request_duration_seconds_count{{{route}}}") == 2
+    assert delta(f"callejero_rows_returned_count{{{route}}}") == 2
+    assert delta(f"callejero_serialize_duration_seconds_sum{{{route}}}") > 0
+    assert delta('callejero_requests_total{route="/cp/{cpos}",status="404"}') == 1
+    # La propia petición a /metrics está en curso al exportar
+    assert after["callejero_requests_in_flight"] == 1
+
+
+def test_metrics_db_time(monkeypatch):
+    """Prueba que el tiempo en DuckDB se separa del de serialización"""
+    monkeypatch.setattr(config, "REFINE_CACHE", 0)
+    before = samples(client.get("/api/metrics").text)
+    client.get("/api/vias/28001/MAYOR")
+    after = samples(client.get("/api/metrics").text)
+
+    route = 'route="/vias/{cpos}/{nviac}"'
+    db = f"callejero_db_duration_seconds_sum{{{route}}}"
+    assert after[db] - before.get(db, 0) > 0
+    assert after["callejero_db_queries_total"] > before.get("callejero_db_queries_total", 0)
+
+
+def test_metrics_unmatched_route():
+    """Prueba que las rutas inexistentes se agrupan en una sola serie"""
+    client.get("/api/no/existe/ruta/alguna/x")
+    text = client.get("/api/metrics").text
+    assert 'callejero_requests_total{route="otros",status="404"}' in text
+    assert "/no/existe" not in text
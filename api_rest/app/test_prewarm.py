@@ -0,0 +1,91 @@
+"""
+Tests del precalentamiento con las rutas calientes
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from . import config, main, prewarm
+from .backend import get_backend
+from .main import app
+from .startup import profile, READY
+
+client = TestClient(app)
+
+ROUTES = [
+    {"ruta": "/vias/28001/MAYOR", "peticiones": 10},
+    {"ruta": "/cp/28001", "peticiones": 50},
+    {"ruta": "/provincias/", "peticiones": 30},
+    {"ruta": "/cp/99999", "peticiones": 1},
+]
+
+
+@pytest.fixture
+def hotkeys(tmp_path, monkeypatch):
+    path = tmp_path / "hotkeys.json"
+    path.write_text(json.dumps({"rutas": ROUTES}))
+    monkeypatch.setattr(config, "PREWARM", str(path))
+    monkeypatch.setattr(config, "PREWARM_MAX", 500)
+    monkeypatch.setattr(config, "PREWARM_SECONDS", 5)
+    return path
+
+
+def requests_total() -> float:
+    lines = client.get("/api/metrics").text.splitlines()
+    return sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in lines
+        if line.startswith("callejero_requests_total{")
+    )
+
+
+def test_load_order(hotkeys):
+    """Prueba que las rutas se atienden de la más pedida a la menos"""
+    assert prewarm.load(str(hotkeys)) == [
+        "/cp/28001",
+        "/provincias/",
+        "/vias/28001/MAYOR",
+        "/cp/99999",
+    ]
+
+
+def test_prewarm_replays_routes(hotkeys):
+    """Prueba que las rutas se atienden con la aplicación y llenan la caché de refinamiento"""
+    before = requests_total()
+    statuses = prewarm.prewarm(app)
+    assert statuses == {200: 3, 404: 1}
+    # La búsqueda de calles queda en la caché de refinamiento
+    refinements = get_backend().refinements
+    hits = refinements.stats["hits"]
+    assert get_backend().vias_by_cpos(28001, "MAYOR")
+    assert refinements.stats["hits"] == hits + 1
+    # Las peticiones del precalentamiento no cuentan como tráfico, solo la
+    # primera petición a /metrics
+    assert requests_total() == before + 1
+
+
+def test_prewarm_limits(hotkeys):
+    """Prueba que se respetan el número máximo de rutas y el tiempo"""
+    config.PREWARM_MAX = 2
+    assert sum(prewarm.prewarm(app).values()) == 2
+    config.PREWARM_SECONDS = 0
+    assert prewarm.prewarm(app) == {}
+
+
+def test_prewarm_invalid_file(tmp_path, monkeypatch, capsys):
+    """Prueba que un fichero inexistente o inválido no impide el arranque"""
+    monkeypatch.setattr(config, "PREWARM", str(tmp_path / "no-existe.json"))
+    assert prewarm.prewarm(app) == {}
+    (tmp_path / "malo.json").write_text("[1, 2]")
+    monkeypatch.setattr(config, "PREWARM", str(tmp_path / "malo.json"))
+    assert prewarm.prewarm(app) == {}
+    assert capsys.readouterr().out.count("[WARN]") == 2
+
+
+def test_initialize_with_prewarm(hotkeys):
+    """Prueba que la API se declara lista después del precalentamiento"""
+    main.initialize()
+    assert profile.state == READY
+    assert "prewarm" in profile.report()["fases"]
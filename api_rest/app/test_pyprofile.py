@@ -0,0 +1,114 @@
+"""
+Tests del perfil de Python de peticiones seleccionadas
+"""
+
+import pytest
+from fastapi import FastAPI, HTTPException, Path
+from fastapi.testclient import TestClient
+
+from . import config, pyprofile
+from .pyprofile import HEADER, ProfiledRoute
+
+
+def capitalize(items):
+    return [{**item, "nvia": item["nvia"].title()} for item in items]
+
+
+@pytest.fixture
+def profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "PYPROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "PYPROFILE_TOKEN", "secreto")
+    monkeypatch.setattr(config, "PYPROFILE_RATE", 0)
+    monkeypatch.setattr(config, "PYPROFILE_INTERVAL", 0)
+    monkeypatch.setattr(pyprofile, "limiter", pyprofile.RateLimiter())
+
+    mini = FastAPI()
+    mini.router.route_class = ProfiledRoute
+
+    @mini.get("/vias/{cpos}")
+    def vias(cpos: int = Path(..., ge=1000)):
+        """Vías de un código postal"""
+        if cpos == 99999:
+            raise HTTPException(status_code=404, detail="Sin resultados")
+        return capitalize([{"cpos": cpos, "nvia": f"CALLE {i}"} for i in range(50)])
+
+    @mini.get("/async")
+    async def asincrono():
+        return {"ok": True}
+
+    return TestClient(mini), tmp_path
+
+
+def stacks(path):
+    lines = path.read_text().splitlines()
+    parsed = [line.rsplit(" ", 1) for line in lines]
+    assert all(int(micros) > 0 for _, micros in parsed)
+    return [stack.split(";") for stack, _ in parsed]
+
+
+def test_profile_by_header(profiled):
+    """Prueba que la cabecera con el secreto traza el endpoint y la serialización"""
+    client, out = profiled
+    response = client.get("/vias/28001", headers={HEADER: "secreto"})
+    assert response.status_code == 200
+    assert len(response.json()) == 50
+    files = list(out.glob("*.folded"))
+    assert [f.name for f in files] == [response.headers[HEADER]]
+
+    frames = stacks(files[0])
+    assert all(stack[0] == "GET /vias/{cpos}" for stack in frames)
+    # El endpoint síncrono se ejecuta en el pool de hilos
+    endpoint = [stack for stack in frames if stack[1] == "[hilo]"]
+    assert any(any(frame.startswith("capitalize (") for frame in stack) for stack in endpoint)
+    assert any("str.title [C]" in stack for stack in endpoint)
+    # La codificación JSON de la respuesta se ejecuta en el bucle de eventos
+    assert any(any(frame.startswith("dumps (") for frame in stack) for stack in frames)
+
+
+def test_not_selected(profiled):
+    """Prueba que sin cabecera, con otro secreto o sin secreto configurado no se traza"""
+    client, out = profiled
+    assert HEADER not in client.get("/vias/28001").headers
+    assert HEADER not in client.get("/vias/28001", headers={HEADER: "otro"}).headers
+    config.PYPROFILE_TOKEN = ""
+    assert HEADER not in client.get("/vias/28001", headers={HEADER: ""}).headers
+    assert list(out.glob("*.folded")) == []
+
+
+def test_sampling_rate(profiled):
+    """Prueba que con CALLEJERO_PYPROFILE_RATE se trazan peticiones sin cabecera"""
+    client, out = profiled
+    config.PYPROFILE_RATE = 1
+    assert HEADER in client.get("/vias/28001").headers
+    assert HEADER in client.get("/async").headers
+    assert len(list(out.glob("*.folded"))) == 2
+
+
+def test_rate_limited(profiled):
+    """Prueba que como mucho se traza una petición por intervalo"""
+    client, out = profiled
+    config.PYPROFILE_INTERVAL = 60
+    responses = [client.get("/vias/28001", headers={HEADER: "secreto"}) for _ in range(3)]
+    assert [HEADER in r.headers for r in responses] == [True, False, False]
+    assert len(list(out.glob("*.folded"))) == 1
+
+
+def test_errors_profiled(profiled):
+    """Prueba que un error HTTP se devuelve igual y deja su perfil"""
+    client, out = profiled
+    response = client.get("/vias/99999", headers={HEADER: "secreto"})
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Sin resultados"}
+    assert len(list(out.glob("*.folded"))) == 1
+    # La sesión se libera para la siguiente petición
+    assert client.get("/vias/28001", headers={HEADER: "secreto"}).status_code == 200
+    assert len(list(out.glob("*.folded"))) == 2
+
+
+def test_openapi_unchanged(profiled):
+    """Prueba que la envoltura del endpoint conserva parámetros y documentación"""
+    client, _ = profiled
+    operation = client.get("/openapi.json").json()["paths"]["/vias/{cpos}"]["get"]
+    assert operation["description"] == "Vías de un código postal"
+    assert operation["parameters"][0]["name"] == "cpos"
+    assert client.get("/vias/10").status_code == 422
@@ -0,0 +1,79 @@
+"""
+Tests del servidor con varios procesos
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from . import serve
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+pytestmark = pytest.mark.skipif(
+    not Path("/proc/self/task").exists() or not hasattr(os, "fork"),
+    reason="Requiere fork y /proc",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid: int) -> list[int]:
+    text = Path(f"/proc/{pid}/task/{pid}/children").read_text()
+    return [int(child) for child in text.split()]
+
+
+def get(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status
+    except OSError:
+        return 0
+
+
+def test_private_memory():
+    """Prueba que se lee la memoria privada de un proceso"""
+    assert serve.private_mb(os.getpid()) > 0
+    assert serve.private_mb(2**22 + 1) is None
+
+
+def test_workers():
+    """Prueba que los procesos comparten el socket y terminan con el principal"""
+    port = free_port()
+    env = {**os.environ, "CALLEJERO_WORKERS": "2", "PYTHONPATH": str(API_DIR)}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR / "app",
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 20
+        while get(f"http://127.0.0.1:{port}/api/estado") != 200:
+            assert time.monotonic() < deadline, "El servidor no ha arrancado"
+            time.sleep(0.1)
+        assert len(children(proc.pid)) == 2
+        assert all(get(f"http://127.0.0.1:{port}/api/autonomias/") == 200 for _ in range(10))
+
+        # Un proceso que termina se sustituye
+        killed = children(proc.pid)[0]
+        os.kill(killed, signal.SIGKILL)
+        deadline = time.monotonic() + 5
+        while killed in children(proc.pid) or len(children(proc.pid)) < 2:
+            assert time.monotonic() < deadline, "No se ha sustituido el proceso"
+            time.sleep(0.1)
+        assert get(f"http://127.0.0.1:{port}/api/autonomias/") == 200
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=20) == 0
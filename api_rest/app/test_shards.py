@@ -0,0 +1,102 @@
+"""
+Tests de la base de datos dividida por provincias
+"""
+
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+
+from . import config, database
+from .backend import DuckDBBackend
+from .main import app
+from .shards import ShardManager
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def shards_dir(tmp_path_factory):
+    """Genera un fichero por provincia a partir de la base de datos de tests"""
+    path = tmp_path_factory.mktemp("shards")
+    con = duckdb.connect()
+    con.execute(f"ATTACH '{config.DB_PATH}' AS src (READ_ONLY)")
+    for (cpro,) in con.execute("SELECT DISTINCT cpro FROM src.TRAM").fetchall():
+        con.execute(f"ATTACH '{path / f'{cpro:02d}.duckdb'}' AS shard")
+        con.execute(f"CREATE TABLE shard.TRAM AS SELECT * FROM src.TRAM WHERE cpro = {cpro}")
+        con.execute(f"CREATE TABLE shard.VIAS AS SELECT * FROM src.VIAS WHERE cpro = {cpro}")
+        con.execute(
+            f"CREATE TABLE shard.PSEUDOVIAS AS SELECT * FROM src.PSEUDOVIAS WHERE cpro = {cpro}"
+        )
+        con.execute(
+            f"CREATE TABLE shard.JERARQUIA AS SELECT * FROM src.JERARQUIA WHERE clave // 1000 = {cpro}"
+        )
+        con.execute("DETACH shard")
+    con.close()
+    return path
+
+
+@pytest.fixture
+def sharded(shards_dir, monkeypatch):
+    """Sustituye la conexión de la API por una en memoria con provincias bajo demanda"""
+    con = duckdb.connect()
+    manager = ShardManager(con, str(shards_dir), max_open=1)
+    dataset = database.Dataset("test", str(shards_dir), con, manager)
+    dataset.backend = DuckDBBackend()
+    monkeypatch.setattr(database, "_current", dataset)
+    yield manager
+    con.close()
+
+
+ENDPOINTS = [
+    "/api/poblaciones/28",
+    "/api/cp/28001",
+    "/api/cp/280",
+    "/api/28/79",
+    "/api/cp/28/79/1000",
+    "/api/vias/28001/MAYOR",
+    "/api/vias/28/79/1000/MAYOR",
+    "/api/poblaciones/1",
+    "/api/cp/99999",
+    "/api/jerarquia/28/79",
+    "/api/jerarquia/cp/28001",
+    "/api/jerarquia/cp/1001",
+]
+
+
+def normalize(response):
+    data = response.json()
+    if isinstance(data, list):
+        return response.status_code, sorted(data, key=lambda item: sorted(item.items(), key=str))
+    return response.status_code, data
+
+
+@pytest.fixture(scope="module")
+def expected():
+    """Respuestas con la base de datos completa"""
+    return [normalize(client.get(e)) for e in ENDPOINTS]
+
+
+def test_sharded_responses_identical(expected, sharded):
+    """Prueba que las respuestas con la base de datos por provincias son idénticas"""
+    for endpoint, response in zip(ENDPOINTS, expected):
+        assert normalize(client.get(endpoint)) == response, endpoint
+
+
+def test_shards_lru_eviction(sharded):
+    """Prueba que se adjuntan bajo demanda y se cierran las menos usadas"""
+    client.get("/api/poblaciones/28")
+    assert sharded.report()["abiertas"] == ["28"]
+    client.get("/api/poblaciones/28")
+    client.get("/api/poblaciones/1")
+    report = sharded.report()
+    assert report["abiertas"] == ["01"]
+    assert report["attach"] == 2
+    assert report["detach"] == 1
+    assert report["hits"] == 1
+
+
+def test_shards_missing_province(sharded):
+    """Prueba que una provincia sin fichero devuelve 404 sin adjuntar nada"""
+    response = client.get("/api/poblaciones/52")
+    assert response.status_code == 404
+    assert sharded.report()["attach"] == 0
@@ -0,0 +1,67 @@
+"""
+Tests del registro de consultas lentas y del perfil por cabecera
+"""
+
+import json
+
+from fastapi.testclient import TestClient
+
+from . import config, database
+from .main import app
+from .slowlog import HEADER, ProfileHeaderMiddleware
+
+client = TestClient(app)
+
+
+def slow_records(output: str) -> list[dict]:
+    return [
+        json.loads(line)
+        for line in output.splitlines()
+        if line.startswith("{") and '"consulta_lenta"' in line
+    ]
+
+
+def test_slow_query_logged(monkeypatch, capsys):
+    """Prueba que una consulta por encima del umbral se registra con su perfil"""
+    monkeypatch.setattr(config, "SLOW_QUERY_MS", 0.0001)
+    monkeypatch.setattr(config, "REFINE_CACHE", 0)
+    # Sin el índice de palabras la búsqueda recorre las vías con un join
+    monkeypatch.setattr(database.get_dataset().backend, "indexed", False)
+    response = client.get("/api/vias/28001/MAYOR")
+    assert response.status_code == 200
+
+    records = slow_records(capsys.readouterr().out)
+    assert len(records) == 1
+    record = records[0]
+    assert "TRAM.cpos = ?" in record["sql"]
+    assert record["params"] == [28001]
+    assert record["cpro"] == 28
+    operators = [op["operador"] for op in record["perfil"]["operadores"]]
+    assert "HASH_JOIN" in operators
+    assert record["perfil"]["escaneadas"] > 0
+    # El perfil es el de la propia ejecución, no el de una segunda
+    assert record["perfil"]["ms"] <= record["ms"]
+
+
+def test_slow_query_disabled(monkeypatch, capsys):
+    """Prueba que con umbral 0 no se registra nada"""
+    monkeypatch.setattr(config, "SLOW_QUERY_MS", 0)
+    client.get("/api/vias/28001/MAYOR")
+    assert slow_records(capsys.readouterr().out) == []
+
+
+def test_profile_header(monkeypatch):
+    """Prueba que el perfil se devuelve solo a las peticiones que lo piden"""
+    monkeypatch.setattr(config, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(config, "REFINE_CACHE", 0)
+    profiled = TestClient(ProfileHeaderMiddleware(app))
+
+    response = profiled.get("/api/vias/28001/MAYOR", headers={HEADER: "1"})
+    assert response.status_code == 200
+    profiles = json.loads(response.headers[HEADER])
+    assert len(profiles) == 1
+    assert profiles[0]["ms"] >= 0
+    assert any(op["filas"] > 0 for op in profiles[0]["operadores"])
+
+    response = profiled.get("/api/vias/28001/MAYOR")
+    assert HEADER not in response.headers
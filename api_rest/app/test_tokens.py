@@ -0,0 +1,199 @@
+"""
+Tests de la búsqueda de calles por palabras
+"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+
+from . import config, database, metrics
+from .backend import JERARQUIA_SQL, VIAS_SCAN_SQL, DuckDBBackend
+from .main import app
+from .refine import RefinementCache, refines
+from .startup import warmup
+from .tokens import fold, matches, terms, tokens
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+from parse_callejero import write_tokens  # noqa: E402
+
+client = TestClient(app)
+
+
+def test_fold():
+    """Prueba que se eliminan tildes y diacríticos"""
+    assert fold("Constitución España Çà") == "CONSTITUCION ESPANA CA"
+
+
+def test_tokens():
+    """Prueba que se descartan palabras vacías y se expanden abreviaturas"""
+    assert tokens("AVDA", "CONSTITUCION DE LA") == {"AVENIDA", "CONSTITUCION"}
+    assert tokens("CALLE", "SANT JORDI D'AMUNT") == {"CALLE", "SANT", "JORDI", "AMUNT"}
+    assert tokens(None, "STA. MARÍA") == {"SANTA", "MARIA"}
+
+
+def test_terms():
+    """Prueba los prefijos de búsqueda, incluido el caso de solo palabras vacías"""
+    assert terms("av constitucion") == ["AVENIDA", "CONSTITUCION"]
+    assert terms("DE LA MAYOR") == ["MAYOR"]
+    assert terms("DEL") == ["DEL"]
+    assert terms("---") == []
+    assert matches(terms("CONST AV"), tokens("AVDA", "CONSTITUCION DE LA"))
+    assert not matches(terms("CONST CALLE"), tokens("AVDA", "CONSTITUCION DE LA"))
+
+
+def test_terms_typing_abbreviation():
+    """Prueba que la palabra que se está escribiendo no se expande aunque sea una abreviatura"""
+    assert terms("PL") == ["PL"]
+    assert terms("PL ") == ["PLAZA"]
+    assert terms("pza mayor") == ["PLAZA", "MAYOR"]
+    assert matches(terms("PL"), tokens("CALLE", "PLATERO"))
+    assert matches(terms("PL"), tokens("PZA", "MAYOR"))
+    assert matches(terms("AV"), tokens("CALLE", "AVELLANO"))
+    assert not matches(terms("PL "), tokens("CALLE", "PLATERO"))
+    # La abreviatura que se está escribiendo coincide también por su forma completa
+    assert terms("MAYOR PZA") == ["MAYOR", "PZA"]
+    assert matches(terms("AVDA"), tokens("AVDA", "CONSTITUCION DE LA"))
+    assert matches(terms("CONSTITUCION AVDA"), tokens("AVENIDA", "CONSTITUCION DE LA"))
+    assert matches(terms("MAYOR PZA"), tokens("PLAZA", "MAYOR"))
+    assert matches(terms("PLAZA STA"), tokens("PLAZA", "SANTA ANA"))
+    assert not matches(terms("MAYOR PZA"), tokens("CALLE", "MAYOR"))
+    assert refines(["PLAZA"], ("PZA",)) and not refines(["PZA"], ("PLAZA",))
+
+
+def test_vias_typing_abbreviation():
+    """Prueba que una búsqueda que termina en una abreviatura encuentra la vía"""
+    for texto in ("CONSTITUCION PZA", "CONSTITUCION PZA ", "const pl", "PZA"):
+        response = client.get(f"/api/vias/28/79/1000/{texto}")
+        assert response.status_code == 200
+        assert "CONSTITUCION DE LA" in {item["nviac"] for item in response.json()}
+
+
+def test_vias_any_order():
+    """Prueba que las palabras se encuentran en cualquier orden y con el tipo de vía"""
+    expected = client.get("/api/vias/28001/MAYOR").json()
+    assert expected and all(item["nviac"] == "MAYOR" for item in expected)
+    for texto in ("CALLE MAYOR", "MAYOR CALLE", "cl mayor", "MAY"):
+        assert client.get(f"/api/vias/28001/{texto}").json() == expected
+    assert client.get("/api/vias/28001/MAYOR PLAZA").status_code == 404
+
+
+def test_vias_abbreviation_and_stopwords():
+    """Prueba que se ignoran tildes y palabras vacías y se expanden abreviaturas"""
+    for texto in ("PZA CONSTITUCION", "Constitución de la", "LA PLAZA CONST"):
+        response = client.get(f"/api/vias/28/79/1000/{texto}")
+        assert response.status_code == 200
+        assert {item["nviac"] for item in response.json()} == {"CONSTITUCION DE LA"}
+
+
+def test_vias_pseudovia_alias():
+    """Prueba que el nombre de una pseudovía encuentra la vía oficial"""
+    response = client.get("/api/vias/28001/URBANIZACION ROSALES")
+    assert response.status_code == 200
+    assert [(item["cvia"], item["nviac"]) for item in response.json()] == [(1, "MAYOR")]
+    assert "pseudovias" not in response.json()[0]
+    # La pseudovía solo se asocia a los tramos de su código postal
+    assert client.get("/api/vias/28002/ROSALES").status_code == 404
+    response = client.get("/api/vias/28/79/1000/POLIGONO NORTE")
+    assert {(item["cpos"], item["nviac"]) for item in response.json()} == {(28002, "GRAN VIA")}
+
+
+def test_refinement_cache(monkeypatch):
+    """Prueba que una búsqueda que refina otra reciente se resuelve sin consultar DuckDB"""
+    calls = []
+    query = database.query
+    # Solo cuentan las consultas que devuelven filas (no la comprobación del índice de palabras)
+    monkeypatch.setattr(database, "query", lambda *a, **k: (query(*a, **k), calls.append(a))[0])
+    duck = DuckDBBackend()
+    before = metrics.CACHE._values.get(("refinamiento", "hit"), 0)
+    assert [item["nviac"] for item in duck.vias_by_cpos(28001, "CON")] == ["CONSTITUCION DE LA"]
+    for texto in ("CONS", "CONST", "CONSTITUCION PLAZA", "PZA CONSTITUCION"):
+        assert [item["nviac"] for item in duck.vias_by_cpos(28001, texto)] == ["CONSTITUCION DE LA"]
+    assert len(calls) == 1
+    assert duck.vias_by_cpos(28001, "CONST CALLE") == []
+    # Una búsqueda que no refina las anteriores, u otro ámbito, consulta DuckDB
+    assert [item["nviac"] for item in duck.vias_by_cpos(28001, "MAYOR")] == ["MAYOR"]
+    duck.vias_by_cpos(28002, "CONST")
+    assert len(calls) == 3
+    assert metrics.CACHE._values.get(("refinamiento", "hit"), 0) - before == 5
+    report = duck.refinements.report()
+    assert report["hits"] == 5 and report["misses"] == 3
+
+
+def test_refinement_bounded():
+    """Prueba que la caché guarda como máximo el número de búsquedas configurado"""
+    cache = RefinementCache(2)
+    for i, texto in enumerate(["AAA", "BBB", "CCC"]):
+        cache.put(("cp", 28001), [texto], [i])
+    assert cache.get(("cp", 28001), ["AAAB"]) is None
+    assert cache.get(("cp", 28001), ["CCCD"]) == [2]
+    assert refines(["CERVA"], ("CERV",)) and not refines(["CERV"], ("CERVA",))
+    assert refines(["MAYOR", "PLAZA"], ("PLA",)) and not refines(["PLAZA"], ("PLA", "MAY"))
+
+
+@pytest.fixture
+def token_tables(tmp_path, monkeypatch):
+    """Copia la base de datos de tests con el índice de palabras y sin él"""
+    datasets = {}
+    for name, indexed in (("indexada", True), ("sin_indice", False)):
+        path = tmp_path / f"{name}.duckdb"
+        shutil.copy(config.DB_PATH, path)
+        con = duckdb.connect(str(path))
+        if indexed:
+            write_tokens(con)
+        else:
+            for table in ("VIAS_CP", "VIAS_UNIDAD", "VIAS_TOKENS"):
+                con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.close()
+        datasets[indexed] = database.open_dataset(str(path))
+    monkeypatch.setattr(config, "REFINE_CACHE", 0)
+    yield datasets
+    for dataset in datasets.values():
+        dataset.close()
+
+
+def test_token_index(token_tables, monkeypatch):
+    """Prueba que el índice de palabras de DuckDB devuelve lo mismo que recorrer las vías"""
+    sqls = []
+    query = database.query
+    monkeypatch.setattr(database, "query", lambda sql, *a, **k: sqls.append(sql) or query(sql, *a, **k))
+    con = token_tables[True].con
+    cps = [r[0] for r in con.execute("SELECT DISTINCT cpos FROM TRAM").fetchall()]
+    unidades = con.execute("SELECT DISTINCT cpro, cmun, cun_var FROM TRAM").fetchall()
+    results = {}
+    for indexed, dataset in token_tables.items():
+        monkeypatch.setattr(database, "_current", dataset)
+        duck = DuckDBBackend()
+        results[indexed] = [
+            duck.vias_by_cpos(cpos, texto)
+            for texto in ("MAYOR", "CALLE MAY", "PL", "PZA CONST", "CONST PZA", "ROSALES", "NO EXISTE")
+            for cpos in cps + [99999]
+        ] + [
+            duck.vias_by_cun(*unidad, texto)
+            for texto in ("GRAN VIA", "CALLE", "POLIGONO NORTE")
+            for unidad in unidades + [(28, 79, 99999)]
+        ]
+        assert duck.indexed is indexed
+        # La primera búsqueda comprueba si la base de datos tiene el índice
+        assert all(("VIAS_TOKENS" in sql) == indexed for sql in sqls[1:])
+        sqls.clear()
+    assert any(results[True]) and results[True] == results[False]
+
+
+def test_warmup_token_index(token_tables):
+    """Prueba que el calentamiento ejecuta la búsqueda de calles de los endpoints"""
+    for indexed, dataset in token_tables.items():
+        sqls = []
+
+        def query(sql, params, cpro=None, dataset=dataset):
+            sqls.append(sql)
+            return database.query(sql, params, cpro=cpro, dataset=dataset)
+
+        warmup(query)
+        assert JERARQUIA_SQL in sqls
+        # Sin el índice de palabras se calienta el recorrido de las vías
+        assert any("VIAS_TOKENS" in sql for sql in sqls)
+        assert (VIAS_SCAN_SQL["cp"] in sqls) is not indexed
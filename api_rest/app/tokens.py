@@ -0,0 +1,118 @@
+"""
+Normalización de nombres de vía en palabras para la búsqueda de calles.
+
+Los nombres se pasan a mayúsculas sin tildes, se dividen en palabras, se
+descartan las palabras vacías (DE, LA, DEL...) y las abreviaturas de tipo de
+vía se sustituyen por su forma completa (AV, AVD y AVDA son AVENIDA), de modo
+que "AV CONSTITUCION" encuentra la vía AVDA "CONSTITUCION DE LA". En la
+búsqueda solo se expanden las palabras completas: la última, si no le sigue un
+separador, se está escribiendo y coincide tanto por sí misma como por su forma
+completa (ver alternatives), de modo que "PL" encuentra PLAZA y también
+PLATERO, y "MAYOR PZA" encuentra la PLAZA MAYOR.
+
+Cada palabra de la búsqueda es un prefijo que debe coincidir con alguna palabra
+de la vía (el tipo o el nombre), en cualquier orden.
+"""
+
+import re
+import unicodedata
+
+STOPWORDS = frozenset({"DE", "DEL", "LA", "LAS", "LOS", "EL", "Y", "D", "L"})
+
+# Abreviatura -> forma completa. Incluye los códigos de TVIA del INE y las
+# abreviaturas habituales al escribir una dirección
+ABBREVIATIONS = {
+    "AV": "AVENIDA",
+    "AVD": "AVENIDA",
+    "AVDA": "AVENIDA",
+    "AVNDA": "AVENIDA",
+    "CL": "CALLE",
+    "CLL": "CALLE",
+    "PZ": "PLAZA",
+    "PZA": "PLAZA",
+    "PL": "PLAZA",
+    "PLZ": "PLAZA",
+    "PLZA": "PLAZA",
+    "PS": "PASEO",
+    "PSO": "PASEO",
+    "CM": "CAMINO",
+    "CMNO": "CAMINO",
+    "CNO": "CAMINO",
+    "CR": "CARRETERA",
+    "CRTA": "CARRETERA",
+    "CTRA": "CARRETERA",
+    "TR": "TRAVESIA",
+    "TRAV": "TRAVESIA",
+    "TRVA": "TRAVESIA",
+    "GTA": "GLORIETA",
+    "GLTA": "GLORIETA",
+    "RD": "RONDA",
+    "RDA": "RONDA",
+    "URB": "URBANIZACION",
+    "BARRI": "BARRIO",
+    "BO": "BARRIO",
+    "PJE": "PASAJE",
+    "PSAJE": "PASAJE",
+    "PSJE": "PASAJE",
+    "CJON": "CALLEJON",
+    "CUSTA": "CUESTA",
+    "PLZLA": "PLAZUELA",
+    "PARQ": "PARQUE",
+    "POLIG": "POLIGONO",
+    "BULEV": "BULEVAR",
+    "STA": "SANTA",
+    "STO": "SANTO",
+    "GRAL": "GENERAL",
+    "NTRA": "NUESTRA",
+    "SRA": "SENORA",
+    "DR": "DOCTOR",
+}
+
+_SEPARATOR = re.compile(r"[^0-9A-Z]+")
+
+
+def fold(text: str) -> str:
+    """Mayúsculas sin tildes ni diacríticos (Ñ -> N, Ç -> C)."""
+    text = unicodedata.normalize("NFKD", text.upper())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _words(text: str | None) -> list[str]:
+    if not text:
+        return []
+    return [ABBREVIATIONS.get(w, w) for w in _SEPARATOR.split(fold(text)) if w]
+
+
+def tokens(*texts: str | None) -> set[str]:
+    """Palabras indexadas de una vía a partir de su tipo y su nombre."""
+    return {w for text in texts for w in _words(text) if w not in STOPWORDS}
+
+
+def terms(text: str) -> list[str]:
+    """
+    Prefijos de una búsqueda, sin repetir. Si todas las palabras son vacías
+    (el usuario está escribiendo "DEL" de "DELICIAS") se usan como prefijos.
+    """
+    # Tras el último separador queda la palabra que se está escribiendo (vacía
+    # si no hay ninguna), que no se expande: ver alternatives
+    *complete, typing = _SEPARATOR.split(fold(text))
+    words = [ABBREVIATIONS.get(w, w) for w in complete if w]
+    if typing:
+        words.append(typing)
+    words = list(dict.fromkeys(words))
+    return [w for w in words if w not in STOPWORDS] or words
+
+
+def alternatives(term: str) -> tuple[str, ...]:
+    """
+    Prefijos con los que puede coincidir un término de la búsqueda: él mismo y,
+    si es una abreviatura (la palabra que se está escribiendo), su forma completa.
+    """
+    if term in ABBREVIATIONS:
+        return (term, ABBREVIATIONS[term])
+    return (term,)
+
+
+def matches(search: list[str], street: set[str]) -> bool:
+    """Indica si cada prefijo de la búsqueda coincide con alguna palabra de la vía."""
+    return all(any(w.startswith(alternatives(term)) for w in street) for term in search)
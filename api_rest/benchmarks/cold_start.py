@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque en frío de la API.
+
+Arranca la API (contenedor Docker o proceso uvicorn local) varias veces y mide:
+- Tiempo hasta que /api/estado responde 200
+- Latencia de la primera consulta real tras estar lista
+- Desglose de fases reportado por la propia API
+
+Ejemplos:
+    python benchmarks/cold_start.py --image callejero-api --runs 5
+    python benchmarks/cold_start.py --local --runs 5 --warmup
+    python benchmarks/cold_start.py --local --runs 5 --prewarm hotkeys.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+FIRST_QUERY = "/api/cp/28001"
+
+
+def http_get(url: str, timeout: float = 5.0) -> tuple[int, bytes]:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.read()
+
+
+def start_process(args, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "CALLEJERO_WARMUP": "true" if args.warmup else "false",
+        "CALLEJERO_PREWARM": str(Path(args.prewarm).resolve()) if args.prewarm else "",
+    }
+    if args.image:
+        cmd = [
+            "docker", "run", "--rm", "-p", f"{port}:8000",
+            "-e", f"CALLEJERO_WARMUP={env['CALLEJERO_WARMUP']}",
+        ]
+        if args.prewarm:
+            # El fichero se monta en el contenedor
+            cmd += ["-v", f"{env['CALLEJERO_PREWARM']}:/var/task/hotkeys.json:ro",
+                    "-e", "CALLEJERO_PREWARM=/var/task/hotkeys.json"]
+        cmd.append(args.image)
+        cwd = None
+    else:
+        cmd = [
+            sys.executable, "-m", "uvicorn", "--app-dir", str(API_DIR),
+            "--port", str(port), "app.main:app",
+        ]
+        cwd = API_DIR / "app"
+    return subprocess.Popen(
+        cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_ready(base: str, start: float, timeout: float) -> float:
+    while time.perf_counter() - start < timeout:
+        try:
+            code, _ = http_get(f"{base}/api/estado", timeout=1)
+            if code == 200:
+                return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    raise TimeoutError("La API no ha llegado a estar lista")
+
+
+def run_once(args, port: int) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = start_process(args, port)
+    try:
+        ready = wait_ready(base, start, args.timeout)
+        q_start = time.perf_counter()
+        http_get(f"{base}{FIRST_QUERY}")
+        first_query = time.perf_counter() - q_start
+        _, body = http_get(f"{base}/api/estado")
+        phases = json.loads(body).get("fases", {})
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"ready": ready, "first_query": first_query, "phases": phases}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--image", help="Imagen Docker de la API")
+    target.add_argument("--local", action="store_true", help="Arranca uvicorn local")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--warmup", action="store_true", help="CALLEJERO_WARMUP=true")
+    parser.add_argument("--prewarm", help="Fichero de rutas calientes (CALLEJERO_PREWARM)")
+    args = parser.parse_args()
+
+    results = [run_once(args, args.port) for _ in range(args.runs)]
+
+    ready = [r["ready"] for r in results]
+    first = [r["first_query"] for r in results]
+    print(f"[INFO] {args.runs} arranques (warmup={args.warmup}, prewarm={args.prewarm})")
+    print(f"  listo:           mediana {statistics.median(ready) * 1000:8.1f} ms")
+    print(f"  primera consulta: mediana {statistics.median(first) * 1000:8.1f} ms")
+    total_to_answer = [r + f for r, f in zip(ready, first)]
+    print(f"  total:           mediana {statistics.median(total_to_answer) * 1000:8.1f} ms")
+    for name in results[-1]["phases"]:
+        values = [r["phases"].get(name, 0) for r in results]
+        print(f"  fase {name:<12} mediana {statistics.median(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga reproducible de la API con una mezcla realista de peticiones.
+
+Arranca uvicorn en local (o usa --url) sobre la base de datos indicada o sobre
+una generada al vuelo con scripts/generate_callejero.py, y reproduce una secuencia de peticiones fijada por la
+semilla con varios niveles de concurrencia. La mezcla combina:
+- catalogo: navegación por autonomías, provincias, poblaciones y CP completos
+- cp: búsqueda por prefijo de código postal (3 y 4 dígitos)
+- calles: escritura del nombre de una calle con 3, 4, 5... caracteres
+
+Para cada nivel informa del throughput, las latencias p50/p95/p99 y la tasa de
+errores (5xx y fallos de conexión), total y por grupo. Con --baseline compara el
+resultado con uno guardado y termina con código 1 si empeora más de la tolerancia.
+
+Ejemplos:
+    python benchmarks/loadtest.py --generate --concurrency 1,4,16 --requests 2000
+    python benchmarks/loadtest.py --db callejero.duckdb --save-baseline base.json
+    python benchmarks/loadtest.py --db callejero.duckdb --baseline base.json
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+import duckdb
+
+from cold_start import API_DIR, wait_ready
+
+DEFAULT_MIX = "catalogo=30,cp=20,calles=50"
+
+SCRIPTS_DIR = API_DIR.parent / "scripts"
+
+
+def generate_db(directory: str, tramos: int, seed: int = 42) -> str:
+    """
+    Genera ficheros sintéticos del INE y los procesa con el parseo del build,
+    devolviendo la ruta del callejero.duckdb resultante.
+    """
+    subprocess.run(
+        [sys.executable, str(SCRIPTS_DIR / "generate_callejero.py"),
+         "--tramos", str(tramos), "--seed", str(seed), "--out", "input"],
+        cwd=directory, check=True, stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [sys.executable, str(SCRIPTS_DIR / "parse_callejero.py")],
+        cwd=directory, check=True, stdout=subprocess.DEVNULL,
+    )
+    path = os.path.join(directory, "callejero.duckdb")
+    print(f"[OK] Base de datos generada en {path} ({tramos} tramos INE sintéticos)")
+    return path
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def build_requests(db: str, mix: dict[str, float], n: int, seed: int) -> list[tuple[str, str]]:
+    """Secuencia de (grupo, ruta) fijada por la semilla."""
+    con = duckdb.connect(db, read_only=True)
+    units = con.execute("SELECT DISTINCT cpro, cmun, cun_var FROM TRAM ORDER BY ALL").fetchall()
+    streets = con.execute(
+        "SELECT DISTINCT cpos, cpro, cmun, cun_var, nviac FROM TRAM ORDER BY ALL"
+    ).fetchall()
+    con.close()
+
+    rng = random.Random(seed)
+    groups, weights = zip(*mix.items())
+    requests = []
+    for group in rng.choices(groups, weights=weights, k=n):
+        if group == "catalogo":
+            cpro, cmun, cun = rng.choice(units)
+            cpos = rng.choice(streets)[0]
+            path = rng.choice(
+                [
+                    "/api/autonomias/",
+                    f"/api/provincias/{rng.randint(1, 19)}",
+                    f"/api/poblaciones/{cpro}",
+                    f"/api/{cpro}/{cmun}",
+                    f"/api/cp/{cpro}/{cmun}/{cun}",
+                    f"/api/cp/{cpos:05d}",
+                ]
+            )
+        elif group == "cp":
+            cpos = rng.choice(streets)[0]
+            path = f"/api/cp/{f'{cpos:05d}'[:rng.choice([3, 4])]}"
+        elif group == "calles":
+            cpos, cpro, cmun, cun, name = rng.choice(streets)
+            length = rng.randint(3, max(3, min(len(name), 8)))
+            fragment = urllib.parse.quote(name[:length])
+            group = f"calles/{length}"
+            if rng.random() < 0.5:
+                path = f"/api/vias/{cpos:05d}/{fragment}"
+            else:
+                path = f"/api/vias/{cpro}/{cmun}/{cun}/{fragment}"
+        else:
+            raise ValueError(f"Grupo desconocido en la mezcla: {group}")
+        requests.append((group, path))
+    return requests
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples: list[tuple[str, int, float]], elapsed: float) -> dict:
+    def stats(items):
+        latencies = [s[2] for s in items]
+        errors = sum(1 for s in items if s[1] == 0 or s[1] >= 500)
+        return {
+            "n": len(items),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "errores": round(errors / len(items), 4) if items else 0.0,
+        }
+
+    result = stats(samples)
+    result["rps"] = round(len(samples) / elapsed, 1)
+    result["grupos"] = {
+        group: stats([s for s in samples if s[0] == group])
+        for group in sorted({s[0] for s in samples})
+    }
+    return result
+
+
+def run_level(host: str, port: int, requests: list[tuple[str, str]], concurrency: int) -> dict:
+    """Lanza las peticiones con `concurrency` hilos, cada uno con conexión persistente."""
+    counter = itertools.count()
+    samples: list[tuple[str, int, float]] = []
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        local = []
+        while (i := next(counter)) < len(requests):
+            group, path = requests[i]
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                code = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+                code = 0
+            local.append((group, code, time.perf_counter() - start))
+        conn.close()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, time.perf_counter() - start)
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lista de regresiones respecto a la referencia."""
+    regressions = []
+    for level, base in baseline["niveles"].items():
+        current = result["niveles"].get(level)
+        if current is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"c={level} {key} {current[key]} > {base[key]}")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"c={level} rps {current['rps']} < {base['rps']}")
+        if current["errores"] > base["errores"] + 0.001:
+            regressions.append(f"c={level} errores {current['errores']} > {base['errores']}")
+    return regressions
+
+
+def start_server(db: str, port: int) -> subprocess.Popen:
+    env = {**os.environ, "CALLEJERO_DB": str(Path(db).resolve())}
+    cmd = [
+        sys.executable, "-m", "uvicorn", "--app-dir", str(API_DIR),
+        "--port", str(port), "--log-level", "warning", "app.main:app",
+    ]
+    return subprocess.Popen(cmd, cwd=API_DIR / "app", env=env, stdout=subprocess.DEVNULL)
+
+
+def print_result(result: dict):
+    for level, info in result["niveles"].items():
+        print(
+            f"[INFO] c={level:<3} {info['rps']:>8.1f} rps  p50 {info['p50_ms']:7.2f} ms  "
+            f"p95 {info['p95_ms']:7.2f} ms  p99 {info['p99_ms']:7.2f} ms  "
+            f"errores {info['errores'] * 100:.2f}%"
+        )
+        for group, g in info["grupos"].items():
+            print(
+                f"    {group:<10} n={g['n']:<5} p50 {g['p50_ms']:7.2f} ms  "
+                f"p95 {g['p95_ms']:7.2f} ms  p99 {g['p99_ms']:7.2f} ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="Base de datos DuckDB del callejero")
+    source.add_argument("--generate", action="store_true", help="Genera una base de datos sintética")
+    parser.add_argument("--tramos", type=int, default=100_000, help="Tramos generados")
+    parser.add_argument("--url", help="API ya arrancada (por defecto se arranca uvicorn)")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=2000, help="Peticiones por nivel")
+    parser.add_argument("--warmup", type=int, default=100, help="Peticiones previas sin medir")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guarda el resultado en JSON")
+    parser.add_argument("--baseline", help="Resultado de referencia para detectar regresiones")
+    parser.add_argument("--save-baseline", help="Guarda el resultado como referencia")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    tmp = None
+    db = args.db
+    if args.generate:
+        tmp = tempfile.TemporaryDirectory()
+        db = generate_db(tmp.name, args.tramos, args.seed)
+
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    requests = build_requests(db, mix, args.requests, args.seed)
+
+    proc = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        host, port = "127.0.0.1", args.port
+        proc = start_server(db, port)
+    try:
+        wait_ready(f"http://{host}:{port}", time.perf_counter(), 60)
+        run_level(host, port, requests[: args.warmup], 1)
+        result = {
+            "mix": mix,
+            "requests": args.requests,
+            "seed": args.seed,
+            "niveles": {str(c): run_level(host, port, requests, c) for c in levels},
+        }
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if tmp is not None:
+            tmp.cleanup()
+
+    print_result(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=1))
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(result, indent=1))
+        print(f"[OK] Referencia guardada en {args.save_baseline}")
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        if regressions:
+            for regression in regressions:
+                print(f"[ERROR] Regresión: {regression}")
+            sys.exit(1)
+        print(f"[OK] Sin regresiones respecto a {args.baseline} (tolerancia {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
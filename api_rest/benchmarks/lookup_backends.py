@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark de latencia de las búsquedas por clave exacta: DuckDB frente a arrays.
+
+Genera el índice binario en un directorio temporal (o usa el indicado) y
+ejecuta las mismas claves, elegidas al azar entre las existentes, con ambos backends.
+
+Ejemplo:
+    CALLEJERO_DB=callejero.duckdb python benchmarks/lookup_backends.py --n 2000
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import config, database  # noqa: E402
+from app.backend import DuckDBBackend  # noqa: E402
+from app.lookup import ArrayBackend, build  # noqa: E402
+
+
+def sample_keys(n: int) -> dict[str, list[tuple]]:
+    con = database.get_connection()
+
+    def sample(sql):
+        rows = con.execute(sql).fetchall()
+        return [random.choice(rows) for _ in range(n)]
+
+    return {
+        "poblaciones_by_cpro": sample("SELECT DISTINCT cpro FROM TRAM"),
+        "poblaciones_by_cp": sample("SELECT DISTINCT cpos FROM TRAM"),
+        "localidades_by_cpro_cmun": sample("SELECT DISTINCT cpro, cmun FROM TRAM"),
+        "cp_by_cun": sample("SELECT DISTINCT cpro, cmun, cun_var FROM TRAM"),
+    }
+
+
+def measure(backend, method: str, keys: list[tuple]) -> list[float]:
+    func = getattr(backend, method)
+    times = []
+    for key in keys:
+        start = time.perf_counter()
+        func(*key)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backends de búsqueda")
+    parser.add_argument("--n", type=int, default=1000, help="Búsquedas por endpoint")
+    parser.add_argument("--lookup", help="Fichero de índice ya generado")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    lookup = args.lookup
+    if lookup is None:
+        lookup = str(Path(tempfile.mkdtemp(prefix="callejero-lookup-")) / "callejero.idx")
+        build(config.DB_PATH, lookup)
+
+    start = time.perf_counter()
+    arrays = ArrayBackend(lookup)
+    print(f"[INFO] Índice abierto en {(time.perf_counter() - start) * 1000:.3f} ms")
+
+    duck = DuckDBBackend()
+    keys = sample_keys(args.n)
+    print(f"{'endpoint':<26}{'backend':<8}{'p50 µs':>10}{'p95 µs':>10}{'media µs':>10}")
+    for method, method_keys in keys.items():
+        for backend in (duck, arrays):
+            # Una pasada previa para no medir la carga inicial de páginas
+            measure(backend, method, method_keys[:10])
+            times = sorted(measure(backend, method, method_keys))
+            p50 = times[len(times) // 2] * 1e6
+            p95 = times[int(len(times) * 0.95)] * 1e6
+            mean = statistics.fmean(times) * 1e6
+            print(f"{method:<26}{backend.name:<8}{p50:>10.1f}{p95:>10.1f}{mean:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Escalado del throughput con el número de procesos de `python -m app.serve`.
+
+Para cada número de procesos arranca el servidor pre-fork sobre la misma base de
+datos y reproduce la mezcla de peticiones de loadtest.py con `--per-worker`
+conexiones por proceso. Informa del throughput, del p99, de la aceleración
+respecto a un proceso y de la memoria de los procesos: la privada (USS) de cada
+uno y la proporcional (PSS) del conjunto, en la que las páginas compartidas del
+fichero y del código importado cuentan una sola vez.
+
+Ejemplos:
+    python benchmarks/workers.py --generate --workers 1,2,4,8
+    CALLEJERO_BACKEND=arrays python benchmarks/workers.py --db callejero.duckdb --workers 1,4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from cold_start import API_DIR, wait_ready
+from loadtest import DEFAULT_MIX, build_requests, generate_db, parse_mix, run_level
+
+
+def children(pid: int) -> list[int]:
+    try:
+        text = Path(f"/proc/{pid}/task/{pid}/children").read_text()
+    except OSError:
+        return []
+    return [int(child) for child in text.split()]
+
+
+def memory_kb(pid: int) -> dict[str, int]:
+    """Rss, Pss y memoria privada (USS) de un proceso en kB según smaps_rollup."""
+    values = {"Rss": 0, "Pss": 0, "Uss": 0}
+    try:
+        text = Path(f"/proc/{pid}/smaps_rollup").read_text()
+    except OSError:
+        return values
+    for line in text.splitlines():
+        name, _, rest = line.partition(":")
+        if name in ("Rss", "Pss"):
+            values[name] = int(rest.split()[0])
+        elif name in ("Private_Clean", "Private_Dirty"):
+            values["Uss"] += int(rest.split()[0])
+    return values
+
+
+def start_server(db: str, port: int, workers: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "CALLEJERO_DB": str(Path(db).resolve()),
+        "CALLEJERO_WORKERS": str(workers),
+        "PYTHONPATH": str(API_DIR),
+    }
+    cmd = [sys.executable, "-m", "app.serve", "--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=API_DIR / "app", env=env, stdout=subprocess.DEVNULL)
+
+
+def run_workers(args, db: str, requests: list, workers: int) -> dict:
+    proc = start_server(db, args.port, workers)
+    try:
+        wait_ready(f"http://127.0.0.1:{args.port}", time.perf_counter(), 60)
+        concurrency = workers * args.per_worker
+        # Calentamiento con todas las conexiones para que lo reciban todos los procesos
+        run_level("127.0.0.1", args.port, requests[: args.warmup], concurrency)
+        result = run_level("127.0.0.1", args.port, requests, concurrency)
+        pids = children(proc.pid) or [proc.pid]
+        memory = [memory_kb(pid) for pid in pids]
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {
+        "procesos": workers,
+        "conexiones": concurrency,
+        "rps": result["rps"],
+        "p99_ms": result["p99_ms"],
+        "errores": result["errores"],
+        "uss_mb": round(max(m["Uss"] for m in memory) / 1024, 1),
+        "pss_mb": round(sum(m["Pss"] for m in memory) / 1024, 1),
+        "rss_mb": round(sum(m["Rss"] for m in memory) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="Base de datos DuckDB del callejero")
+    source.add_argument("--generate", action="store_true", help="Genera una base de datos sintética")
+    parser.add_argument("--tramos", type=int, default=100_000, help="Tramos generados")
+    parser.add_argument("--workers", default="1,2,4", help="Números de procesos a medir")
+    parser.add_argument("--per-worker", type=int, default=4, help="Conexiones por proceso")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--requests", type=int, default=4000, help="Peticiones por medición")
+    parser.add_argument("--warmup", type=int, default=400, help="Peticiones previas sin medir")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tmp = None
+    db = args.db
+    if args.generate:
+        tmp = tempfile.TemporaryDirectory()
+        db = generate_db(tmp.name, args.tramos, args.seed)
+    try:
+        requests = build_requests(db, parse_mix(args.mix), args.requests, args.seed)
+        results = [run_workers(args, db, requests, int(n)) for n in args.workers.split(",")]
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    base = results[0]["rps"] / results[0]["procesos"]
+    print(f"[INFO] CPUs disponibles: {len(os.sched_getaffinity(0))}")
+    print("  procesos  conexiones       rps  aceleración  p99 ms  USS/proceso MB  PSS total MB  RSS total MB")
+    for r in results:
+        speedup = r["rps"] / base if base else 0
+        print(
+            f"  {r['procesos']:>8}  {r['conexiones']:>10}  {r['rps']:>8.1f}  {speedup:>10.2f}x  "
+            f"{r['p99_ms']:>6.1f}  {r['uss_mb']:>14.1f}  {r['pss_mb']:>12.1f}  {r['rss_mb']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
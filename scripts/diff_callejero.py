@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Cambios entre dos versiones semestrales del callejero.
+
+Compara la versión anterior (callejero.duckdb publicado) con la recién parseada y
+guarda los cambios en tablas compactas dentro de la nueva base de datos:
+
+- CAMBIOS_VIAS: vías dadas de alta, de baja o con nombre/tipo cambiado
+- CAMBIOS_CP: códigos postales añadidos o retirados de cada vía
+- CAMBIOS_UNIDADES: unidades poblacionales nuevas, eliminadas o renombradas
+- CAMBIOS_VERSIONES: un registro por paso (desde, hasta) con el número de cambios
+
+Las tablas de la versión anterior se copian, por lo que la nueva base de datos
+contiene el histórico completo y la API puede servir los cambios desde cualquier
+versión anterior (/cambios?desde=AAAAMM).
+
+Para ver los cambios entre dos ficheros sin escribir nada:
+    python scripts/diff_callejero.py anterior.duckdb callejero.duckdb
+
+Dependencias: duckdb
+"""
+import argparse
+
+import duckdb
+
+# Esquema de las tablas de cambios
+CHANGE_TABLES = {
+    "CAMBIOS_VERSIONES": "desde VARCHAR, hasta VARCHAR, vias INTEGER, cp INTEGER, unidades INTEGER",
+    "CAMBIOS_VIAS": (
+        "desde VARCHAR, hasta VARCHAR, tipo VARCHAR, cpro TINYINT, cmun SMALLINT, "
+        "cvia INTEGER, tvia VARCHAR, nviac VARCHAR, tvia_anterior VARCHAR, nviac_anterior VARCHAR"
+    ),
+    "CAMBIOS_CP": (
+        "desde VARCHAR, hasta VARCHAR, tipo VARCHAR, cpro TINYINT, cmun SMALLINT, "
+        "cvia INTEGER, cpos INTEGER"
+    ),
+    "CAMBIOS_UNIDADES": (
+        "desde VARCHAR, hasta VARCHAR, tipo VARCHAR, cpro TINYINT, cmun SMALLINT, "
+        "cun INTEGER, nentsic VARCHAR, nentsic_anterior VARCHAR"
+    ),
+}
+
+
+def _streets(catalog: str) -> str:
+    return f"""
+        SELECT t.cpro, t.cmun, t.cvia_var AS cvia, min(t.nviac) AS nviac, min(v.tvia) AS tvia
+        FROM {catalog}.TRAM t
+        LEFT JOIN {catalog}.VIAS v USING (cpro, cmun, cvia_var)
+        GROUP BY t.cpro, t.cmun, t.cvia_var
+    """
+
+
+def _units(catalog: str) -> str:
+    return f"""
+        SELECT cpro, cmun, cun_var AS cun, min(nentsic) AS nentsic
+        FROM {catalog}.TRAM GROUP BY cpro, cmun, cun_var
+    """
+
+
+def diff_queries(old: str, new: str) -> dict[str, str]:
+    """Consultas que calculan cada tabla de cambios (sin las columnas desde/hasta)."""
+    return {
+        "CAMBIOS_VIAS": f"""
+            SELECT
+                CASE
+                    WHEN a.cvia IS NULL THEN 'alta'
+                    WHEN n.cvia IS NULL THEN 'baja'
+                    ELSE 'nombre'
+                END AS tipo,
+                coalesce(n.cpro, a.cpro), coalesce(n.cmun, a.cmun), coalesce(n.cvia, a.cvia),
+                n.tvia, n.nviac, a.tvia, a.nviac
+            FROM ({_streets(new)}) n
+            FULL OUTER JOIN ({_streets(old)}) a USING (cpro, cmun, cvia)
+            WHERE a.cvia IS NULL OR n.cvia IS NULL
+               OR a.nviac IS DISTINCT FROM n.nviac OR a.tvia IS DISTINCT FROM n.tvia
+            ORDER BY ALL
+        """,
+        "CAMBIOS_CP": f"""
+            SELECT 'alta' AS tipo, * FROM (
+                SELECT cpro, cmun, cvia_var, cpos FROM {new}.TRAM
+                EXCEPT SELECT cpro, cmun, cvia_var, cpos FROM {old}.TRAM
+            )
+            UNION ALL
+            SELECT 'baja' AS tipo, * FROM (
+                SELECT cpro, cmun, cvia_var, cpos FROM {old}.TRAM
+                EXCEPT SELECT cpro, cmun, cvia_var, cpos FROM {new}.TRAM
+            )
+            ORDER BY ALL
+        """,
+        "CAMBIOS_UNIDADES": f"""
+            SELECT
+                CASE
+                    WHEN a.cun IS NULL THEN 'alta'
+                    WHEN n.cun IS NULL THEN 'baja'
+                    ELSE 'nombre'
+                END AS tipo,
+                coalesce(n.cpro, a.cpro), coalesce(n.cmun, a.cmun), coalesce(n.cun, a.cun),
+                n.nentsic, a.nentsic
+            FROM ({_units(new)}) n
+            FULL OUTER JOIN ({_units(old)}) a USING (cpro, cmun, cun)
+            WHERE a.cun IS NULL OR n.cun IS NULL OR a.nentsic IS DISTINCT FROM n.nentsic
+            ORDER BY ALL
+        """,
+    }
+
+
+def _version(con, catalog: str) -> str | None:
+    try:
+        row = con.execute(f"SELECT version FROM {catalog}.VERSION").fetchone()
+        return row[0] if row else None
+    except duckdb.CatalogException:
+        return None
+
+
+def _has_table(con, catalog: str, table: str) -> bool:
+    return bool(
+        con.execute(
+            "SELECT 1 FROM duckdb_tables() WHERE database_name = ? AND table_name = ?",
+            [catalog, table],
+        ).fetchall()
+    )
+
+
+def compute_changes(con: duckdb.DuckDBPyConnection, previous: str, catalog: str = "memory") -> dict:
+    """
+    Añade a `catalog` las tablas de cambios respecto a la base de datos `previous`,
+    conservando el histórico de cambios que ya contuviera.
+    """
+    con.execute(f"ATTACH '{previous}' AS anterior (READ_ONLY)")
+    try:
+        desde, hasta = _version(con, "anterior"), _version(con, catalog)
+        for table, schema in CHANGE_TABLES.items():
+            con.execute(f"CREATE TABLE {catalog}.{table} ({schema})")
+            if _has_table(con, "anterior", table):
+                con.execute(f"INSERT INTO {catalog}.{table} SELECT * FROM anterior.{table}")
+
+        if desde is None or hasta is None or desde >= hasta:
+            print(f"[WARN] Sin cambios calculables entre las versiones {desde} y {hasta}")
+            return {}
+
+        counts = {}
+        for table, sql in diff_queries("anterior", catalog).items():
+            con.execute(f"INSERT INTO {catalog}.{table} SELECT ?, ?, * FROM ({sql})", [desde, hasta])
+            counts[table] = con.execute(
+                f"SELECT COUNT(*) FROM {catalog}.{table} WHERE desde = ? AND hasta = ?",
+                [desde, hasta],
+            ).fetchone()[0]
+        con.execute(
+            f"INSERT INTO {catalog}.CAMBIOS_VERSIONES VALUES (?, ?, ?, ?, ?)",
+            [desde, hasta, counts["CAMBIOS_VIAS"], counts["CAMBIOS_CP"], counts["CAMBIOS_UNIDADES"]],
+        )
+        print(
+            f"[OK] Cambios {desde} -> {hasta}: {counts['CAMBIOS_VIAS']} vías, "
+            f"{counts['CAMBIOS_CP']} códigos postales, {counts['CAMBIOS_UNIDADES']} unidades"
+        )
+        return counts
+    finally:
+        con.execute("DETACH anterior")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cambios entre dos versiones del callejero")
+    parser.add_argument("anterior")
+    parser.add_argument("nueva")
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    con.execute(f"ATTACH '{args.anterior}' AS anterior (READ_ONLY)")
+    con.execute(f"ATTACH '{args.nueva}' AS nueva (READ_ONLY)")
+    for table, sql in diff_queries("anterior", "nueva").items():
+        rows = con.execute(f"SELECT tipo, COUNT(*) FROM ({sql}) GROUP BY tipo ORDER BY tipo").fetchall()
+        summary = ", ".join(f"{tipo}: {n}" for tipo, n in rows) or "sin cambios"
+        print(f"  {table:<17} {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import fnmatch
 import os
+import shutil
 import zipfile
 from datetime import date
 import pathlib
@@ -45,7 +47,7 @@ def upload_s3(file: str):
 
         s3_client = boto3.client("s3")
         s3_client.upload_file(
-            Filename=f"/tmp/{file}",
+            Filename="callejero.duckdb",
             Bucket="callejero-dev-cloudfront",
             Key="callejero.duckdb",
             ExtraArgs={"Metadata": {"source": file}},
@@ -56,9 +58,44 @@ def upload_s3(file: str):
         pass
 
 
-def get_ine_file(input_dir: pathlib.Path):
-    """Descarga el fichero del callejero del INE y lo descomprime en input_dir."""
-    # Descarga ficheros de callejero desde la URL del INE
+def download_previous(path: pathlib.Path):
+    """Descarga la base de datos publicada para calcular los cambios de la nueva versión."""
+    try:
+        import boto3
+
+        s3_client = boto3.client("s3")
+        s3_client.download_file(
+            Bucket="callejero-dev-cloudfront", Key="callejero.duckdb", Filename=str(path)
+        )
+        print(f"[OK] Versión anterior descargada en {path}")
+    except Exception:
+        # Sin versión anterior no se calculan cambios, el resto del proceso continúa
+        pass
+
+
+def upload_shards(shards_dir: pathlib.Path):
+    """Sube a S3 los ficheros DuckDB por provincia."""
+    try:
+        import boto3
+
+        s3_client = boto3.client("s3")
+        for path in sorted(shards_dir.glob("*.duckdb")):
+            s3_client.upload_file(
+                Filename=str(path),
+                Bucket="callejero-dev-cloudfront",
+                Key=f"shards/{path.name}",
+            )
+        print(f"[OK] Ficheros por provincia subidos a S3 desde {shards_dir}")
+    except Exception:
+        # Se ignoran intencionadamente los errores para permitir trabajar sin AWS
+        pass
+
+
+def find_ine_file() -> tuple[str, str] | None:
+    """
+    Busca el fichero del callejero del INE del último periodo publicado y devuelve
+    su nombre y URL, o None si ya está procesado en S3.
+    """
     http_pool = urllib3.PoolManager()
     # El fichero puede ser de Enero o Julio, se prueban ambas variantes
     today = date.today()
@@ -79,17 +116,7 @@ def get_ine_file(input_dir: pathlib.Path):
             # Se comprueba si el fichero ya existe en S3
             if check_s3_file_exists(file):
                 return None
-
-            response = http_pool.request("GET", url)
-            with open(f"/tmp/{file}", "wb") as f:
-                f.write(response.data)
-
-            # unzip
-            with zipfile.ZipFile(f"/tmp/{file}", "r") as zip_ref:
-                zip_ref.extractall(input_dir)
-            print(f"[OK] Fichero descargado y descomprimido: {file}")
-            os.remove(f"/tmp/{file}")
-            return file
+            return file, url
         print(
             f"[WARN] No se encontró fichero para periodo {fecha} (HTTP {response.status})"
         )
@@ -97,6 +124,30 @@ def get_ine_file(input_dir: pathlib.Path):
     raise RuntimeError("No se pudo descargar ningún fichero del callejero del INE")
 
 
+def fetch(url: str, path: pathlib.Path):
+    """Descarga el zip del callejero en disco sin cargarlo entero en memoria."""
+    http_pool = urllib3.PoolManager()
+    response = http_pool.request("GET", url, preload_content=False)
+    try:
+        with open(path, "wb") as f:
+            shutil.copyfileobj(response, f, 1024 * 1024)
+    finally:
+        response.release_conn()
+    print(f"[OK] Fichero descargado: {path.name}")
+
+
+def extract_member(zip_path: pathlib.Path, stem: str, input_dir: pathlib.Path):
+    """Descomprime en input_dir el fichero `stem` del zip (p.ej. caj_esp_072025/TRAM...)."""
+    # Cada etapa abre el zip por separado para descomprimir en paralelo
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        names = [n for n in zip_ref.namelist() if fnmatch.fnmatch(n, f"caj_esp_??????/{stem}*.*")]
+        if not names:
+            print(f"[WARN] El zip no contiene fichero para {stem}")
+            return
+        zip_ref.extract(names[0], input_dir)
+    print(f"[OK] Fichero descomprimido: {names[0]}")
+
+
 def main():
     output_dir = pathlib.Path("output")
     input_dir = pathlib.Path("input")
@@ -109,21 +160,57 @@ def main():
 
     input_dir.mkdir(parents=True, exist_ok=True)
 
-    file = get_ine_file(input_dir)
-    if file is None:
+    found = find_ine_file()
+    if found is None:
         # Si devuelve None, el fichero ya estaba en S3 y no es necesario continuar
         print("[INFO] Fichero ya actualizado en S3, no es necesario procesar nada.")
         return
+    file, url = found
+    zip_path = pathlib.Path(f"/tmp/{file}")
+
+    from parse_callejero import LOADED_TABLES, add_stages
+    from pipeline import Pipeline
+
+    # Descarga, descompresión de cada fichero, parseo, carga y subida como un
+    # grafo de etapas que se ejecutan en paralelo (ver pipeline.py). Solo se
+    # descomprimen los ficheros que se cargan en la base de datos
+    pipe = Pipeline()
+    previous = pathlib.Path("previous.duckdb")
+    shards_dir = pathlib.Path("shards")
+    pipe.add("descargar", lambda: fetch(url, zip_path))
+    pipe.add("anterior", lambda: download_previous(previous))
+    for stem in LOADED_TABLES:
+        pipe.add(
+            f"descomprimir:{stem}",
+            lambda s=stem: extract_member(zip_path, s, input_dir),
+            after=["descargar"],
+        )
+    final = add_stages(
+        pipe,
+        input_dir,
+        shards_dir,
+        previous,
+        inputs_after={stem: f"descomprimir:{stem}" for stem in LOADED_TABLES},
+        previous_after=["anterior"],
+    )
 
-    print("[INFO] Parseando archivos a DuckDB...")
-    from parse_callejero import main as parse_main
+    def export():
+        from export_callejero import main as export_main
 
-    parse_main()
+        print("[INFO] Exportando catálogo estático...")
+        export_main(bucket=os.environ.get("S3_BUCKET_NAME", "callejero-dev-cloudfront"))
 
     # Se sube el fichero a S3 con metadata indicando el origen
-    upload_s3(file)
+    pipe.add("subir", lambda: upload_s3(file), after=[final])
+    pipe.add("subir_provincias", lambda: upload_shards(shards_dir), after=["provincias"])
+    pipe.add("exportar", export, after=[final])
+    try:
+        pipe.run()
+    finally:
+        if zip_path.exists():
+            os.remove(zip_path)
 
-    print("[OK] Pipeline completo: descarga → parseo → DuckDB")
+    print("[OK] Pipeline completo: descarga → parseo → DuckDB → catálogo estático")
 
 
 if __name__ == "__main__":
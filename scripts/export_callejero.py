@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Exportación estática del catálogo de la API a ficheros JSON precomprimidos.
+
+Las respuestas jerárquicas de la API (autonomías, provincias, poblaciones, códigos
+postales por municipio o unidad poblacional y cada CP completo) forman un conjunto
+finito que solo cambia con cada publicación semestral del INE. Este script las
+genera todas con la misma estructura de rutas que la API, comprimidas con gzip,
+para subirlas a S3 y que CloudFront las sirva sin invocar la Lambda.
+
+- Las respuestas se obtienen llamando a los propios endpoints de la API, por lo
+  que el contenido es idéntico al que devolvería la Lambda
+- La exportación es incremental: un manifiesto guarda el hash de cada fichero y
+  solo se reescriben (y suben) los que han cambiado
+- Las rutas que terminan en "/" se guardan como index.json.gz y se suben como
+  index.json; la función de CloudFront de terraform/cloudfront.tf añade
+  "index.json" a esas URLs
+- En S3 se sube el JSON sin comprimir y CloudFront lo comprime con gzip o
+  brotli según el Accept-Encoding de cada cliente y guarda cada variante
+
+Dependencias: fastapi, duckdb
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+API_DIR = pathlib.Path(__file__).resolve().parent.parent / "api_rest"
+MANIFEST = "manifest.json"
+S3_PREFIX = "www/api"
+S3_MANIFEST_KEY = "static/manifest.json"
+
+
+def load_api(db_path: str):
+    """Importa la aplicación FastAPI apuntando a la base de datos indicada."""
+    os.environ["CALLEJERO_DB"] = str(pathlib.Path(db_path).resolve())
+    # La exportación es un proceso por lotes: las consultas esperan su turno en la
+    # cola de admisión (ver app/governor.py) en lugar de rechazarse con 503
+    os.environ.setdefault("CALLEJERO_DB_QUEUE_TIMEOUT_MS", "600000")
+    sys.path.insert(0, str(API_DIR))
+    from app import main
+
+    return main
+
+
+def render(content) -> bytes:
+    """Serializa igual que la respuesta JSON por defecto de FastAPI."""
+    from fastapi import Response
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    # Respuestas ya serializadas (jerarquía precalculada)
+    if isinstance(content, Response):
+        return content.body
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def iter_routes(api):
+    """Genera (ruta, función) para cada respuesta del catálogo."""
+    yield "autonomias/", api.get_autonomias
+    yield "provincias/", api.get_provincias
+
+    # El frontend usa los códigos con ceros a la izquierda, se exportan ambas formas
+    for ccom in api.dict_auto:
+        for path in {ccom, str(int(ccom))}:
+            yield f"provincias/{path}", lambda c=int(ccom): api.get_provincias_by_ccom(c)
+    for cpro in api.dict_provincia:
+        for path in {cpro, str(int(cpro))}:
+            yield f"poblaciones/{path}", lambda c=int(cpro): api.get_poblaciones_by_cpro(c)
+
+    con = api.database.get_connection()
+    for (cpos,) in con.execute("SELECT DISTINCT cpos FROM TRAM ORDER BY cpos").fetchall():
+        yield f"cp/{cpos:05d}", lambda c=f"{cpos:05d}": api.get_poblaciones_by_cp(c)
+
+    for cpro, cmun in con.execute(
+        "SELECT DISTINCT cpro, cmun FROM TRAM ORDER BY cpro, cmun"
+    ).fetchall():
+        yield f"{cpro}/{cmun}", lambda p=cpro, m=cmun: api.get_localidades_by_cpro_cnum(p, m)
+
+    for cpro, cmun, cun in con.execute(
+        "SELECT DISTINCT cpro, cmun, cun_var FROM TRAM ORDER BY cpro, cmun, cun_var"
+    ).fetchall():
+        yield f"cp/{cpro}/{cmun}/{cun}", lambda p=cpro, m=cmun, u=cun: api.get_by_cun(p, m, u)
+
+    for (cpos,) in con.execute("SELECT DISTINCT cpos FROM TRAM ORDER BY cpos").fetchall():
+        yield f"jerarquia/cp/{cpos:05d}", lambda c=cpos: api.get_jerarquia_by_cp(c)
+    for cpro, cmun in con.execute(
+        "SELECT DISTINCT cpro, cmun FROM TRAM ORDER BY cpro, cmun"
+    ).fetchall():
+        yield f"jerarquia/{cpro}/{cmun}", lambda p=cpro, m=cmun: api.get_jerarquia_by_municipio(p, m)
+
+
+def local_path(out_dir: pathlib.Path, route: str) -> pathlib.Path:
+    if route.endswith("/"):
+        route += "index"
+    return out_dir / f"{route}.json.gz"
+
+
+def s3_key(route: str) -> str:
+    if route.endswith("/"):
+        route += "index.json"
+    return f"{S3_PREFIX}/{route}"
+
+
+def export(db_path: str, out_dir: pathlib.Path, workers: int) -> dict:
+    """Genera los ficheros del catálogo y devuelve el manifiesto y las estadísticas."""
+    from fastapi import HTTPException
+
+    api = load_api(db_path)
+    manifest_path = out_dir / MANIFEST
+    previous = {}
+    if manifest_path.exists():
+        previous = json.loads(manifest_path.read_text())
+
+    def build(item):
+        route, func = item
+        try:
+            content = func()
+        except HTTPException:
+            return route, None
+        return route, render(content)
+
+    manifest: dict[str, dict] = {}
+    stats = {"written": 0, "unchanged": 0, "removed": 0, "bytes": 0, "raw_bytes": 0}
+    changed: list[str] = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for route, body in pool.map(build, iter_routes(api)):
+            if body is None:
+                continue
+            digest = hashlib.sha256(body).hexdigest()
+            path = local_path(out_dir, route)
+            if previous.get(route, {}).get("sha256") != digest or not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # mtime=0 para que el fichero comprimido sea reproducible
+                path.write_bytes(gzip.compress(body, compresslevel=9, mtime=0))
+                stats["written"] += 1
+                changed.append(route)
+            else:
+                stats["unchanged"] += 1
+            size = path.stat().st_size
+            manifest[route] = {"sha256": digest, "size": size, "raw_size": len(body)}
+            stats["bytes"] += size
+            stats["raw_bytes"] += len(body)
+
+    removed = sorted(set(previous) - set(manifest))
+    for route in removed:
+        local_path(out_dir, route).unlink(missing_ok=True)
+    stats["removed"] = len(removed)
+
+    manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    return {"manifest": manifest, "changed": changed, "removed": removed, "stats": stats}
+
+
+def download_manifest(bucket: str, out_dir: pathlib.Path):
+    """Recupera de S3 el manifiesto de la última exportación subida."""
+    try:
+        # Import inline, igual que en download_callejero, para que S3 sea opcional
+        import boto3
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        boto3.client("s3").download_file(bucket, S3_MANIFEST_KEY, str(out_dir / MANIFEST))
+        print("[OK] Manifiesto previo descargado de S3")
+    except Exception:
+        pass
+
+
+def upload(bucket: str, out_dir: pathlib.Path, result: dict):
+    """Sube a S3 solo los ficheros modificados y elimina los que ya no existen."""
+    try:
+        import boto3
+
+        s3_client = boto3.client("s3")
+        for route in result["changed"]:
+            # Sin Content-Encoding: CloudFront negocia la compresión con cada cliente
+            s3_client.put_object(
+                Body=gzip.decompress(local_path(out_dir, route).read_bytes()),
+                Bucket=bucket,
+                Key=s3_key(route),
+                ContentType="application/json",
+                CacheControl="public, max-age=86400",
+            )
+        for route in result["removed"]:
+            s3_client.delete_object(Bucket=bucket, Key=s3_key(route))
+        s3_client.upload_file(
+            Filename=str(out_dir / MANIFEST), Bucket=bucket, Key=S3_MANIFEST_KEY
+        )
+        print(
+            f"[OK] Catálogo subido a S3: {len(result['changed'])} ficheros, "
+            f"{len(result['removed'])} eliminados"
+        )
+    except Exception as exc:
+        # Se ignoran intencionadamente los errores para permitir trabajar sin AWS
+        print(f"[WARN] No se ha subido el catálogo a S3: {exc}")
+
+
+def main(
+    db_path: str = "callejero.duckdb",
+    out_dir: pathlib.Path = pathlib.Path("static"),
+    bucket: str | None = None,
+    workers: int = 8,
+):
+    start = time.perf_counter()
+    if bucket and not (out_dir / MANIFEST).exists():
+        download_manifest(bucket, out_dir)
+
+    result = export(db_path, out_dir, workers)
+    stats = result["stats"]
+    total = len(result["manifest"])
+    print(
+        f"[OK] Catálogo exportado en {time.perf_counter() - start:.2f} segundos: "
+        f"{total} ficheros ({stats['written']} escritos, {stats['unchanged']} sin cambios, "
+        f"{stats['removed']} eliminados)"
+    )
+    ratio = stats["raw_bytes"] / stats["bytes"] if stats["bytes"] else 0
+    print(
+        f"[INFO] Tamaño total {stats['bytes'] / 1024 / 1024:.2f} MB comprimido, "
+        f"{stats['raw_bytes'] / 1024 / 1024:.2f} MB sin comprimir (x{ratio:.1f})"
+    )
+
+    if bucket:
+        upload(bucket, out_dir, result)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el catálogo estático de la API")
+    parser.add_argument("--db", default="callejero.duckdb")
+    parser.add_argument("--out", default="static", type=pathlib.Path)
+    parser.add_argument("--bucket", default=os.environ.get("S3_BUCKET_NAME"))
+    parser.add_argument("--workers", default=8, type=int)
+    args = parser.parse_args()
+    main(args.db, args.out, args.bucket, args.workers)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Etapa final del build: genera un callejero.duckdb compacto y reproducible.
+
+- Para cada columna se prueban los algoritmos de compresión candidatos sobre los
+  datos ya ordenados y se fija el de menor tamaño con USING COMPRESSION
+- Las filas se escriben ordenadas por todas las columnas y con un solo hilo, por
+  lo que dos ejecuciones con los mismos datos producen un fichero idéntico byte a byte
+- El fichero se escribe de una vez y se hace CHECKPOINT, sin bloques libres
+- Genera un informe de tamaño por tabla y columna (callejero.size.json)
+
+Puede ejecutarse sobre un fichero existente para recompactarlo:
+    python scripts/finalize_callejero.py callejero.duckdb callejero.final.duckdb
+
+Dependencias: duckdb
+"""
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+
+import duckdb
+
+# Versión de almacenamiento mínima que permite comprimir con ZSTD
+STORAGE_VERSION = "v1.2.0"
+ROW_GROUP_SIZE = 122880
+
+# Las mediciones se hacen con bloques pequeños para que el tamaño del fichero
+# no se redondee a bloques de 256 KB
+MEASURE_BLOCK_SIZE = 16384
+
+# Algoritmos candidatos por tipo de columna ("auto" deja decidir a DuckDB)
+CANDIDATES = {
+    "VARCHAR": ["auto", "dictionary", "zstd"],
+    "INTEGER": ["auto", "rle", "bitpacking"],
+    "SMALLINT": ["auto", "rle", "bitpacking"],
+    "TINYINT": ["auto", "rle", "bitpacking"],
+    "BIGINT": ["auto", "rle", "bitpacking"],
+}
+
+
+def table_columns(con, catalog: str, table: str) -> list[tuple[str, str]]:
+    return con.execute(
+        """
+        SELECT column_name, data_type FROM duckdb_columns()
+        WHERE database_name = ? AND table_name = ? ORDER BY column_index
+    """,
+        [catalog, table],
+    ).fetchall()
+
+
+def measure(con, source: str, column: str, data_type: str, compression: str) -> int | None:
+    """Tamaño en bytes de la columna ordenada escrita con la compresión indicada."""
+    fd, path = tempfile.mkstemp(suffix=".duckdb")
+    os.close(fd)
+    os.remove(path)
+    using = "" if compression == "auto" else f" USING COMPRESSION {compression}"
+    try:
+        con.execute(
+            f"ATTACH '{path}' AS scratch "
+            f"(STORAGE_VERSION '{STORAGE_VERSION}', BLOCK_SIZE {MEASURE_BLOCK_SIZE})"
+        )
+        con.execute(f'CREATE TABLE scratch.t ("{column}" {data_type}{using})')
+        con.execute("CHECKPOINT scratch")
+        empty = os.path.getsize(path)
+        # `source` ya está ordenada por todas las columnas de la tabla
+        con.execute(f'INSERT INTO scratch.t SELECT "{column}" FROM {source}')
+        con.execute("CHECKPOINT scratch")
+        con.execute("DETACH scratch")
+        return os.path.getsize(path) - empty
+    except duckdb.Error:
+        # Algoritmo no aplicable al tipo o no soportado por esta versión
+        con.execute("DETACH DATABASE IF EXISTS scratch")
+        return None
+    finally:
+        for suffix in ("", ".wal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def choose_compression(con, catalog: str, table: str) -> list[dict]:
+    """Elige para cada columna el algoritmo con menor tamaño."""
+    source = f"(SELECT * FROM {catalog}.{table} ORDER BY ALL)"
+    columns = []
+    for column, data_type in table_columns(con, catalog, table):
+        sizes = {}
+        for compression in CANDIDATES.get(data_type, ["auto"]):
+            size = measure(con, source, column, data_type, compression)
+            if size is not None:
+                sizes[compression] = size
+        # Ante empate se prefiere "auto", el primero de la lista
+        best = min(sizes, key=sizes.get)
+        columns.append(
+            {"column": column, "type": data_type, "compression": best, "candidates": sizes}
+        )
+    return columns
+
+
+def storage_report(con, catalog: str, table: str) -> dict[str, dict]:
+    """Compresión efectiva y número de segmentos de cada columna en el fichero final."""
+    rows = con.execute(
+        f"""
+        SELECT column_name, list(DISTINCT compression ORDER BY compression), COUNT(*)
+        FROM pragma_storage_info('{catalog}.{table}')
+        WHERE segment_type <> 'VALIDITY'
+        GROUP BY column_name
+    """
+    ).fetchall()
+    return {column: {"compression": comp, "segments": n} for column, comp, n in rows}
+
+
+def finalize(
+    con: duckdb.DuckDBPyConnection,
+    out_path: str,
+    catalog: str = "memory",
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> dict:
+    """Escribe las tablas de `catalog` en `out_path` compactas y ordenadas."""
+    start = time.perf_counter()
+    for suffix in ("", ".wal"):
+        if os.path.exists(out_path + suffix):
+            os.remove(out_path + suffix)
+
+    # Un solo hilo y orden total de las filas: el fichero resultante es reproducible
+    con.execute("SET threads = 1")
+    con.execute("SET preserve_insertion_order = true")
+
+    tables = [
+        r[0]
+        for r in con.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = ? ORDER BY table_name",
+            [catalog],
+        ).fetchall()
+    ]
+    plan = {table: choose_compression(con, catalog, table) for table in tables}
+
+    con.execute(
+        f"ATTACH '{out_path}' AS final "
+        f"(STORAGE_VERSION '{STORAGE_VERSION}', ROW_GROUP_SIZE {row_group_size})"
+    )
+    for table, columns in plan.items():
+        definition = ", ".join(
+            f'"{c["column"]}" {c["type"]}'
+            + ("" if c["compression"] == "auto" else f' USING COMPRESSION {c["compression"]}')
+            for c in columns
+        )
+        con.execute(f"CREATE TABLE final.{table} ({definition})")
+        con.execute(f"INSERT INTO final.{table} SELECT * FROM {catalog}.{table} ORDER BY ALL")
+    con.execute("CHECKPOINT final")
+
+    report = {"tables": {}, "row_group_size": row_group_size}
+    for table, columns in plan.items():
+        rows = con.execute(f"SELECT COUNT(*) FROM final.{table}").fetchone()[0]
+        storage = storage_report(con, "final", table)
+        report["tables"][table] = {
+            "rows": rows,
+            "bytes": sum(c["candidates"][c["compression"]] for c in columns),
+            "columns": {
+                c["column"]: {
+                    "type": c["type"],
+                    "forced": c["compression"],
+                    "bytes": c["candidates"][c["compression"]],
+                    "candidates": c["candidates"],
+                    **storage.get(c["column"], {}),
+                }
+                for c in columns
+            },
+        }
+    free_blocks = con.execute(
+        "SELECT free_blocks FROM pragma_database_size() WHERE database_name = 'final'"
+    ).fetchone()[0]
+    con.execute("DETACH final")
+    con.execute("RESET threads")
+
+    with open(out_path, "rb") as f:
+        report["sha256"] = hashlib.sha256(f.read()).hexdigest()
+    report["file_bytes"] = os.path.getsize(out_path)
+    report["free_blocks"] = free_blocks
+    report["seconds"] = round(time.perf_counter() - start, 2)
+
+    report_path = pathlib.Path(out_path).with_suffix(".size.json")
+    report_path.write_text(json.dumps(report, indent=1))
+    print_report(report)
+    return report
+
+
+def print_report(report: dict):
+    print(
+        f"[OK] Fichero final {report['file_bytes'] / 1024 / 1024:.2f} MB "
+        f"({report['free_blocks']} bloques libres) en {report['seconds']} segundos"
+    )
+    print(f"[INFO] sha256 {report['sha256']}")
+    for table, info in report["tables"].items():
+        print(f"  {table}: {info['rows']} filas, {info['bytes'] / 1024 / 1024:.2f} MB")
+        for column, col in info["columns"].items():
+            print(
+                f"    {column:<12} {col['type']:<9} {col['bytes'] / 1024:>10.1f} KB  "
+                f"{','.join(col.get('compression', [])):<20} (forzado: {col['forced']})"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compacta un callejero.duckdb existente")
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    con.execute(f"ATTACH '{args.source}' AS source (READ_ONLY)")
+    finalize(con, args.target, catalog="source", row_group_size=args.row_group_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Generador de ficheros sintéticos del callejero del INE.
+
+Escribe ficheros TRAM, VIAS, UP, PSEU y SECC de ancho fijo en ISO-8859-1 con el
+diseño de registro completo de cada fichero (el que recortan los *_SPEC de
+parse_callejero.py), en un directorio `caj_esp_MMAAAA/` listo para el parseo.
+
+Las distribuciones imitan las del fichero real:
+- El tamaño de los municipios sigue una log-normal: la mayoría tienen pocas
+  calles y unas pocas capitales concentran buena parte de los tramos
+- Los municipios pequeños comparten código postal y los grandes tienen varios
+- Nombres de vía y de entidad con artículos, santos, personajes y topónimos,
+  incluyendo caracteres acentuados, Ñ, Ç y L·L
+- Cada vía tiene uno o varios tramos con su rango de números y código postal
+
+La escala se fija con el número de tramos (de 1.000 a 50 millones). Los ficheros
+se escriben en streaming, por lo que la memoria no depende de la escala.
+
+Ejemplo:
+    python scripts/generate_callejero.py --tramos 100000 --out input
+    python scripts/parse_callejero.py
+
+Dependencias: ninguna
+"""
+import argparse
+import math
+import pathlib
+import random
+import time
+
+# Periodo de los ficheros generados (caj_esp_MMAAAA y fechas de los nombres)
+PERIOD = "072025"
+FILE_DATES = "D250630.G250702"
+FVAR = "20250630"
+
+# Diseño de registro completo de cada fichero: (campo, inicio, fin)
+TRAM_LAYOUT = [
+    ("cpro", 0, 2), ("cmun", 2, 5), ("dist", 5, 7), ("secc", 7, 10),
+    ("lsecc", 10, 11), ("subsc", 11, 13), ("cun", 13, 20), ("cvia", 20, 25),
+    ("cpsvia", 25, 30), ("manz", 30, 42), ("cpos", 42, 47), ("tinum", 47, 48),
+    ("ein", 48, 52), ("cein", 52, 53), ("esn", 53, 57), ("cesn", 57, 58),
+    ("tipoinf", 58, 59), ("cdev", 59, 61), ("fvar", 61, 69), ("cvar", 69, 70),
+    ("dist_var", 70, 72), ("secc_var", 72, 75), ("lsecc_var", 75, 76),
+    ("subsc_var", 76, 78), ("cun_var", 78, 85), ("nentcoc", 85, 110),
+    ("nentsic", 110, 135), ("nnuclec", 135, 160), ("cvia_var", 160, 165),
+    ("nviac", 165, 190), ("cpsvia_var", 190, 195), ("dpsvia", 195, 245),
+    ("manz_var", 245, 257), ("cpos_var", 257, 262), ("tinum_var", 262, 263),
+    ("ein_var", 263, 267), ("cein_var", 267, 268), ("esn_var", 268, 272),
+    ("cesn_var", 272, 273),
+]
+VIAS_LAYOUT = [
+    ("cpro", 0, 2), ("cmun", 2, 5), ("cvia", 5, 10), ("aviac", 10, 35),
+    ("tipoinf", 35, 36), ("cdev", 36, 38), ("fvar", 38, 46), ("cvar", 46, 47),
+    ("cvia_var", 47, 52), ("tvia", 52, 57), ("nvia", 57, 107), ("nviac", 107, 132),
+    ("vector", 132, 152),
+]
+PSEU_LAYOUT = [
+    ("cpro", 0, 2), ("cmun", 2, 5), ("acpsvia", 5, 10), ("anpsvia", 10, 60),
+    ("tipoinf", 60, 61), ("cdev", 61, 63), ("fvar", 63, 71), ("cvar", 71, 72),
+    ("ncpsvia", 72, 77), ("nnpsvia", 77, 127), ("vector", 127, 147),
+]
+UP_LAYOUT = [
+    ("cpro", 0, 2), ("cmun", 2, 5), ("cun", 5, 12), ("tipoinf", 12, 13),
+    ("cdev", 13, 15), ("fvar", 15, 23), ("cvar", 23, 24), ("nmun", 24, 94),
+    ("nmun50", 94, 144), ("nmun_c", 144, 169), ("nentco", 169, 239),
+    ("nentco50", 239, 289), ("nentcoc", 289, 314), ("nentsi", 314, 384),
+    ("nentsi50", 384, 434), ("nentsic", 434, 459), ("nnucle", 459, 529),
+    ("nnucle50", 529, 579), ("nnuclec", 579, 604),
+]
+SECC_LAYOUT = [
+    ("cpro", 0, 2), ("cmun", 2, 5), ("dist", 5, 7), ("secc", 7, 10),
+    ("tipoinf", 10, 11), ("cdev", 11, 13), ("fvar", 13, 21), ("cvar", 21, 22),
+]
+
+# Peso aproximado de cada provincia en número de tramos (el resto pesa 1)
+PROVINCE_WEIGHTS = {
+    28: 9, 8: 8, 46: 5, 41: 4, 29: 3.5, 3: 3.5, 30: 3, 15: 3, 7: 2.5, 35: 2.5,
+    38: 2.5, 48: 2.5, 36: 2.5, 33: 2.5, 50: 2.5, 11: 2.5, 18: 2, 12: 2, 17: 2,
+    43: 2, 45: 2, 14: 2, 47: 1.5, 6: 1.5, 21: 1.5, 23: 1.5, 31: 1.5, 20: 1.5,
+}
+PROVINCES = list(range(1, 53))
+
+# Vocabulario de nombres (latin-1)
+TVIAS = ["CALLE", "CALLE", "CALLE", "CALLE", "PLAZA", "AVDA", "CMNO", "PASEO",
+         "TRVA", "CTRA", "RONDA", "GTA", "URB", "BARRI", "KALEA", "RUA", "CARRER"]
+ARTICLES = ["", "", "", "DE ", "DEL ", "DE LA ", "DE LOS ", "DE LAS ", "LA ", "EL "]
+SAINTS = ["SAN JUAN", "SANTA MARÍA", "SAN JOSÉ", "SAN PEDRO", "SANT JORDI",
+          "SANTIAGO", "SANTA ANA", "SAN ANTÓN", "SANT MARTÍ", "SANTA LUCÍA"]
+PEOPLE = ["CERVANTES", "GOYA", "ANTONIO MACHADO", "FEDERICO GARCÍA LORCA",
+          "ROSALÍA DE CASTRO", "RAMÓN Y CAJAL", "JUAN RAMÓN JIMÉNEZ", "PÍO BAROJA",
+          "MIGUEL DE UNAMUNO", "BLAS INFANTE", "JOAN MIRÓ", "PAU CASALS",
+          "CONCEPCIÓN ARENAL", "ISAAC PERAL", "GASPAR MELCHOR DE JOVELLANOS",
+          "EMILIA PARDO BAZÁN", "VELÁZQUEZ", "ÁLVARO DE BAZÁN", "NÚÑEZ DE BALBOA"]
+PLACES = ["MAYOR", "REAL", "IGLESIA", "ESPAÑA", "CONSTITUCIÓN", "ESTACIÓN",
+          "MOLINO", "FUENTE", "ERAS", "HUERTAS", "OLIVOS", "PINAR", "ALAMEDA",
+          "CASTILLO", "RÍO", "PUENTE", "CEMENTERIO", "ESCUELAS", "CAÑADA",
+          "VIÑA", "SOL", "LUNA", "PAZ", "LIBERTAD", "ANDALUCÍA", "CATALUÑA",
+          "ARAGÓN", "GALICIA", "CASTELLÓ", "PLAÇA VELLA", "COL·LEGI", "BARÇA",
+          "ITURRIA", "ZUBIETA", "GÜELL", "PEÑUELAS", "ÁLAMOS", "ALCALÁ"]
+NUMBERS = ["PRIMERO", "SEGUNDO", "TERCERO", "1", "2", "3", "A", "B"]
+ENTITY_PREFIX = ["", "", "", "SAN ", "SANTA ", "VILLA", "LA ", "EL ", "LOS ", "CASTRO", "TORRE"]
+ENTITY_ROOTS = ["NUEVA", "VIEJA", "ALTA", "BAJA", "RIBERA", "MONTAÑA", "VEGA",
+                "ROBLEDO", "ÁLAMO", "CAMPO", "OLMEDA", "FRESNO", "PRADO", "FONT",
+                "NOGAL", "HIGUERA", "ENCINA", "PEÑA", "ARROYO", "ZUBIA", "MONTSERRAT"]
+ENTITY_SUFFIX = ["", "", "", " DEL RÍO", " DE ARRIBA", " DE ABAJO", " DEL MONTE", "JOS", "EJO"]
+
+
+_formats: dict[tuple, str] = {}
+
+
+def record(layout, values: dict, numeric: set[str]) -> str:
+    """
+    Compone un registro de ancho fijo: numéricos con ceros a la izquierda, texto
+    truncado y alineado a la izquierda, y los campos sin valor con espacios.
+    """
+    key = (id(layout), tuple(values))
+    fmt = _formats.get(key)
+    if fmt is None:
+        # La cadena de formato se compila una vez por diseño y conjunto de campos
+        parts = []
+        for name, start, end in layout:
+            width = end - start
+            if name not in values:
+                parts.append(" " * width)
+            elif name in numeric:
+                parts.append(f"{{{name}:0{width}d}}")
+            else:
+                parts.append(f"{{{name}:<{width}.{width}}}")
+        fmt = _formats[key] = "".join(parts)
+    return fmt.format_map(values)
+
+
+TRAM_NUMERIC = {"cpro", "cmun", "dist", "secc", "cun", "cvia", "cpsvia", "cpos",
+                "tinum", "ein", "esn", "dist_var", "secc_var", "cun_var", "cvia_var",
+                "cpsvia_var", "cpos_var", "tinum_var", "ein_var", "esn_var"}
+VIAS_NUMERIC = {"cpro", "cmun", "cvia", "cvia_var"}
+PSEU_NUMERIC = {"cpro", "cmun", "acpsvia", "ncpsvia"}
+UP_NUMERIC = {"cpro", "cmun", "cun"}
+SECC_NUMERIC = {"cpro", "cmun", "dist", "secc"}
+
+
+class Generator:
+    """Genera los ficheros de forma determinista a partir de una semilla."""
+
+    def __init__(self, tramos: int, seed: int = 42):
+        self.tramos = tramos
+        self.rng = random.Random(seed)
+        # Generador aparte para las pseudovías de los tramos, de modo que el
+        # resto de los datos de una semilla no cambia
+        self.pseu_rng = random.Random(f"{seed}-pseu")
+        self.counts = {"TRAM": 0, "VIAS": 0, "UP": 0, "PSEU": 0, "SECC": 0}
+
+    # -- nombres ---------------------------------------------------------------
+
+    def street_name(self) -> str:
+        r = self.rng.random()
+        if r < 0.15:
+            name = self.rng.choice(SAINTS)
+        elif r < 0.45:
+            name = self.rng.choice(PEOPLE)
+        elif r < 0.9:
+            name = self.rng.choice(ARTICLES) + self.rng.choice(PLACES)
+        else:
+            name = f"{self.rng.choice(PLACES)} {self.rng.choice(PLACES)}"
+        if self.rng.random() < 0.08:
+            name += " " + self.rng.choice(NUMBERS)
+        return name
+
+    def entity_name(self) -> str:
+        return (
+            self.rng.choice(ENTITY_PREFIX)
+            + self.rng.choice(ENTITY_ROOTS)
+            + self.rng.choice(ENTITY_SUFFIX)
+        ).strip()
+
+    # -- escala ----------------------------------------------------------------
+
+    def plan(self) -> list[tuple[int, int, int]]:
+        """Reparte los tramos entre municipios: lista de (cpro, cmun, tramos)."""
+        n_municipios = max(5, min(8131, self.tramos // 180))
+        provinces = self.rng.choices(
+            PROVINCES,
+            weights=[PROVINCE_WEIGHTS.get(p, 1) for p in PROVINCES],
+            k=n_municipios,
+        )
+        weights = [self.rng.lognormvariate(0, 1.6) for _ in provinces]
+        total = sum(weights)
+        municipios = []
+        next_cmun: dict[int, int] = {}
+        for cpro, weight in sorted(zip(provinces, weights), key=lambda x: x[0]):
+            # Códigos de municipio correlativos con algún hueco, como en el fichero real
+            cmun = next_cmun.get(cpro, 0) + (1 if self.rng.random() < 0.8 else 2)
+            if cmun > 999:
+                continue
+            next_cmun[cpro] = cmun
+            municipios.append((cpro, cmun, max(1, round(self.tramos * weight / total))))
+        return municipios
+
+    # -- ficheros --------------------------------------------------------------
+
+    def municipio(self, files: dict, cpro: int, cmun: int, n_tramos: int, cps: list[int]):
+        rng = self.rng
+        nmun = self.entity_name()
+
+        # Unidades poblacionales: el núcleo principal y algunas entidades menores
+        units = []
+        for i in range(max(1, min(40, int(math.log2(n_tramos + 1)) - 2))):
+            cc, ss, nn = i // 10 + 1, i % 10 + 1, 1 if rng.random() < 0.9 else 99
+            cun = cc * 100000 + ss * 1000 + (cc + ss) % 10 * 100 + nn
+            name = nmun if i == 0 else self.entity_name()
+            units.append((cun, name))
+            files["UP"].append(
+                record(
+                    UP_LAYOUT,
+                    {
+                        "cpro": cpro, "cmun": cmun, "cun": cun, "tipoinf": "1",
+                        "cdev": "  ", "fvar": FVAR, "cvar": "A", "nmun": nmun,
+                        "nmun50": nmun, "nmun_c": nmun, "nentco": name,
+                        "nentco50": name, "nentcoc": name, "nentsi": name,
+                        "nentsi50": name, "nentsic": name,
+                        "nnucle": "*DISEMINADO*" if nn == 99 else name,
+                        "nnucle50": "*DISEMINADO*" if nn == 99 else name,
+                        "nnuclec": "*DISEMINADO*" if nn == 99 else name,
+                    },
+                    UP_NUMERIC,
+                )
+            )
+
+        # Secciones censales: aproximadamente una por cada 150 tramos
+        sections = [(d, s) for d in range(1, 4) for s in range(1, 1000)]
+        sections = sections[: max(1, n_tramos // 150)]
+        for dist, secc in sections:
+            files["SECC"].append(
+                record(
+                    SECC_LAYOUT,
+                    {"cpro": cpro, "cmun": cmun, "dist": dist, "secc": secc,
+                     "tipoinf": "1", "fvar": FVAR, "cvar": "A"},
+                    SECC_NUMERIC,
+                )
+            )
+
+        # Pseudovías: diseminados y urbanizaciones en algunos municipios
+        pseus = []
+        for acpsvia in range(1, rng.randint(0, 3) + 1):
+            name = f"{rng.choice(['DISEMINADO', 'URBANIZACIÓN', 'POLÍGONO'])} {self.entity_name()}"
+            pseus.append((acpsvia, name))
+            files["PSEU"].append(
+                record(
+                    PSEU_LAYOUT,
+                    {"cpro": cpro, "cmun": cmun, "acpsvia": acpsvia, "anpsvia": name,
+                     "tipoinf": "1", "fvar": FVAR, "cvar": "A", "ncpsvia": acpsvia,
+                     "nnpsvia": name},
+                    PSEU_NUMERIC,
+                )
+            )
+
+        # Vías y tramos: el número de tramos por vía sigue una geométrica
+        cvia = 0
+        written = 0
+        while written < n_tramos:
+            cvia += rng.randint(1, 5)
+            if cvia > 99999:
+                break
+            tvia = rng.choice(TVIAS)
+            nvia = self.street_name()
+            nviac = nvia[:25]
+            files["VIAS"].append(
+                record(
+                    VIAS_LAYOUT,
+                    {"cpro": cpro, "cmun": cmun, "cvia": cvia, "aviac": nviac,
+                     "tipoinf": "1", "fvar": FVAR, "cvar": "A", "cvia_var": cvia,
+                     "tvia": tvia, "nvia": nvia, "nviac": nviac},
+                    VIAS_NUMERIC,
+                )
+            )
+            n = min(n_tramos - written, 1 + int(rng.expovariate(1 / 2.5)))
+            cun, nentsic = rng.choice(units)
+            number = 1
+            cpos = rng.choice(cps)
+            # Algunas vías pertenecen a una pseudovía (urbanización, polígono...)
+            pseu = {}
+            if pseus and self.pseu_rng.random() < 0.2:
+                cpsvia, dpsvia = self.pseu_rng.choice(pseus)
+                pseu = {"cpsvia": cpsvia, "cpsvia_var": cpsvia, "dpsvia": dpsvia}
+            for _ in range(n):
+                # Los tramos consecutivos de una vía suelen compartir código postal
+                if rng.random() < 0.15:
+                    cpos = rng.choice(cps)
+                dist, secc = rng.choice(sections)
+                ein = number
+                esn = ein + 2 * rng.randint(1, 30)
+                number = esn + 2
+                values = {
+                    "cpro": cpro, "cmun": cmun, "dist": dist, "secc": secc,
+                    "cun": cun, "cvia": cvia, "cpos": cpos, "tinum": 1 + (ein + 1) % 2,
+                    "ein": min(ein, 9999), "esn": min(esn, 9999), "tipoinf": "1",
+                    "fvar": FVAR, "cvar": "A", "dist_var": dist, "secc_var": secc,
+                    "cun_var": cun, "nentcoc": nmun, "nentsic": nentsic,
+                    "nnuclec": nentsic, "cvia_var": cvia, "nviac": nviac,
+                    "cpos_var": cpos, "tinum_var": 1 + (ein + 1) % 2,
+                    "ein_var": min(ein, 9999), "esn_var": min(esn, 9999), **pseu,
+                }
+                files["TRAM"].append(record(TRAM_LAYOUT, values, TRAM_NUMERIC))
+            written += n
+
+    def write(self, out_dir: pathlib.Path) -> pathlib.Path:
+        target = out_dir / f"caj_esp_{PERIOD}"
+        target.mkdir(parents=True, exist_ok=True)
+        handles = {
+            name: open(
+                target / f"{name}.{FILE_DATES}", "w", encoding="latin-1", newline="\r\n"
+            )
+            for name in self.counts
+        }
+        # Buffer por fichero, se vuelca cada municipio para no acumular en memoria
+        files = {name: [] for name in self.counts}
+        try:
+            plan = self.plan()
+            cp_next: dict[int, int] = {}
+            shared: dict[int, int] = {}
+            for cpro, cmun, n_tramos in plan:
+                # Municipios pequeños comparten CP; los grandes tienen uno cada ~400 tramos
+                if n_tramos < 400 and cpro in shared and self.rng.random() < 0.6:
+                    cps = [shared[cpro]]
+                else:
+                    n_cps = max(1, n_tramos // 400)
+                    start = cp_next.get(cpro, self.rng.randint(0, 9))
+                    cps = [cpro * 1000 + (start + i * 10) % 1000 for i in range(n_cps)]
+                    cp_next[cpro] = (start + n_cps * 10 + self.rng.randint(1, 9)) % 1000
+                    shared[cpro] = cps[-1]
+                self.municipio(files, cpro, cmun, n_tramos, cps)
+                for name, lines in files.items():
+                    if lines:
+                        handles[name].write("\n".join(lines) + "\n")
+                        self.counts[name] += len(lines)
+                        lines.clear()
+        finally:
+            for handle in handles.values():
+                handle.close()
+        return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera ficheros sintéticos del callejero")
+    parser.add_argument("--tramos", type=int, default=100_000, help="Número aproximado de tramos")
+    parser.add_argument("--out", default="input", help="Directorio de salida")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generator = Generator(args.tramos, args.seed)
+    target = generator.write(pathlib.Path(args.out))
+    print(f"[OK] Ficheros generados en {target} en {time.perf_counter() - start:.2f} segundos")
+    for name, count in generator.counts.items():
+        print(f"  {name:<5} {count:>12,} registros")
+
+
+if __name__ == "__main__":
+    main()
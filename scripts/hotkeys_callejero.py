@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Rutas calientes de la API a partir de los logs de acceso.
+
+Cuenta las peticiones GET con respuesta 200 de cada ruta de la API y escribe las
+más pedidas en el fichero que lee la API al arrancar (CALLEJERO_PREWARM, ver
+api_rest/app/prewarm.py):
+
+    {"rutas": [{"ruta": "/cp/28001", "peticiones": 1234}, ...]}
+
+Admite, también comprimidos con gzip:
+- Logs de acceso de uvicorn o en formato combinado ("GET /api/cp/28001 HTTP/1.1" 200)
+- Logs estándar de CloudFront (columnas cs-method, cs-uri-stem, cs-uri-query, sc-status)
+
+Se descartan las rutas de servicio (/estado, /metrics, documentación) y /cambios,
+que depende del cliente y no merece una entrada en las cachés.
+
+Ejemplo:
+    python scripts/hotkeys_callejero.py logs/*.gz --top 500 --out hotkeys.json
+
+Dependencias: ninguna
+"""
+import argparse
+import gzip
+import json
+import pathlib
+import re
+from collections import Counter
+
+API_PREFIX = "/api"
+EXCLUDED = ("/estado", "/metrics", "/docs", "/redoc", "/openapi.json", "/cambios")
+
+ACCESS_LINE = re.compile(r'"GET (\S+) HTTP/[\d.]+" (\d{3})')
+
+
+def open_log(path: pathlib.Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return path.open(encoding="utf-8", errors="replace")
+
+
+def api_route(target: str) -> str | None:
+    """Ruta sin el prefijo /api, o None si no es de la API o está descartada."""
+    if not target.startswith(API_PREFIX + "/"):
+        return None
+    route = target[len(API_PREFIX):]
+    if route.split("?", 1)[0].rstrip("/").startswith(EXCLUDED) or route in ("/", ""):
+        return None
+    return route
+
+
+def iter_requests(lines):
+    """Genera la ruta (con query) de cada petición GET con respuesta 200."""
+    fields = None
+    for line in lines:
+        if line.startswith("#Fields:"):
+            # Cabecera de los logs de CloudFront
+            fields = line.split()[1:]
+            continue
+        if line.startswith("#"):
+            continue
+        if fields is not None:
+            row = dict(zip(fields, line.rstrip("\n").split("\t")))
+            if row.get("cs-method") != "GET" or row.get("sc-status") != "200":
+                continue
+            query = row.get("cs-uri-query", "-")
+            yield row.get("cs-uri-stem", "") + (f"?{query}" if query not in ("-", "") else "")
+            continue
+        match = ACCESS_LINE.search(line)
+        if match and match.group(2) == "200":
+            yield match.group(1)
+
+
+def count_routes(paths: list[pathlib.Path]) -> Counter:
+    counts: Counter = Counter()
+    for path in paths:
+        with open_log(path) as lines:
+            for target in iter_requests(lines):
+                route = api_route(target)
+                if route is not None:
+                    counts[route] += 1
+    return counts
+
+
+def main(paths: list[pathlib.Path], out: pathlib.Path, top: int):
+    counts = count_routes(paths)
+    hot = counts.most_common(top)
+    out.write_text(
+        json.dumps(
+            {"rutas": [{"ruta": route, "peticiones": n} for route, n in hot]},
+            ensure_ascii=False,
+            indent=1,
+        )
+    )
+    total = sum(counts.values())
+    covered = sum(n for _, n in hot)
+    share = covered / total * 100 if total else 0
+    print(
+        f"[OK] {len(hot)} rutas calientes de {len(counts)} distintas en {out}: "
+        f"{covered} de {total} peticiones ({share:.1f} %)"
+    )
+    return hot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rutas calientes de la API a partir de los logs")
+    parser.add_argument("logs", nargs="+", type=pathlib.Path)
+    parser.add_argument("--out", default="hotkeys.json", type=pathlib.Path)
+    parser.add_argument("--top", default=500, type=int)
+    args = parser.parse_args()
+    main(args.logs, args.out, args.top)
@@ -10,13 +10,17 @@ Parser de ficheros del callejero/catastro (caj_esp_072025) a DuckDB mediante Par
 Dependencias: pandas, pyarrow, duckdb, urllib3
 """
 import pathlib
-import os
+import sys
 from typing import Iterable, List, Dict, Tuple
 import time
 
 import pandas as pd
 import duckdb
 
+from diff_callejero import CHANGE_TABLES, compute_changes
+from finalize_callejero import finalize
+from pipeline import Pipeline
+
 FieldSpec = Tuple[str, int, int, str]
 
 DTYPE_MAP = {
@@ -36,15 +40,15 @@ DTYPE_MAP = {
 PSEU_SPEC: List[FieldSpec] = [
     ("cpro", 0, 2, "Int8"),  # Código provincia
     ("cmun", 2, 5, "Int16"),  # Código municipio
-    ("acpsvia", 5, 10, "Int32"),  # Código pseudovía
+    # ("acpsvia", 5, 10, "Int32"),  # Código pseudovía
     ("anpsvia", 10, 60, "string"),  # Nombre pseudovía
-    ("tipoinf", 60, 61, "string"),
-    ("cdev", 61, 63, "string"),
-    ("fvar", 63, 71, "Int32"),
-    ("cvar", 71, 72, "string"),
+    # ("tipoinf", 60, 61, "string"),
+    # ("cdev", 61, 63, "string"),
+    # ("fvar", 63, 71, "Int32"),
+    # ("cvar", 71, 72, "string"),
     ("ncpsvia", 72, 77, "Int32"),
     ("nnpsvia", 77, 127, "string"),
-    ("vector", 127, 147, "string"),
+    # ("vector", 127, 147, "string"),
 ]
 
 # VIAS: longitudes según diseño de vías (total 152)
@@ -90,8 +94,8 @@ TRAM_SPEC: List[FieldSpec] = [
     # ("fvar", 61, 69, "Int32"),
     # ("cvar", 69, 70, "string"),
     # # Datos Variación (final)
-    # ("dist_var", 70, 72, "Int8"),
-    # ("secc_var", 72, 75, "Int16"),
+    ("dist_var", 70, 72, "Int8"),
+    ("secc_var", 72, 75, "Int16"),
     # ("lsecc_var", 75, 76, "string"),
     # ("subsc_var", 76, 78, "string"),
     ("cun_var", 78, 85, "Int32"),
@@ -100,16 +104,39 @@ TRAM_SPEC: List[FieldSpec] = [
     # ("nnuclec", 135, 160, "string"),
     ("cvia_var", 160, 165, "Int32"),
     ("nviac", 165, 190, "string"),
-    # ("cpsvia_var", 190, 195, "Int32"),
+    ("cpsvia_var", 190, 195, "Int32"),
     # ("dpsvia", 195, 245, "string"),
     # ("manz_var", 245, 257, "string"),
     # ("cpos_var", 257, 262, "Int32"),
-    # ("tinum_var", 262, 263, "Int8"),
-    # ("ein_var", 263, 267, "Int16"),
-    # ("cein_var", 267, 268, "string"),
-    # ("esn_var", 268, 272, "Int16"),
-    # ("cesn_var", 272, 273, "string"),
+    ("tinum_var", 262, 263, "Int8"),
+    ("ein_var", 263, 267, "Int16"),
+    ("cein_var", 267, 268, "string"),
+    ("esn_var", 268, 272, "Int16"),
+    ("cesn_var", 272, 273, "string"),
+]
+
+# Numeración de cada tramo: sección censal, tipo (1 impares, 2 pares) y números
+# inicial y final con su calificador (p.ej. 12B). Se guarda en la tabla NUMEROS,
+# ordenada por vía, y TRAM se mantiene agrupada por vía y código postal
+NUMEROS_COLUMNS = [
+    "cpro", "cmun", "cvia_var", "tinum_var", "ein_var", "cein_var", "esn_var", "cesn_var",
+    "cpos", "cun_var", "nentsic", "dist_var", "secc_var",
 ]
+NUMBERING = {"dist_var", "secc_var", "tinum_var", "ein_var", "cein_var", "esn_var", "cesn_var"}
+
+# Nombres de pseudovía (anterior y nuevo) de las vías de cada tramo, enlazados
+# por cpsvia_var. La API los usa como nombres alternativos en la búsqueda de
+# calles; la tabla PSEU solo se usa para construir PSEUDOVIAS
+PSEUDOVIAS_SQL = """
+CREATE TABLE PSEUDOVIAS AS
+SELECT DISTINCT t.cpro, t.cmun, t.cvia_var, t.cpos, t.cun_var, n.npsvia
+FROM df t
+JOIN (
+    SELECT cpro, cmun, ncpsvia, trim(anpsvia) AS npsvia FROM PSEU
+    UNION SELECT cpro, cmun, ncpsvia, trim(nnpsvia) FROM PSEU
+) n ON t.cpro = n.cpro AND t.cmun = n.cmun AND t.cpsvia_var = n.ncpsvia
+WHERE n.npsvia IS NOT NULL AND n.npsvia <> '' AND t.cvia_var IS NOT NULL
+"""
 
 # UP: relación de unidades poblacionales (total 604 caracteres)
 UP_SPEC: List[FieldSpec] = [
@@ -134,6 +161,66 @@ UP_SPEC: List[FieldSpec] = [
     ("nnuclec", 579, 604, "string"),
 ]
 
+# Jerarquía completa de cada municipio y código postal (autonomía, provincia,
+# municipio, unidades poblacionales y número de vías) como JSON precalculado, que
+# la API devuelve tal cual en /jerarquia sin consultas adicionales
+HIERARCHY_SQL = """
+CREATE TABLE JERARQUIA AS
+WITH base AS (
+    SELECT DISTINCT cpos, cpro, cmun, cun_var, nentsic, cvia_var FROM TRAM
+    WHERE cpro IS NOT NULL AND cmun IS NOT NULL
+),
+nombres AS (SELECT cpro, cmun, min(trim(nmun)) AS nmun FROM UP GROUP BY ALL),
+municipios AS (
+    SELECT cpro, cmun, list(DISTINCT cpos ORDER BY cpos) FILTER (WHERE cpos IS NOT NULL) AS cps,
+        count(DISTINCT cvia_var) AS vias
+    FROM base GROUP BY ALL
+),
+municipio_unidades AS (
+    SELECT cpro, cmun, list({'cun': cun_var, 'nentsic': nentsic} ORDER BY cun_var, nentsic) AS unidades
+    FROM (SELECT DISTINCT cpro, cmun, cun_var, nentsic FROM base) GROUP BY ALL
+),
+cps AS (
+    SELECT cpos, cpro, cmun, count(DISTINCT cvia_var) AS vias
+    FROM base WHERE cpos IS NOT NULL GROUP BY ALL
+),
+cp_unidades AS (
+    SELECT cpos, cpro, cmun, list({'cun': cun_var, 'nentsic': nentsic} ORDER BY cun_var, nentsic) AS unidades
+    FROM (SELECT DISTINCT cpos, cpro, cmun, cun_var, nentsic FROM base WHERE cpos IS NOT NULL)
+    GROUP BY ALL
+)
+SELECT 'municipio' AS ambito, m.cpro::INTEGER * 1000 + m.cmun AS clave,
+    to_json({
+        'autonomia': {'CCOM': p.ccom, 'AUTO': p.auto},
+        'provincia': {'CODPRO': p.codpro, 'PRO': p.pro},
+        'cpro': m.cpro, 'cmun': m.cmun, 'nmun': n.nmun,
+        'cps': m.cps, 'unidades': u.unidades, 'vias': m.vias
+    })::VARCHAR AS payload
+FROM municipios m
+JOIN municipio_unidades u ON m.cpro = u.cpro AND m.cmun = u.cmun
+LEFT JOIN PROVINCIAS p ON m.cpro = p.cpro
+LEFT JOIN nombres n ON m.cpro = n.cpro AND m.cmun = n.cmun
+UNION ALL
+SELECT 'cp' AS ambito, c.cpos AS clave,
+    to_json({
+        'cpos': c.cpos,
+        'municipios': list({
+            'autonomia': {'CCOM': p.ccom, 'AUTO': p.auto},
+            'provincia': {'CODPRO': p.codpro, 'PRO': p.pro},
+            'cpro': c.cpro, 'cmun': c.cmun, 'nmun': n.nmun,
+            'unidades': u.unidades, 'vias': c.vias
+        } ORDER BY c.cpro, c.cmun)
+    })::VARCHAR AS payload
+FROM cps c
+JOIN cp_unidades u ON c.cpos = u.cpos AND c.cpro = u.cpro AND c.cmun = u.cmun
+LEFT JOIN PROVINCIAS p ON c.cpro = p.cpro
+LEFT JOIN nombres n ON c.cpro = n.cpro AND c.cmun = n.cmun
+GROUP BY c.cpos
+ORDER BY ambito, clave
+"""
+
+API_DIR = pathlib.Path(__file__).resolve().parent.parent / "api_rest"
+
 # ---------------------------------------------------------------------------
 # Utilidades
 # ---------------------------------------------------------------------------
@@ -221,6 +308,174 @@ def parse_up(path: pathlib.Path, limit: int | None) -> pd.DataFrame:
     return apply_spec(df, UP_SPEC)
 
 
+def write_hierarchy(con: duckdb.DuckDBPyConnection):
+    """Precalcula la jerarquía de cada municipio y código postal en la tabla JERARQUIA."""
+    # Los nombres de autonomías y provincias son los mismos que devuelve la API
+    sys.path.insert(0, str(API_DIR))
+    from app.catalogo import dict_auto, dict_provincia
+
+    con.execute(
+        "CREATE TEMP TABLE PROVINCIAS (cpro TINYINT, codpro VARCHAR, pro VARCHAR, ccom VARCHAR, auto VARCHAR)"
+    )
+    con.executemany(
+        "INSERT INTO PROVINCIAS VALUES (?, ?, ?, ?, ?)",
+        [
+            (int(code), code, info["PRO"], info["CCOM"], dict_auto[info["CCOM"]])
+            for code, info in dict_provincia.items()
+        ],
+    )
+    # Sin fichero UP los municipios no tienen nombre
+    con.execute("CREATE TABLE IF NOT EXISTS UP (cpro TINYINT, cmun SMALLINT, nmun VARCHAR)")
+    con.execute(HIERARCHY_SQL)
+    con.execute("DROP TABLE PROVINCIAS")
+    con.execute("DROP TABLE UP")
+    count = con.execute("SELECT COUNT(*) FROM JERARQUIA").fetchone()[0]
+    print(f"[OK] Jerarquía precalculada de {count} municipios y códigos postales")
+
+
+def write_tokens(con: duckdb.DuckDBPyConnection):
+    """
+    Precalcula el índice de palabras de la búsqueda de calles para DuckDB.
+
+    Por cada ámbito (código postal y unidad poblacional) escribe las vías con sus
+    palabras (VIAS_CP y VIAS_UNIDAD, numeradas en `fila` en el orden de la API) y
+    una entrada (ámbito, clave, palabra, fila) por palabra en VIAS_TOKENS. La API
+    busca cada prefijo como un rango de palabras de la clave en lugar de recorrer
+    todas las vías del ámbito. Las filas y palabras son las mismas que las del
+    índice de arrays (lookup.TOKEN_INDEXES).
+    """
+    # Misma normalización que la API
+    sys.path.insert(0, str(API_DIR))
+    from app import tokens
+    from app.lookup import TOKEN_INDEXES
+
+    con.execute(
+        "CREATE OR REPLACE TABLE VIAS_TOKENS (ambito VARCHAR, clave BIGINT, palabra VARCHAR, fila INTEGER)"
+    )
+    words = {}
+    for name, (_, sql) in TOKEN_INDEXES.items():
+        ambito = name.removeprefix("vias_")
+        table = name.upper()
+        result = con.execute(sql)
+        cols = [desc[0] for desc in result.description]
+        tvia, nviac = cols.index("tvia"), cols.index("nviac")
+        vias, postings = [], []
+        for fila, row in enumerate(result.fetchall()):
+            texts = (row[tvia], row[nviac], *sorted(filter(None, row[-1] or [])))
+            if texts not in words:
+                words[texts] = tokens.tokens(*texts)
+            vias.append((row[0], fila, *row[1:-1], " ".join(sorted(words[texts]))))
+            postings += [(ambito, row[0], word, fila) for word in words[texts]]
+        con.execute(
+            f"""
+            CREATE OR REPLACE TABLE {table} AS
+            SELECT clave, 0::INTEGER AS fila, * EXCLUDE (clave, pseudovias), ''::VARCHAR AS palabras
+            FROM ({sql}) LIMIT 0
+        """
+        )
+        df = pd.DataFrame(vias, dtype=object)
+        con.execute(f"INSERT INTO {table} SELECT * FROM df")
+        df = pd.DataFrame(postings, dtype=object)
+        con.execute("INSERT INTO VIAS_TOKENS SELECT * FROM df")
+        print(f"[OK] Índice de palabras {table}: {len(vias)} vías, {len(postings)} entradas")
+
+
+def write_shards(con: duckdb.DuckDBPyConnection, out_dir: pathlib.Path):
+    """
+    Genera un fichero DuckDB por provincia con sus tramos y vías.
+
+    La API enruta cada consulta por cpro o por el prefijo del código postal, por lo
+    que cada fichero incluye los tramos de la provincia y los de sus códigos postales.
+    """
+    if out_dir.exists():
+        for path in out_dir.glob("*.duckdb"):
+            path.unlink()
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    cpros = con.execute(
+        """
+        SELECT cpro FROM TRAM WHERE cpro IS NOT NULL
+        UNION SELECT cpos // 1000 FROM TRAM WHERE cpos IS NOT NULL
+        ORDER BY 1
+    """
+    ).fetchall()
+    # Versión y cambios entre versiones, filtrados por provincia
+    tables = {
+        r[0]
+        for r in con.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = 'memory'"
+        ).fetchall()
+    }
+    for (cpro,) in cpros:
+        con.execute(f"ATTACH '{out_dir / f'{cpro:02d}.duckdb'}' AS shard")
+        con.execute(
+            f"""
+            CREATE TABLE shard.TRAM AS
+            SELECT * FROM TRAM WHERE cpro = {cpro} OR cpos // 1000 = {cpro}
+            ORDER BY cpos, cpro, cmun
+        """
+        )
+        con.execute(
+            f"""
+            CREATE TABLE shard.NUMEROS AS SELECT * FROM NUMEROS WHERE cpro = {cpro}
+        """
+        )
+        con.execute(
+            f"""
+            CREATE TABLE shard.PSEUDOVIAS AS
+            SELECT * FROM PSEUDOVIAS WHERE cpro = {cpro} OR cpos // 1000 = {cpro}
+        """
+        )
+        con.execute(
+            f"""
+            CREATE TABLE shard.JERARQUIA AS SELECT * FROM JERARQUIA WHERE clave // 1000 = {cpro}
+        """
+        )
+        con.execute(
+            f"""
+            CREATE TABLE shard.VIAS_CP AS SELECT * FROM VIAS_CP WHERE clave // 1000 = {cpro}
+        """
+        )
+        con.execute(
+            f"""
+            CREATE TABLE shard.VIAS_UNIDAD AS SELECT * FROM VIAS_UNIDAD WHERE cpro = {cpro}
+        """
+        )
+        con.execute(
+            f"""
+            CREATE TABLE shard.VIAS_TOKENS AS
+            SELECT * FROM VIAS_TOKENS
+            WHERE (ambito = 'cp' AND clave // 1000 = {cpro})
+                OR (ambito = 'unidad' AND clave // 10000000000 = {cpro})
+            ORDER BY ALL
+        """
+        )
+        con.execute(
+            """
+            CREATE TABLE shard.VIAS AS
+            SELECT * FROM VIAS WHERE cpro IN (SELECT DISTINCT cpro FROM shard.TRAM)
+        """
+        )
+        for table in tables:
+            if table in ("VERSION", "CAMBIOS_VERSIONES"):
+                con.execute(f"CREATE TABLE shard.{table} AS SELECT * FROM {table}")
+            elif table in CHANGE_TABLES:
+                con.execute(
+                    f"CREATE TABLE shard.{table} AS SELECT * FROM {table} WHERE cpro = {cpro}"
+                )
+        con.execute("DETACH shard")
+    print(f"[OK] {len(cpros)} ficheros por provincia generados en {out_dir}")
+
+
+def dataset_version(input_dir: pathlib.Path) -> str | None:
+    """Versión del callejero (AAAAMM) a partir del directorio caj_esp_MMAAAA."""
+    dirs = sorted(input_dir.glob("caj_esp_??????"))
+    if not dirs:
+        return None
+    period = dirs[0].name[-6:]
+    return f"{period[2:]}{period[:2]}"
+
+
 PARSERS = {
     "SECC": parse_secc,
     "PSEU": parse_pseu,
@@ -230,35 +485,145 @@ PARSERS = {
 }
 
 
-def main():
-    input_dir = pathlib.Path("input")
-
+# Ficheros que se cargan en la base de datos final. TRAM va primero: es el más
+# grande y sus etapas son las que marcan la duración total
+LOADED_TABLES = ["TRAM", "VIAS", "PSEU", "UP"]
+
+# Columnas que se cargan de los ficheros de los que solo se usa una parte. De UP
+# solo se necesita el nombre de cada municipio (ver HIERARCHY_SQL)
+LOADED_COLUMNS = {"UP": ["cpro", "cmun", "nmun"]}
+
+
+def find_input(input_dir: pathlib.Path, stem: str) -> pathlib.Path | None:
+    files = sorted(input_dir.glob(f"caj_esp_??????/{stem}*.*"))
+    return files[0] if files else None
+
+
+def parse_table(input_dir: pathlib.Path, stem: str) -> pd.DataFrame | None:
+    path = find_input(input_dir, stem)
+    if path is None:
+        print(f"[WARN] No se encontró fichero para {stem} en {input_dir}")
+        return None
+    print(f"[INFO] Procesando {path.name} -> DataFrame")
+    return PARSERS[stem](path, None)
+
+
+def load_table(con: duckdb.DuckDBPyConnection, stem: str, df: pd.DataFrame | None):
+    if df is None:
+        return
+    if stem == "TRAM":
+        con.execute(
+            f"""
+            CREATE TABLE NUMEROS AS
+            SELECT DISTINCT {', '.join(NUMEROS_COLUMNS)} FROM df
+            WHERE tinum_var IN (1, 2) AND ein_var IS NOT NULL AND esn_var IS NOT NULL
+        """
+        )
+        # Sin fichero PSEU la tabla PSEUDOVIAS se crea vacía
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS PSEU (
+                cpro TINYINT, cmun SMALLINT, anpsvia VARCHAR, ncpsvia INTEGER, nnpsvia VARCHAR
+            )
+        """
+        )
+        con.execute(PSEUDOVIAS_SQL)
+        con.execute("DROP TABLE PSEU")
+        df = df.drop(columns=list(NUMBERING) + ["cpsvia_var"])
+    if stem in LOADED_COLUMNS:
+        df = df[LOADED_COLUMNS[stem]]
+    df = df.drop_duplicates()
+    print(f"[OK] {stem} ({len(df)} filas)")
+    # Carga en DuckDB
+    con.execute(f"CREATE TABLE {stem} AS SELECT * FROM df")
+
+
+def write_version(con: duckdb.DuckDBPyConnection, input_dir: pathlib.Path):
+    # La API muestra la versión servida y la usa para ordenar las versiones
+    version = dataset_version(input_dir)
+    if version is not None:
+        con.execute("CREATE TABLE VERSION AS SELECT ? AS version", [version])
+        print(f"[INFO] Versión del callejero: {version}")
+
+
+def add_stages(
+    pipe: Pipeline,
+    input_dir: pathlib.Path,
+    shards_dir: pathlib.Path | None,
+    previous: pathlib.Path,
+    inputs_after: Dict[str, str] | None = None,
+    previous_after: Iterable[str] = (),
+) -> str:
+    """
+    Añade a `pipe` las etapas de parseo, carga y escritura de la base de datos y
+    devuelve el nombre de la última. `inputs_after` indica la etapa que deja cada
+    fichero en `input_dir` (su descompresión) y `previous_after` las que descargan
+    la versión anterior.
+    """
+    inputs_after = inputs_after or {}
     con = duckdb.connect()
-    # Elimina el fichero de base de datos previo
-    if os.path.exists("callejero.duckdb"):
-        os.remove("callejero.duckdb")
-    con.execute("ATTACH 'callejero.duckdb'")
+
+    def run(func, *args):
+        # Cada etapa usa su propio cursor sobre la misma base de datos en memoria
+        def stage():
+            cur = con.cursor()
+            try:
+                return func(cur, *args)
+            finally:
+                cur.close()
+
+        return stage
+
+    for stem in PARSERS:
+        if stem not in LOADED_TABLES:
+            print(f"[INFO] Saltando {stem} (no se carga en BBDD final)")
+    for stem in LOADED_TABLES:
+        after = [inputs_after[stem]] if stem in inputs_after else []
+        pipe.add(f"parsear:{stem}", lambda s=stem: parse_table(input_dir, s), after=after)
+    for stem in ["PSEU", "TRAM", "VIAS", "UP"]:
+        # TRAM construye PSEUDOVIAS a partir de PSEU y la elimina
+        after = [f"parsear:{stem}"] + (["cargar:PSEU"] if stem == "TRAM" else [])
+        pipe.add(
+            f"cargar:{stem}",
+            run(lambda cur, s=stem: load_table(cur, s, pipe.results.pop(f"parsear:{s}"))),
+            after=after,
+        )
+    loads = [f"cargar:{stem}" for stem in LOADED_TABLES]
+
+    pipe.add("jerarquia", run(write_hierarchy), after=["cargar:TRAM", "cargar:UP"])
+    pipe.add("palabras", run(write_tokens), after=["cargar:TRAM", "cargar:VIAS"])
+    pipe.add("version", run(write_version, input_dir), after=loads)
+
+    def changes(cur):
+        # Cambios respecto a la versión publicada anteriormente, si está disponible
+        if previous.exists():
+            compute_changes(cur, str(previous))
+
+    last = pipe.add("cambios", run(changes), after=["version", *previous_after])
+    if shards_dir is not None:
+        last = pipe.add(
+            "provincias", run(write_shards, shards_dir), after=["cambios", "jerarquia", "palabras"]
+        )
+    # Escribe el fichero final compacto y reproducible (ver finalize_callejero.py)
+    return pipe.add(
+        "finalizar",
+        run(finalize, "callejero.duckdb"),
+        after=[last, "jerarquia", "palabras"],
+    )
+
+
+def main(
+    shards_dir: pathlib.Path | None = pathlib.Path("shards"),
+    previous: pathlib.Path = pathlib.Path("previous.duckdb"),
+    workers: int | None = None,
+):
+    input_dir = pathlib.Path("input")
     start = time.perf_counter()
 
-    for stem, func in PARSERS.items():
-        files = sorted(input_dir.glob(f"caj_esp_??????/{stem}*.*"))
-        if not files:
-            print(f"[WARN] No se encontró fichero para {stem} en {input_dir}")
-            continue
-        path = files[0]
-        table = path.stem.split(".", 1)[0]
-        if table not in ["VIAS", "TRAM"]:
-            print(f"[INFO] Saltando {path.name} (no se carga en BBDD final)")
-            continue
-        print(f"[INFO] Procesando {path.name} -> Parquet")
-        df = func(path, None)
-        df = df.drop_duplicates()
-        print(f"[OK] {stem} ({len(df)} filas)")
-        # Carga en DuckDB
-        con.execute(f"CREATE TABLE {stem} AS SELECT * FROM df")
-
-    con.execute("COPY FROM DATABASE memory TO callejero")
-    con.execute("DETACH callejero")
+    pipe = Pipeline(workers)
+    add_stages(pipe, input_dir, shards_dir, previous)
+    pipe.run()
+
     end = time.perf_counter()
     print(
         f"[INFO] Base de datos 'callejero.duckdb' creada en {end - start:.2f} segundos"
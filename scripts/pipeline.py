@@ -0,0 +1,149 @@
+"""
+Planificador de las etapas del proceso de actualización del callejero.
+
+Cada etapa (descarga, descompresión de un fichero, parseo, carga en DuckDB,
+ficheros finales, subida a S3) declara las etapas de las que depende y se
+ejecuta en cuanto terminan todas ellas, con un máximo de `workers` etapas a la
+vez: mientras se descomprime TRAM se puede parsear VIAS. Las etapas se ejecutan
+en hilos; la red, zlib y DuckDB liberan el GIL, el parseo con pandas no, por lo
+que dos parseos simultáneos se reparten la CPU.
+
+Al terminar se imprime la línea de tiempo de cada etapa y la ruta crítica, la
+cadena de etapas que ha determinado la duración total.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+
+def default_workers() -> int:
+    """Etapas simultáneas: PIPELINE_WORKERS o el número de CPUs."""
+    return int(os.environ.get("PIPELINE_WORKERS") or os.cpu_count() or 1)
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[], object]
+    after: tuple[str, ...]
+    # Instantes (perf_counter) en que se cumplen sus dependencias, empieza y termina
+    ready: float | None = None
+    start: float | None = None
+    end: float | None = None
+
+
+class Pipeline:
+    """Grafo de etapas que se ejecuta con un presupuesto de hilos."""
+
+    def __init__(self, workers: int | None = None):
+        self.workers = max(1, workers or default_workers())
+        self.stages: dict[str, Stage] = {}
+        self.results: dict[str, object] = {}
+        self.origin: float | None = None
+
+    def add(self, name: str, func: Callable[[], object], after: Iterable[str] = ()) -> str:
+        """
+        Añade una etapa que se ejecuta después de `after`. Las dependencias deben
+        existir ya, de modo que el grafo no puede tener ciclos. El resultado de la
+        etapa queda en `results[name]` para las siguientes.
+        """
+        if name in self.stages:
+            raise ValueError(f"Etapa duplicada: {name}")
+        after = tuple(after)
+        missing = [dep for dep in after if dep not in self.stages]
+        if missing:
+            raise ValueError(f"La etapa {name} depende de etapas inexistentes: {missing}")
+        self.stages[name] = Stage(name, func, after)
+        return name
+
+    def _execute(self, stage: Stage):
+        stage.start = time.perf_counter()
+        try:
+            return stage.func()
+        finally:
+            stage.end = time.perf_counter()
+
+    def run(self) -> dict[str, object]:
+        """Ejecuta todas las etapas. Si una falla no se lanzan más y se propaga su error."""
+        self.origin = time.perf_counter()
+        pending = {name: set(stage.after) for name, stage in self.stages.items()}
+        dependents: dict[str, list[str]] = {name: [] for name in self.stages}
+        for name, stage in self.stages.items():
+            for dep in stage.after:
+                dependents[dep].append(name)
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="etapa") as pool:
+
+            def submit_ready():
+                # En el orden en que se añadieron: las primeras tienen prioridad
+                for name in [name for name, deps in pending.items() if not deps]:
+                    del pending[name]
+                    stage = self.stages[name]
+                    if stage.ready is None:
+                        stage.ready = time.perf_counter()
+                    running[pool.submit(self._execute, stage)] = name
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        print(f"[ERROR] Etapa {name}: {future.exception()}")
+                        error = error or future.exception()
+                        continue
+                    self.results[name] = future.result()
+                    for dependent in dependents[name]:
+                        pending[dependent].discard(name)
+                        if not pending[dependent]:
+                            self.stages[dependent].ready = self.stages[name].end
+                if error is None:
+                    submit_ready()
+
+        self.print_timeline()
+        if error is not None:
+            raise error
+        return self.results
+
+    def critical_path(self) -> list[Stage]:
+        """
+        Cadena de etapas que termina en la última en acabar, siguiendo en cada una
+        la dependencia que terminó más tarde (la que retrasó su inicio).
+        """
+        finished = [stage for stage in self.stages.values() if stage.end is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda s: s.end)
+        path = [stage]
+        while stage.after:
+            stage = max((self.stages[dep] for dep in stage.after), key=lambda s: s.end)
+            path.append(stage)
+        return path[::-1]
+
+    def print_timeline(self):
+        finished = sorted(
+            (stage for stage in self.stages.values() if stage.end is not None),
+            key=lambda s: s.start,
+        )
+        if not finished:
+            return
+        width = max(len(stage.name) for stage in finished)
+        print(f"[INFO] Línea de tiempo con {self.workers} etapas simultáneas (segundos):")
+        for stage in finished:
+            print(
+                f"  {stage.name:<{width}}  {stage.start - self.origin:8.2f} → "
+                f"{stage.end - self.origin:8.2f}  ({stage.end - stage.start:.2f} s, "
+                f"espera {stage.start - stage.ready:.2f} s)"
+            )
+        path = self.critical_path()
+        total = path[-1].end - self.origin
+        busy = sum(stage.end - stage.start for stage in path)
+        print(
+            f"[INFO] Ruta crítica ({busy:.2f} s de {total:.2f} s): "
+            + " → ".join(f"{stage.name} ({stage.end - stage.start:.2f} s)" for stage in path)
+        )
@@ -26,6 +26,7 @@ resource "aws_iam_policy" "CodeBuildBasePolicy" {
           ],
           "Action" : [
             "s3:PutObject",
+            "s3:DeleteObject",
             "s3:GetObject",
             "s3:GetObjectVersion",
             "s3:GetBucketAcl",
@@ -14,6 +14,85 @@ resource "aws_cloudfront_origin_access_control" "oac_lambda" {
   signing_protocol                  = "sigv4"
 }
 
+# Las rutas del catálogo estático que terminan en "/" se guardan en S3 como
+# index.json (ver scripts/export_callejero.py). Siempre se exportan, así que no
+# importa que la Lambda de respaldo reciba también la ruta con index.json
+resource "aws_cloudfront_function" "api_index" {
+  name    = "callejero-api-index-${var.env}"
+  runtime = "cloudfront-js-2.0"
+  comment = "Añade index.json a las rutas del catálogo terminadas en /"
+  publish = true
+  code    = <<-EOT
+    function handler(event) {
+      var request = event.request;
+      if (request.uri.endsWith("/")) {
+        request.uri += "index.json";
+      }
+      return request;
+    }
+  EOT
+}
+
+# /api/metrics no se publica: son los contadores de una sola instancia de la
+# Lambda y no deben quedar en la caché de CloudFront. Se responde 403 en el borde
+# sin llegar al origen
+resource "aws_cloudfront_function" "api_metrics_block" {
+  name    = "callejero-api-metrics-block-${var.env}"
+  runtime = "cloudfront-js-2.0"
+  comment = "Bloquea /api/metrics en CloudFront"
+  publish = true
+  code    = <<-EOT
+    function handler(event) {
+      return { statusCode: 403, statusDescription: "Forbidden" };
+    }
+  EOT
+}
+
+# /api/cambios depende de la query string (desde, cpro), que CachingOptimized no
+# incluye en la clave de caché
+resource "aws_cloudfront_cache_policy" "api_cambios" {
+  name        = "callejero-api-cambios-${var.env}"
+  comment     = "Cambios del callejero por versión de partida y provincia"
+  default_ttl = 3600
+  max_ttl     = 86400
+  min_ttl     = 0
+
+  parameters_in_cache_key_and_forwarded_to_origin {
+    enable_accept_encoding_brotli = true
+    enable_accept_encoding_gzip   = true
+
+    cookies_config {
+      cookie_behavior = "none"
+    }
+    headers_config {
+      header_behavior = "none"
+    }
+    query_strings_config {
+      query_string_behavior = "whitelist"
+      query_strings {
+        items = ["desde", "cpro"]
+      }
+    }
+  }
+}
+
+locals {
+  # Rutas de /api en orden de prioridad: las del catálogo estático van a S3 (con la
+  # Lambda de respaldo si el objeto no existe) y el resto directamente a la Lambda
+  api_behaviors = [
+    { path = "/api/autonomias/*", static = true },
+    { path = "/api/provincias/*", static = true },
+    { path = "/api/poblaciones/*", static = true },
+    { path = "/api/jerarquia/*", static = true },
+    { path = "/api/cp/?????", static = true },
+    { path = "/api/cp/*/*/*", static = true },
+    # Búsquedas parciales de CP
+    { path = "/api/cp/*", static = false },
+    # /{cpro}/{cmun}
+    { path = "/api/?/*", static = true },
+    { path = "/api/??/*", static = true },
+  ]
+}
 
 resource "aws_cloudfront_distribution" "api" {
   # aliases = [var.env == "pro" ?   :  ]
@@ -41,6 +120,23 @@ resource "aws_cloudfront_distribution" "api" {
     }
   }
 
+  # El catálogo estático (scripts/export_callejero.py) se sirve desde S3 y, si el
+  # objeto no existe, se recurre a la Lambda
+  origin_group {
+    origin_id = "api-catalogo-estatico"
+
+    failover_criteria {
+      status_codes = [403, 404]
+    }
+
+    member {
+      origin_id = aws_s3_bucket.frontend_bucket.bucket_regional_domain_name
+    }
+
+    member {
+      origin_id = aws_lambda_function.api_rest.function_name
+    }
+  }
 
   enabled         = true
   is_ipv6_enabled = true
@@ -85,6 +181,70 @@ resource "aws_cloudfront_distribution" "api" {
 
   }
 
+  dynamic "ordered_cache_behavior" {
+    for_each = local.api_behaviors
+    content {
+      allowed_methods = [
+        "GET",
+        "HEAD",
+        "OPTIONS"
+      ]
+      cache_policy_id          = "658327ea-f89d-4fab-a63d-7e88639e58f6"
+      cached_methods           = ["GET", "HEAD"]
+      compress                 = true
+      origin_request_policy_id = "b689b0a8-53d0-40ab-baf2-68738e2966ac"
+      path_pattern             = ordered_cache_behavior.value.path
+      smooth_streaming         = false
+      target_origin_id         = ordered_cache_behavior.value.static ? "api-catalogo-estatico" : aws_lambda_function.api_rest.function_name
+      viewer_protocol_policy   = "redirect-to-https"
+
+      dynamic "function_association" {
+        for_each = ordered_cache_behavior.value.static ? [1] : []
+        content {
+          event_type   = "viewer-request"
+          function_arn = aws_cloudfront_function.api_index.arn
+        }
+      }
+    }
+  }
+
+  ordered_cache_behavior {
+    allowed_methods = [
+      "GET",
+      "HEAD",
+      "OPTIONS"
+    ]
+    cache_policy_id          = aws_cloudfront_cache_policy.api_cambios.id
+    cached_methods           = ["GET", "HEAD"]
+    compress                 = true
+    origin_request_policy_id = "b689b0a8-53d0-40ab-baf2-68738e2966ac"
+    path_pattern             = "/api/cambios*"
+    smooth_streaming         = false
+    target_origin_id         = aws_lambda_function.api_rest.function_name
+    viewer_protocol_policy   = "redirect-to-https"
+  }
+
+  ordered_cache_behavior {
+    allowed_methods = [
+      "GET",
+      "HEAD",
+      "OPTIONS"
+    ]
+    cache_policy_id        = "4135ea2d-6df8-44a3-9df3-4b5a84be39ad" # Caching disabled
+    cached_methods         = ["GET", "HEAD"]
+    compress               = false
+    path_pattern           = "/api/metrics*"
+    smooth_streaming       = false
+    target_origin_id       = aws_lambda_function.api_rest.function_name
+    viewer_protocol_policy = "redirect-to-https"
+
+    function_association {
+      event_type   = "viewer-request"
+      function_arn = aws_cloudfront_function.api_metrics_block.arn
+    }
+  }
+
+  # Búsquedas de calles, /numero, /estado
   ordered_cache_behavior {
     allowed_methods = [
       "GET",
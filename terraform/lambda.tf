@@ -31,7 +31,11 @@ resource "aws_lambda_function" "api_rest" {
 
   environment {
     variables = {
-      "AWS_LWA_ASYNC_INIT" = "true"
+      # El adaptador espera a que /estado responda 200 antes de enviar peticiones
+      "AWS_LWA_ASYNC_INIT"           = "true"
+      "AWS_LWA_READINESS_CHECK_PATH" = "/api/estado"
+      "CALLEJERO_WARMUP"             = "true"
+      "CALLEJERO_BACKEND"            = "arrays"
     }
   }
 